@@ -1,8 +1,14 @@
 import os
 import io
+import csv
 import time
 import json
-from datetime import datetime
+import asyncio
+import zipfile
+import threading
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import List
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
@@ -10,19 +16,91 @@ load_dotenv()
 
 import cv2
 import numpy as np
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, UploadFile, File, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
 from fastapi.responses import (
     StreamingResponse,
     Response,
+    JSONResponse,
 )
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.background import BackgroundTask
 from PIL import Image
 import pymongo
 from bson import ObjectId
 
-import tensorflow as tf
+import hal
+import metrics
+from log_config import get_logger
+from inference import InferenceEngine, classify_label
+from broadcaster import TooManySubscribers
+from camera_manager import CameraManager
+from frame_gate import make_gate
+from detector import DetectionTracker
+from tiling import TILED_INFERENCE, TiledPredictor, draw_heatmap
+from sensor_bus import SensorBusReader
+from sensor_history import parse_bucket, choose_bucket, query_history
+from events import EventHub
+from snapshot_writer import SnapshotWriter, LocalBlobStore, GridFSBlobStore, thumbnail_from_jpeg
+from retention import (
+    RetentionEngine,
+    SNAP_RETENTION_ENABLED,
+    SNAP_COLD_STORE,
+    embedded_image,
+    ensure_retention_indexes,
+)
+from image_cache import ByteLRUCache
+from jpeg_codec import (
+    stream_encoder,
+    snapshot_encoder,
+    enable_mjpeg_passthrough,
+    turbo_available,
+    STREAM_OVERLAY,
+    STREAM_PASSTHROUGH,
+)
+from batch_jobs import BatchJob, JobRegistry, expand_sources, release_staged, stage_uploads, score_sources
+from executors import (
+    ExecutorBusy,
+    inference_pool,
+    db_pool,
+    codec_pool,
+    batch_pool,
+    executor_stats,
+    shutdown_all,
+)
 
-app = FastAPI()
+log = get_logger("app")
+STARTED_AT = time.time()
+
+async def warm_up():
+    """Load the model and connect MongoDB off the request path."""
+    try:
+        await inference_pool.run(engine.load)
+        log.info("Model loaded", extra={"model": engine.model_path, "seconds": engine.load_seconds})
+    except Exception as e:
+        log.error("Model load failed: %s", e)
+    if MONGO_URI:
+        await db_pool.run(connect_db)
+
+@asynccontextmanager
+async def lifespan(app):
+    if snapshot_writer is not None:
+        snapshot_writer.start()
+    tasks = [asyncio.create_task(watch_sensor_bus())]
+    if STARTUP_WARMUP:
+        tasks.append(asyncio.create_task(warm_up()))
+    yield
+    for task in tasks:
+        task.cancel()
+    batch_jobs.cancel_all()
+    camera_manager.stop_all()
+    camera_manager.worker.stop()
+    if retention is not None:
+        retention.stop()
+    if snapshot_writer is not None:
+        snapshot_writer.stop()
+    shutdown_all()
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware to allow frontend connections
 app.add_middleware(
@@ -33,6 +111,10 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.exception_handler(ExecutorBusy)
+async def executor_busy_handler(request, exc):
+    return JSONResponse(status_code=503, content={"detail": f"Server busy ({exc} pool full)"})
+
 # Static files removed - using React frontend only
 # app.mount("/static", StaticFiles(directory="static"), name="static")
 # templates = Jinja2Templates(directory="static")
@@ -44,90 +126,190 @@ app.add_middleware(
 SNAP_COOLDOWN_SECONDS = float(os.getenv("SNAP_COOLDOWN_SECONDS", "10.0"))
 
 LATEST_SENSOR_JSON = "latest_sensor.json"
+# Live sensor data published by sensor_reader.py (shared memory, JSON fallback)
+sensor_bus = SensorBusReader(json_path=LATEST_SENSOR_JSON)
+
+# Push updates for /events and /ws ("status" and "sensor" topics)
+event_hub = EventHub()
+EVENT_TOPICS = ("status", "sensor")
+# How often the sensor bus is checked for a new reading (seconds)
+SENSOR_WATCH_INTERVAL = float(os.getenv("SENSOR_WATCH_INTERVAL", "0.5"))
+# Default / minimum seconds between pushes to one client
+EVENTS_MIN_INTERVAL = float(os.getenv("EVENTS_MIN_INTERVAL", "0.25"))
+EVENTS_FLOOR_INTERVAL = 0.05
+EVENTS_HEARTBEAT_SECONDS = 15.0
+
+# Where snapshot images are stored: "gridfs" (MongoDB) or "local" (on disk)
+SNAPSHOT_BLOB_STORE = os.getenv("SNAPSHOT_BLOB_STORE", "gridfs")
+SNAPSHOT_BLOB_DIR = os.getenv("SNAPSHOT_BLOB_DIR", "snapshot_blobs")
+# Local spool for snapshots that could not be written to MongoDB yet
+SNAPSHOT_SPOOL_DIR = os.getenv("SNAPSHOT_SPOOL_DIR", "snapshot_spool")
+SNAPSHOT_QUEUE_SIZE = int(os.getenv("SNAPSHOT_QUEUE_SIZE", "64"))
+SNAPSHOT_BATCH_SIZE = int(os.getenv("SNAPSHOT_BATCH_SIZE", "16"))
+
+# In-process cache of recently served snapshot images (bytes)
+IMAGE_CACHE_BYTES = int(float(os.getenv("IMAGE_CACHE_MB", "32")) * 1024 * 1024)
+image_cache = ByteLRUCache(IMAGE_CACHE_BYTES)
+# Snapshots never change once written, so browsers may cache them forever
+IMAGE_CACHE_CONTROL = "public, max-age=31536000, immutable"
 
 # ─────────────────────────────────────────────
 # MongoDB
 # ─────────────────────────────────────────────
 MONGO_URI = os.getenv("MONGODB_URI")
+# Minimum seconds between reconnect attempts after a failed connect
+DB_RETRY_SECONDS = float(os.getenv("DB_RETRY_SECONDS", "30"))
 client = None
 db = None
 snaps_wssv = None
 snaps_healthy = None
 sensor_collection = None
+blob_stores = {}
+snapshot_writer = None
+retention = None
+db_error = None
+_db_attempt_at = 0.0
+_db_lock = threading.Lock()
 
-if MONGO_URI:
-    try:
-        client = pymongo.MongoClient(MONGO_URI)
-        db = client["crustascope"]
-        # Use your requested collection names:
-        snaps_wssv = db["wssv_snaps"]
-        snaps_healthy = db["healthy_snaps"]
-        sensor_collection = db["sensor_results"]
-        print("[INFO] Connected to MongoDB Atlas.")
-    except Exception as e:
-        print("[WARN] MongoDB connection failed:", e)
-else:
-    print("[WARN] MONGODB_URI not set. DB features disabled.")
+if not MONGO_URI:
+    log.warning("MONGODB_URI not set. DB features disabled.")
+
+def connect_db():
+    """
+    Create the MongoDB client, collections and blob stores on first use
+    and attach the blob store to the snapshot writer. Blocking (DNS, index
+    creation): call it from db_pool.
+    Returns db, or None if MongoDB is not configured or unreachable.
+    """
+    global client, db, snaps_wssv, snaps_healthy, sensor_collection, blob_stores
+    global retention, db_error, _db_attempt_at
+    if db is not None or not MONGO_URI:
+        return db
+    with _db_lock:
+        if db is not None:
+            return db
+        if time.monotonic() - _db_attempt_at < DB_RETRY_SECONDS and _db_attempt_at:
+            return None
+        _db_attempt_at = time.monotonic()
+        try:
+            new_client = pymongo.MongoClient(MONGO_URI)
+            new_db = new_client["crustascope"]
+            stores = {
+                "gridfs": GridFSBlobStore(new_db),
+                "local": LocalBlobStore(SNAPSHOT_BLOB_DIR),
+            }
+            # Use your requested collection names:
+            snaps_wssv = new_db["wssv_snaps"]
+            snaps_healthy = new_db["healthy_snaps"]
+            sensor_collection = new_db["sensor_results"]
+            blob_stores = stores
+            try:
+                ensure_snap_indexes()
+            except Exception as e:
+                log.warning("Could not create snapshot indexes: %s", e)
+            if SNAP_RETENTION_ENABLED:
+                hot_store = stores.get(SNAPSHOT_BLOB_STORE, stores["gridfs"])
+                retention = RetentionEngine(
+                    new_db,
+                    get_snap_collection,
+                    stores,
+                    hot_store=hot_store,
+                    cold_store=stores.get(SNAP_COLD_STORE, hot_store),
+                )
+                retention.start()
+            client, db, db_error = new_client, new_db, None
+            snapshot_writer.attach(stores.get(SNAPSHOT_BLOB_STORE, stores["gridfs"]))
+            log.info("Connected to MongoDB Atlas.")
+        except Exception as e:
+            db_error = str(e)
+            log.warning("MongoDB connection failed: %s", e)
+        return db
+
+async def require_db():
+    """db for async handlers, connecting on the db pool if needed."""
+    if db is not None or not MONGO_URI:
+        return db
+    return await db_pool.run(connect_db)
 
 # ─────────────────────────────────────────────
 # TFLite model
 # ─────────────────────────────────────────────
-MODEL_PATH = "CrustaScope_model_float32.tflite"
-
-interpreter = tf.lite.Interpreter(model_path=MODEL_PATH)
-interpreter.allocate_tensors()
-input_details = interpreter.get_input_details()
-output_details = interpreter.get_output_details()
+# MODEL_PATH overrides everything; otherwise MODEL_VARIANT picks
+# int8 / float16 / float32, or "auto" for the fastest file present
+MODEL_PATH = os.getenv("MODEL_PATH")
+MODEL_VARIANT = os.getenv("MODEL_VARIANT", "auto")
+# TFLite interpreter threads (defaults to all cores) and max frames per invoke()
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", str(os.cpu_count() or 1)))
+INFERENCE_MAX_BATCH = int(os.getenv("INFERENCE_MAX_BATCH", "8"))
+
+# Load and warm the model in the background at startup; otherwise on first inference
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+
+engine = InferenceEngine(
+    model_path=MODEL_PATH,
+    variant=MODEL_VARIANT,
+    num_threads=INFERENCE_THREADS,
+    max_batch=INFERENCE_MAX_BATCH,
+    lazy=True,
+)
 
 def predict_image(img_bgr: np.ndarray) -> float:
-    img_rgb = cv2.cvtColor(img_bgr, cv2.COLOR_BGR2RGB)
-    resized = cv2.resize(img_rgb, (224, 224))
-    resized = resized.astype(np.float32) / 255.0
-    resized = np.expand_dims(resized, axis=0)
-
-    interpreter.set_tensor(input_details[0]["index"], resized)
-    interpreter.invoke()
-    output = interpreter.get_tensor(output_details[0]["index"])
-    conf = float(output[0][0])
-    return conf
-
-def classify_label(conf: float) -> str:
-    if conf >= 0.7:
-        return "WSSV DETECTED"
-    elif conf <= 0.3:
-        return "Healthy Shrimp"
-    else:
-        return "No Shrimp"
+    return engine.predict(img_bgr)
+
+# Live camera frames: whole-frame batches, or whole frame + tiles (TILED_INFERENCE=1)
+tiler = TiledPredictor(engine.predict_batch) if TILED_INFERENCE else None
+predict_frames = tiler.predict_batch if tiler is not None else engine.predict_batch
 
 # ─────────────────────────────────────────────
 # Camera & state
 # ─────────────────────────────────────────────
-camera = None
-monitoring = False
-current_camera_index = None
+# Size of the latest-frame queues between pipeline stages
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "1"))
+# Maximum number of concurrent /video_feed viewers (per camera)
+MAX_STREAM_CLIENTS = int(os.getenv("MAX_STREAM_CLIENTS", "8"))
+# Maximum number of cameras monitored at once
+MAX_CAMERAS = int(os.getenv("MAX_CAMERAS", "4"))
+# Camera ids handed out to URL/file sources started without a camera_index
+URL_CAMERA_ID_BASE = 100
+
+# Native MJPEG pass-through only makes sense without an overlay to draw
+PASSTHROUGH_ACTIVE = STREAM_PASSTHROUGH and not STREAM_OVERLAY
+if STREAM_PASSTHROUGH and STREAM_OVERLAY:
+    log.warning("STREAM_PASSTHROUGH needs STREAM_OVERLAY=0; encoding frames instead.")
+# Stream JPEGs can double as snapshot JPEGs only when they carry no overlay
+JPEG_REUSE = not STREAM_OVERLAY and (
+    stream_encoder.settings == snapshot_encoder.settings
+    or (PASSTHROUGH_ACTIVE and not snapshot_encoder.max_width)
+)
+# Recent frames whose stream JPEG is kept for reuse by snapshots
+JPEG_REUSE_FRAMES = int(os.getenv("JPEG_REUSE_FRAMES", "64"))
 
+# Most recent result from any camera (kept after /stop, like before)
 last_result = {
     "label": None,
     "confidence": None,
     "timestamp": None,
     "snapshot_saved": False,
+    "camera_index": None,
 }
 
-last_snap_time = 0.0
+# Last snapshot time per (camera_index, kind); None camera = /upload_test
+last_snap_times = {}
+# Streaming detector per camera (only touched by the inference worker)
+detectors = {}
+
+INFERENCE_RESULTS = metrics.counter("inference_results_total", "Inferences by raw label.", ["label"])
+DETECTION_EVENTS = metrics.counter("detection_events_total", "Detection events by label.", ["label"])
+SNAPSHOTS = metrics.counter(
+    "snapshots_total", "Snapshot decisions (queued, cooldown, unavailable, queue_full).",
+    ["kind", "outcome"],
+)
 
 # ─────────────────────────────────────────────
 # Helpers: sensor + snapshots
 # ─────────────────────────────────────────────
 def read_latest_sensor():
-    if not os.path.exists(LATEST_SENSOR_JSON):
-        return None
-    try:
-        with open(LATEST_SENSOR_JSON, "r") as f:
-            data = json.load(f)
-        return data
-    except Exception as e:
-        print("[WARN] Could not read latest_sensor.json:", e)
-        return None
+    return sensor_bus.read()
 
 def get_snap_collection(kind: str):
     if kind == "wssv":
@@ -137,116 +319,248 @@ def get_snap_collection(kind: str):
     else:
         return None
 
-def save_snapshot(label: str, confidence: float, frame_bgr: np.ndarray):
+# Exists from startup so detections spool to disk while MongoDB is
+# unreachable; connect_db() attaches the blob store when it connects.
+if MONGO_URI:
+    snapshot_writer = SnapshotWriter(
+        get_snap_collection,
+        None,
+        spool_dir=SNAPSHOT_SPOOL_DIR,
+        max_queue=SNAPSHOT_QUEUE_SIZE,
+        batch_size=SNAPSHOT_BATCH_SIZE,
+        encode=snapshot_encoder.encode_frame,
+    )
+
+def load_snap_image(doc: dict):
     """
-    Save snapshot to MongoDB (WSSV or Healthy only),
-    along with current sensor data, with cooldown control.
+    Returns the stored JPEG bytes for a snapshot document, or None.
+    Supports blob-store references as well as older embedded images.
     """
-    global last_snap_time
+    blob_id = doc.get("image_blob")
+    if blob_id:
+        store = blob_stores.get(doc.get("image_store"))
+        return store.get(blob_id) if store is not None else None
 
-    now_ts = time.time()
-    if now_ts - last_snap_time < SNAP_COOLDOWN_SECONDS:
-        return  # cooldown active
-
-    if client is None or db is None or snaps_wssv is None or snaps_healthy is None:
-        print("[WARN] MongoDB not available. Snapshot not saved.")
-        return
+    # Older documents embed the image (binary or base64) until compaction migrates them
+    try:
+        return embedded_image(doc)
+    except Exception as e:
+        log.error("Failed to decode base64 image: %s", e)
+        return None
 
+def save_snapshot(label: str, confidence: float, frame_bgr: np.ndarray, camera_index=None,
+                  event: dict = None, jpeg_lookup=None) -> bool:
+    """
+    Queue snapshot for MongoDB (WSSV or Healthy only),
+    along with current sensor data, with a cooldown per camera and kind.
+    Encoding and DB writes happen on the snapshot writer thread.
+    """
     if label == "WSSV DETECTED":
-        col = snaps_wssv
         kind = "wssv"
     elif label == "Healthy Shrimp":
-        col = snaps_healthy
         kind = "healthy"
     else:
-        return
+        return False
 
-    ok, buf = cv2.imencode(".jpg", frame_bgr)
-    if not ok:
-        print("[WARN] Could not encode frame as JPEG.")
-        return
+    now_ts = time.time()
+    if now_ts - last_snap_times.get((camera_index, kind), 0.0) < SNAP_COOLDOWN_SECONDS:
+        SNAPSHOTS.labels(kind, "cooldown").inc()
+        return False  # cooldown active
+
+    if snapshot_writer is None:
+        SNAPSHOTS.labels(kind, "unavailable").inc()
+        return False
+    if db is None:
+        # Spooled until then; never block the inference worker on a connect
+        try:
+            db_pool.submit(connect_db)
+        except ExecutorBusy:
+            pass
 
-    img_bytes = buf.tobytes()
     sensor_doc = read_latest_sensor()
 
     doc = {
         "kind": kind,
         "label": label,
         "confidence": float(confidence),
+        "camera_index": camera_index,
         "created_at": datetime.utcnow().isoformat(),
-        "image_bytes": img_bytes,
         "image_format": "jpg",
         "sensor_at_capture": sensor_doc,
     }
+    if event is not None:
+        doc["event"] = event
 
-    try:
-        col.insert_one(doc)
-        last_snap_time = now_ts
-        print(f"[INFO] Saved {label} snapshot with sensor data.")
-    except Exception as e:
-        print("[WARN] Error saving snapshot:", e)
+    if not snapshot_writer.submit(kind, doc, frame_bgr=frame_bgr, jpeg_lookup=jpeg_lookup):
+        SNAPSHOTS.labels(kind, "queue_full").inc()
+        return False
+    SNAPSHOTS.labels(kind, "queued").inc()
+    last_snap_times[(camera_index, kind)] = now_ts
+    return True
 
 # ─────────────────────────────────────────────
-# MJPEG generator
+# Frame pipeline stages
 # ─────────────────────────────────────────────
-def gen_frames():
-    global camera, monitoring, last_result
-
-    if camera is None:
-        print("[WARN] gen_frames called but camera is None.")
-        return
-
-    print("[INFO] Starting frame generator loop...")
-    while monitoring:
-        success, frame = camera.read()
-        if not success:
-            print("[WARN] Camera read failed.")
-            break
+def handle_inference(cam_id, frame: np.ndarray, conf: float, tiles: dict = None) -> dict:
+    """
+    Called by the shared inference worker for each camera's frame,
+    independent of viewers. `tiles` holds per-tile boxes and scores in
+    tiled mode.
+    """
+    tracker = detectors.get(cam_id)
+    if tracker is None:
+        tracker = detectors[cam_id] = DetectionTracker()
+    event = tracker.update(conf, frame)
+    INFERENCE_RESULTS.labels(classify_label(conf)).inc()
+    return report_detection(cam_id, tracker, event, conf, tiles)
+
+def handle_skipped_frame(cam_id, frame: np.ndarray, previous: dict = None):
+    """
+    Called from a camera's grab thread for frames the gate skipped. They
+    add no evidence, but keep a static scene's detection window open until
+    the gate's periodic inferences fill it. Returns a new result only when
+    that window closes here, otherwise None.
+    """
+    tracker = detectors.get(cam_id)
+    if tracker is None:
+        return None
+    event = tracker.repeat(frame)
+    if event is None:
+        return None
+    tiles = previous.get("tiles") if previous else None
+    return report_detection(cam_id, tracker, event, tracker.last_conf, tiles)
+
+def report_detection(cam_id, tracker: DetectionTracker, event, conf: float, tiles: dict = None) -> dict:
+    """Saves the snapshot for a closed window and publishes the camera's result."""
+    global last_result
+
+    now_iso = datetime.now().isoformat()
+
+    # One snapshot per detection window (its best frame), not per frame
+    snapshot_saved = False
+    if event is not None:
+        DETECTION_EVENTS.labels(event.label).inc()
+        snapshot_saved = save_snapshot(
+            event.label, event.confidence, event.frame,
+            camera_index=cam_id, event=event.info(),
+            # Resolved on the writer thread, once the stream has encoded the frame
+            jpeg_lookup=lambda: reusable_jpeg(cam_id, event.frame),
+        )
 
-        conf = predict_image(frame)
-        label = classify_label(conf)
-        now_iso = datetime.now().isoformat()
+    result = {
+        "label": tracker.label,
+        "confidence": tracker.ema,
+        "raw_label": classify_label(conf),
+        "raw_confidence": conf,
+        "timestamp": now_iso,
+        "snapshot_saved": snapshot_saved,
+        "camera_index": cam_id,
+    }
+    if tiles is not None:
+        result["tiles"] = tiles
+    last_result = result
+    event_hub.publish("status", result)
+    return result
+
+def draw_overlay(frame: np.ndarray, result: dict):
+    """Draws the inference label and confidence (and tile heatmap) onto the frame in place."""
+    if result.get("tiles"):
+        draw_heatmap(frame, result["tiles"], key=result.get("camera_index"))
+    label = result["label"]
+    conf = result["confidence"]
 
-        snapshot_saved = False
-        if label in ("WSSV DETECTED", "Healthy Shrimp"):
-            save_snapshot(label, conf, frame)
-            snapshot_saved = True
+    if label == "WSSV DETECTED":
+        color = (0, 0, 255)
+    elif label == "Healthy Shrimp":
+        color = (0, 255, 0)
+    else:
+        color = (255, 255, 0)
+
+    text = f"{label} ({conf*100:.1f}%)"
+    cv2.putText(
+        frame,
+        text,
+        (10, 30),
+        cv2.FONT_HERSHEY_SIMPLEX,
+        0.7,
+        color,
+        2,
+    )
 
-        last_result = {
-            "label": label,
-            "confidence": conf,
-            "timestamp": now_iso,
-            "snapshot_saved": snapshot_saved,
-        }
+def encode_frame(frame: np.ndarray, result: dict):
+    """
+    Encode stage: draws the latest inference result and JPEG-encodes the frame.
+    `frame` is already at stream resolution (see stream_encoder.downscale).
+    """
+    if result is not None and STREAM_OVERLAY:
+        draw_overlay(frame, result)
 
-        if label == "WSSV DETECTED":
-            color = (0, 0, 255)
-        elif label == "Healthy Shrimp":
-            color = (0, 255, 0)
-        else:
-            color = (255, 255, 0)
-
-        text = f"{label} ({conf*100:.1f}%)"
-        cv2.putText(
-            frame,
-            text,
-            (10, 30),
-            cv2.FONT_HERSHEY_SIMPLEX,
-            0.7,
-            color,
-            2,
-        )
+    return stream_encoder.encode(frame)
 
-        ok, buffer = cv2.imencode(".jpg", frame)
-        if not ok:
-            continue
-        frame_bytes = buffer.tobytes()
+def open_camera(source):
+    # Real device, or synthetic frames / file replay under --simulate
+    cap = hal.open_frame_source(source)
+    if (PASSTHROUGH_ACTIVE and isinstance(source, int) and isinstance(cap, cv2.VideoCapture)
+            and cap.isOpened()):
+        if not enable_mjpeg_passthrough(cap):
+            log.warning("Camera %s does not support MJPEG pass-through; encoding frames.", source)
+    return cap
 
-        yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
+def reusable_jpeg(cam_id, frame):
+    """
+    The JPEG already produced for this frame by the stream, if it is
+    interchangeable with what the snapshot encoder would produce.
+    """
+    session = camera_manager.get(cam_id)
+    if session is None or not JPEG_REUSE:
+        return None
+    hit = session.pipeline.jpeg_for(frame)
+    if hit is None:
+        return None
+    tag, jpeg = hit
+    if tag == "native":
+        # Camera's own full-resolution JPEG
+        return jpeg if not snapshot_encoder.max_width else None
+    if not STREAM_OVERLAY and stream_encoder.settings == snapshot_encoder.settings:
+        return jpeg
+    return None
 
-    if camera is not None:
-        camera.release()
-        print("[INFO] Camera released in gen_frames().")
+# ─────────────────────────────────────────────
+# MJPEG generator
+# ─────────────────────────────────────────────
+def gen_frames(session, sub):
+    """
+    Streams frames from the camera's broadcaster; never touches the camera or model.
+    """
+    log.info("Starting frame generator loop for camera %s, subscriber %s...", session.cam_id, sub.id)
+    try:
+        while sub.active and session.running:
+            frame_bytes = sub.get(timeout=1.0)
+            if frame_bytes is None:
+                continue
+            yield b"--frame\r\nContent-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
+    finally:
+        session.broadcaster.unsubscribe(sub)
+
+if hal.SIMULATE:
+    log.info("Simulation mode: %d synthetic camera(s) at %dx%d @ %g fps.",
+             hal.SIM_CAMERAS, hal.SIM_FRAME_WIDTH, hal.SIM_FRAME_HEIGHT, hal.SIM_FPS)
+
+camera_manager = CameraManager(
+    open_capture=open_camera,
+    encode_fn=encode_frame,
+    handle_result=handle_inference,
+    handle_skipped=handle_skipped_frame,
+    predict_batch=predict_frames,
+    max_cameras=MAX_CAMERAS,
+    queue_size=PIPELINE_QUEUE_SIZE,
+    max_stream_clients=MAX_STREAM_CLIENTS,
+    make_gate=make_gate,
+    prepare_fn=stream_encoder.downscale,
+    keep_jpegs=JPEG_REUSE_FRAMES if JPEG_REUSE else 0,
+    stream_quality=stream_encoder.quality,
+    stream_encode=stream_encoder.encode_frame,
+)
 
 # ─────────────────────────────────────────────
 # Page routes - removed (using React frontend only)
@@ -255,67 +569,251 @@ def gen_frames():
 # ─────────────────────────────────────────────
 # Camera & ML routes
 # ─────────────────────────────────────────────
-@app.get("/cameras")
-async def list_cameras():
+def probe_cameras(skip=()):
+    if hal.SIMULATE:
+        return hal.simulated_camera_indexes()
     available = []
     for idx in range(5):
+        if idx in skip:
+            # Already open in a pipeline; probing would fight over the device
+            available.append(idx)
+            continue
         cap = cv2.VideoCapture(idx)
         if cap is not None and cap.isOpened():
             available.append(idx)
             cap.release()
-    return {"cameras": available}
+    return available
+
+# Opening every /dev/video* index takes ~100 ms each, so reuse the last probe
+CAMERA_PROBE_TTL = float(os.getenv("CAMERA_PROBE_TTL", "30"))
+_camera_probe = {"at": 0.0, "cameras": None}
+_camera_probe_lock = asyncio.Lock()
+
+async def cached_cameras(running, refresh: bool = False):
+    async with _camera_probe_lock:
+        fresh = time.monotonic() - _camera_probe["at"] < CAMERA_PROBE_TTL
+        if refresh or not fresh or _camera_probe["cameras"] is None:
+            _camera_probe["cameras"] = await codec_pool.run(probe_cameras, set(running))
+            _camera_probe["at"] = time.monotonic()
+        cameras = set(_camera_probe["cameras"])
+    # Devices started since the last probe are available by definition
+    cameras.update(c for c in running if isinstance(c, int) and c < URL_CAMERA_ID_BASE)
+    return sorted(cameras)
+
+@app.get("/cameras")
+async def list_cameras(refresh: bool = False):
+    running = camera_manager.running_ids()
+    available = await cached_cameras(running, refresh=refresh)
+    return {"cameras": available, "running": running}
 
 @app.post("/start")
 async def start_monitor(payload: dict):
-    global camera, monitoring, current_camera_index
-
     cam_index = payload.get("camera_index")
-    if cam_index is None:
-        raise HTTPException(status_code=400, detail="camera_index is required")
+    source = payload.get("source")
+    if cam_index is None and not source:
+        raise HTTPException(status_code=400, detail="camera_index or source is required")
 
-    if monitoring and camera is not None:
-        return {"status": "already_running", "camera_index": current_camera_index}
+    if source is None:
+        source = cam_index
+    if cam_index is None:
+        taken = set(camera_manager.sessions)
+        cam_index = URL_CAMERA_ID_BASE
+        while cam_index in taken:
+            cam_index += 1
 
-    cam = cv2.VideoCapture(cam_index)
-    if not cam.isOpened():
+    try:
+        started = await codec_pool.run(camera_manager.start, cam_index, source)
+    except IOError:
         raise HTTPException(status_code=500, detail="Unable to open camera index")
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
 
-    camera = cam
-    monitoring = True    # <– starts ML loop
-    current_camera_index = cam_index
-    print(f"[INFO] Monitoring started on camera {cam_index}")
+    if not started:
+        return {"status": "already_running", "camera_index": cam_index}
+    detectors.pop(cam_index, None)
+    log.info("Monitoring started on camera %s (%s)", cam_index, source)
     return {"status": "started", "camera_index": cam_index}
 
 @app.post("/stop")
-async def stop_monitor():
-    global monitoring, camera, current_camera_index
-    monitoring = False
-    if camera is not None:
-        camera.release()
-        print("[INFO] Camera released in /stop.")
-        camera = None
-    current_camera_index = None
-    return {"status": "stopped"}
-
-@app.get("/video_feed")
-async def video_feed():
-    if camera is None:
+async def stop_monitor(payload: dict = None):
+    cam_index = (payload or {}).get("camera_index")
+    if cam_index is None:
+        await codec_pool.run(camera_manager.stop_all)
+        return {"status": "stopped"}
+    if not await codec_pool.run(camera_manager.stop, cam_index):
+        raise HTTPException(status_code=404, detail="Camera not running")
+    return {"status": "stopped", "camera_index": cam_index}
+
+def open_stream(session, fps, quality):
+    if session is None or not session.running:
         raise HTTPException(status_code=400, detail="Camera not started")
+    if quality is not None and not (1 <= quality <= 100):
+        raise HTTPException(status_code=400, detail="quality must be between 1 and 100")
+    try:
+        sub = session.broadcaster.subscribe(fps=fps, quality=quality)
+    except TooManySubscribers:
+        raise HTTPException(status_code=503, detail="Too many stream viewers")
     return StreamingResponse(
-        gen_frames(),
+        gen_frames(session, sub),
         media_type="multipart/x-mixed-replace; boundary=frame",
     )
 
+@app.get("/video_feed")
+async def video_feed(fps: float = None, quality: int = None):
+    return open_stream(camera_manager.primary(), fps, quality)
+
+@app.get("/video_feed/{cam}")
+async def video_feed_camera(cam: int, fps: float = None, quality: int = None):
+    return open_stream(camera_manager.get(cam), fps, quality)
+
 @app.get("/status")
 async def status():
-    return last_result
+    # Inferences skipped by the frame-change gate since the cameras started
+    return {**last_result, "inference_skipped": camera_manager.frames_skipped()}
+
+@app.get("/status/{cam}")
+async def status_camera(cam: int):
+    session = camera_manager.get(cam)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Camera not running")
+    result = session.last_result or {
+        "label": None,
+        "confidence": None,
+        "timestamp": None,
+        "snapshot_saved": False,
+        "camera_index": cam,
+    }
+    return {
+        **result,
+        "running": session.running,
+        "inference_skipped": session.pipeline.frames_skipped,
+    }
+
+@app.get("/stream_stats")
+async def stream_stats():
+    stats = camera_manager.stats()
+    stats["encoder"] = {
+        "stream": stream_encoder.stats(),
+        "snapshot": snapshot_encoder.stats(),
+        "turbojpeg_available": turbo_available(),
+        "overlay": STREAM_OVERLAY,
+        "passthrough": PASSTHROUGH_ACTIVE,
+        "snapshot_reuse": JPEG_REUSE,
+    }
+    stats["tiling"] = tiler.stats() if tiler is not None else {"enabled": False}
+    for cid, tracker in list(detectors.items()):
+        cam = stats["cameras"].get(str(cid))
+        if cam is not None:
+            cam["detector"] = tracker.stats()
+    return stats
+
+@app.get("/retention_stats")
+async def retention_stats():
+    if retention is None:
+        return {"enabled": False}
+    return retention.stats()
+
+@app.post("/retention/run")
+async def run_retention():
+    """Start a retention/compaction pass now; progress shows in /retention_stats."""
+    if await require_db() is None or retention is None:
+        raise HTTPException(status_code=503, detail="Retention not running")
+    retention.trigger()
+    return {"triggered": True}
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok", "uptime_s": round(time.time() - STARTED_AT, 1)}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: the model is loaded and MongoDB is connected (when configured)."""
+    if MONGO_URI and db is None and _db_lock.acquire(blocking=False):
+        # Nudge a reconnect without waiting on it; connect_db rate-limits retries
+        _db_lock.release()
+        try:
+            db_pool.submit(connect_db)
+        except ExecutorBusy:
+            pass
+    checks = {
+        "model": {"ok": engine.loaded, "error": engine.load_error},
+        "db": {"ok": db is not None or not MONGO_URI, "configured": bool(MONGO_URI), "error": db_error},
+    }
+    ready = all(c["ok"] for c in checks.values())
+    return JSONResponse(status_code=200 if ready else 503,
+                        content={"status": "ready" if ready else "not_ready", "checks": checks})
+
+@app.get("/executor_stats")
+async def executors_status():
+    return executor_stats()
+
+@app.get("/snapshot_stats")
+async def snapshot_stats():
+    if snapshot_writer is None:
+        return {"enabled": False, "image_cache": image_cache.stats()}
+    return {"enabled": True, **snapshot_writer.stats(), "image_cache": image_cache.stats()}
+
+@metrics.register_collector
+def collect_runtime_metrics():
+    """Counters the pipeline, writer and pools already keep, read at scrape time."""
+    cams = list(camera_manager.sessions.items())
+    frames = []
+    drops = []
+    viewers = []
+    for cid, s in cams:
+        p = s.pipeline
+        for stage, value in (("grabbed", p.frames_grabbed), ("inferred", p.frames_inferred),
+                             ("skipped", p.frames_skipped), ("encoded", p.frames_encoded),
+                             ("passthrough", p.frames_passthrough)):
+            frames.append(({"camera": cid, "stage": stage}, value))
+        drops.append(({"camera": cid, "queue": "encode"}, p.encode_q.dropped))
+        drops.append(({"camera": cid, "queue": "viewers"}, s.broadcaster.dropped_total))
+        viewers.append(({"camera": cid}, s.broadcaster.subscriber_count))
+    worker = camera_manager.worker
+    drops.append(({"camera": "all", "queue": "batch_worker"}, worker.dropped))
+
+    families = [
+        ("frames_total", "counter", "Frames per camera and pipeline stage.", frames),
+        ("frames_dropped_total", "counter", "Frames replaced before a stage consumed them.", drops),
+        ("stream_subscribers", "gauge", "Connected /video_feed viewers.", viewers),
+        ("cameras_running", "gauge", "Cameras with a running pipeline.",
+         [({}, len(camera_manager.running_ids()))]),
+    ]
+    if snapshot_writer is not None:
+        st = snapshot_writer.stats()
+        families += [
+            ("snapshot_queue_depth", "gauge", "Snapshots waiting for the writer.", [({}, st["queue_depth"])]),
+            ("snapshot_spool_depth", "gauge", "Snapshots spooled to disk.", [({}, st["spool_depth"])]),
+            ("snapshot_writer_total", "counter", "Snapshot writer outcomes.",
+             [({"outcome": k}, st[k]) for k in ("written", "dropped", "spooled", "failures")]),
+        ]
+    cache = image_cache.stats()
+    families += [
+        ("image_cache_bytes", "gauge", "Bytes held by the snapshot image cache.", [({}, cache["bytes"])]),
+        ("image_cache_requests_total", "counter", "Snapshot image cache lookups.",
+         [({"result": "hit"}, cache["hits"]), ({"result": "miss"}, cache["misses"])]),
+    ]
+    pools = executor_stats()
+    families += [
+        ("executor_jobs", "gauge", "Executor jobs by state.",
+         [({"pool": n, "state": k}, st[k]) for n, st in pools.items() for k in ("active", "queued")]),
+        ("executor_rejected_total", "counter", "Jobs rejected because a pool was full.",
+         [({"pool": n}, st["rejected"]) for n, st in pools.items()]),
+    ]
+    return families
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition; 404 when METRICS_ENABLED=0."""
+    if not metrics.METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="Metrics disabled")
+    return Response(content=metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 # ─────────────────────────────────────────────
 # Sensor live data route
 # ─────────────────────────────────────────────
-@app.get("/sensor_live")
-async def sensor_live():
-    data = read_latest_sensor()
+def sensor_live_payload(data):
     if not data:
         return {
             "timestamp": None,
@@ -330,23 +828,223 @@ async def sensor_live():
         "ph": data.get("ph"),
         "turbidity": data.get("turbidity"),
         "tds": data.get("tds"),
+        # ADC burst size and per-channel stddev, when the reader provides them
+        "sampling": data.get("sampling"),
     }
 
+@app.get("/sensor_live")
+async def sensor_live():
+    return sensor_live_payload(read_latest_sensor())
+
+# Range used by /sensor_history when "from" is omitted
+SENSOR_HISTORY_DEFAULT_HOURS = float(os.getenv("SENSOR_HISTORY_DEFAULT_HOURS", "24"))
+# Hard cap on buckets per request (explicit bucket sizes included)
+SENSOR_HISTORY_POINT_LIMIT = int(os.getenv("SENSOR_HISTORY_POINT_LIMIT", "5000"))
+
+@app.get("/sensor_history")
+async def sensor_history(
+    since: str = Query(None, alias="from"),
+    until: str = Query(None, alias="to"),
+    bucket: str = None,
+):
+    """
+    Sensor time series aggregated into buckets (min/mean/max per metric),
+    computed by MongoDB from the minute/hour rollups.
+    """
+    if await require_db() is None:
+        raise HTTPException(status_code=500, detail="MongoDB not configured")
+    try:
+        end = datetime.fromisoformat(parse_iso_utc(until)) if until else datetime.utcnow()
+        start = (
+            datetime.fromisoformat(parse_iso_utc(since)) if since
+            else end - timedelta(hours=SENSOR_HISTORY_DEFAULT_HOURS)
+        )
+        bucket_seconds = parse_bucket(bucket) if bucket else choose_bucket(start, end)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid parameter: {e}")
+    if start >= end:
+        raise HTTPException(status_code=400, detail="'from' must be before 'to'")
+    if (end - start).total_seconds() / bucket_seconds > SENSOR_HISTORY_POINT_LIMIT:
+        raise HTTPException(status_code=400, detail="Bucket too small for this range")
+
+    return await db_pool.run(query_history, db, start, end, bucket_seconds)
+
+async def watch_sensor_bus():
+    """
+    Publishes new sensor readings to the event hub as they appear.
+    """
+    last = None
+    while True:
+        try:
+            payload = sensor_live_payload(read_latest_sensor())
+            if payload != last:
+                last = payload
+                event_hub.publish("sensor", payload)
+        except Exception as e:
+            log.warning("Sensor watcher error: %s", e)
+        await asyncio.sleep(SENSOR_WATCH_INTERVAL)
+
+# ─────────────────────────────────────────────
+# Push updates (SSE + WebSocket)
+# ─────────────────────────────────────────────
+def parse_event_params(topics: str, interval: float):
+    wanted = tuple(t for t in (topics or "").split(",") if t) or EVENT_TOPICS
+    unknown = [t for t in wanted if t not in EVENT_TOPICS]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown topics: {', '.join(unknown)}")
+    if interval is None:
+        interval = EVENTS_MIN_INTERVAL
+    return wanted, max(EVENTS_FLOOR_INTERVAL, interval)
+
+@app.get("/events")
+async def events(request: Request, topics: str = None, interval: float = None):
+    wanted, interval = parse_event_params(topics, interval)
+
+    async def gen():
+        sub = event_hub.subscribe(wanted, interval)
+        try:
+            yield "retry: 2000\n\n"
+            while not sub.closed:
+                changes = await sub.next_changes(timeout=EVENTS_HEARTBEAT_SECONDS)
+                if await request.is_disconnected():
+                    break
+                if not changes:
+                    yield ": keep-alive\n\n"
+                    continue
+                for topic, data in changes.items():
+                    yield f"event: {topic}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            event_hub.unsubscribe(sub)
+
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(gen(), media_type="text/event-stream", headers=headers)
+
+@app.websocket("/ws")
+async def ws_events(websocket: WebSocket, topics: str = None, interval: float = None):
+    try:
+        wanted, interval = parse_event_params(topics, interval)
+    except HTTPException as e:
+        await websocket.close(code=1008, reason=e.detail)
+        return
+
+    await websocket.accept()
+    sub = event_hub.subscribe(wanted, interval)
+
+    async def watch_disconnect():
+        try:
+            while True:
+                msg = await websocket.receive()
+                if msg["type"] == "websocket.disconnect":
+                    break
+        finally:
+            sub.close()
+
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        while not sub.closed:
+            changes = await sub.next_changes(timeout=EVENTS_HEARTBEAT_SECONDS)
+            for topic, data in changes.items():
+                await websocket.send_json({"topic": topic, "data": data})
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        watcher.cancel()
+        event_hub.unsubscribe(sub)
+
 # ─────────────────────────────────────────────
 # Gallery APIs
 # ─────────────────────────────────────────────
-@app.get("/snaps")
-async def list_snaps(kind: str):
-    if client is None or db is None:
-        return {"items": []}
+# Metadata fields returned by /snaps; image fields are never fetched
+SNAP_LIST_PROJECTION = {
+    "label": 1,
+    "confidence": 1,
+    "camera_index": 1,
+    "timestamp": 1,
+    "created_at": 1,
+    "tier": 1,
+    "sensor_at_capture.temperature_c": 1,
+    "sensor_at_capture.ph": 1,
+    "sensor_at_capture.turbidity": 1,
+    "sensor_at_capture.tds": 1,
+}
+# Blob references only; legacy embedded images are fetched separately when needed
+SNAP_BLOB_PROJECTION = {"image_blob": 1, "image_store": 1, "thumb_blob": 1, "thumb_store": 1}
 
-    col = get_snap_collection(kind)
-    if col is None:
-        raise HTTPException(status_code=400, detail="Invalid kind")
+SNAPS_DEFAULT_LIMIT = 100
+SNAPS_MAX_LIMIT = 500
+
+def ensure_snap_indexes():
+    for kind, col in (("wssv", snaps_wssv), ("healthy", snaps_healthy)):
+        if col is not None:
+            col.create_index([("created_at", -1), ("_id", -1)], name="created_at_desc")
+            ensure_retention_indexes(col, kind, expire=SNAP_RETENTION_ENABLED)
 
-    docs = col.find().sort("created_at", -1)
+def parse_iso_utc(value: str) -> str:
+    """
+    Normalizes an ISO timestamp to the naive-UTC format used in created_at.
+    """
+    dt = datetime.fromisoformat(value)
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.isoformat()
+
+def encode_snap_cursor(doc: dict) -> str:
+    return f"{doc.get('created_at') or ''}|{doc['_id']}"
+
+def decode_snap_cursor(cursor: str):
+    created_at, _, oid = cursor.rpartition("|")
+    return created_at or None, ObjectId(oid)
+
+def build_snap_query(before=None, min_conf=None, max_conf=None, since=None, until=None) -> dict:
+    clauses = []
+    if before is not None:
+        created_at, oid = before
+        if created_at is not None:
+            # Keyset on (created_at, _id) descending; legacy docs without created_at sort last
+            clauses.append({"$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lt": oid}},
+                {"created_at": None},
+            ]})
+        else:
+            clauses.append({"created_at": None, "_id": {"$lt": oid}})
+
+    conf_range = {}
+    if min_conf is not None:
+        conf_range["$gte"] = min_conf
+    if max_conf is not None:
+        conf_range["$lte"] = max_conf
+    if conf_range:
+        clauses.append({"confidence": conf_range})
+
+    time_range = {}
+    if since is not None:
+        time_range["$gte"] = since
+    if until is not None:
+        time_range["$lte"] = until
+    if time_range:
+        clauses.append({"created_at": time_range})
+
+    if not clauses:
+        return {}
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"$and": clauses}
+
+def fetch_snap_items(col, query: dict, limit: int):
+    docs = (
+        col.find(query, SNAP_LIST_PROJECTION)
+        .sort([("created_at", -1), ("_id", -1)])
+        .limit(limit + 1)
+    )
     items = []
+    last_doc = None
+    has_more = False
     for d in docs:
+        if len(items) == limit:
+            has_more = True
+            break
+        last_doc = d
         sensor = d.get("sensor_at_capture", {}) or {}
         items.append(
             {
@@ -356,6 +1054,7 @@ async def list_snaps(kind: str):
                 "camera_index": d.get("camera_index"),
                 "timestamp": d.get("timestamp") or d.get("created_at"),  # Support both old and new format
                 "created_at": d.get("created_at") or d.get("timestamp"),
+                "tier": d.get("tier", "hot"),
                 "sensor": {
                     "temperature_c": sensor.get("temperature_c"),
                     "ph": sensor.get("ph"),
@@ -364,11 +1063,75 @@ async def list_snaps(kind: str):
                 },
             }
         )
-    return {"items": items}
+    next_before = encode_snap_cursor(last_doc) if has_more and last_doc is not None else None
+    return items, next_before
+
+@app.get("/snaps")
+async def list_snaps(
+    kind: str,
+    limit: int = SNAPS_DEFAULT_LIMIT,
+    before: str = None,
+    min_conf: float = None,
+    max_conf: float = None,
+    since: str = Query(None, alias="from"),
+    until: str = Query(None, alias="to"),
+):
+    if await require_db() is None:
+        return {"items": [], "next_before": None}
+
+    col = get_snap_collection(kind)
+    if col is None:
+        raise HTTPException(status_code=400, detail="Invalid kind")
+
+    limit = max(1, min(limit, SNAPS_MAX_LIMIT))
+    try:
+        cursor = decode_snap_cursor(before) if before else None
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    try:
+        since = parse_iso_utc(since) if since else None
+        until = parse_iso_utc(until) if until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid from/to timestamp")
+
+    query = build_snap_query(cursor, min_conf, max_conf, since, until)
+    items, next_before = await db_pool.run(fetch_snap_items, col, query, limit)
+    return {"items": items, "next_before": next_before}
+
+@app.get("/snaps/count")
+async def count_snaps():
+    """Snapshots stored per kind, for gallery totals (/snaps itself is paginated)."""
+    if await require_db() is None:
+        return {"wssv": 0, "healthy": 0}
+
+    def count():
+        # Collection metadata count: O(1), unlike count_documents({})
+        return {kind: get_snap_collection(kind).estimated_document_count() for kind in ("wssv", "healthy")}
+
+    return await db_pool.run(count)
+
+def delete_snap_doc(col, oid) -> bool:
+    doc = col.find_one_and_delete({"_id": oid}, projection=SNAP_BLOB_PROJECTION)
+    if doc is None:
+        return False
+
+    # Images are content-addressed; only drop a blob once nothing references it
+    for field, store_field in (("image_blob", "image_store"), ("thumb_blob", "thumb_store")):
+        blob_id = doc.get(field)
+        store = blob_stores.get(doc.get(store_field) or doc.get("image_store"))
+        if not blob_id or store is None:
+            continue
+        still_used = any(
+            c.find_one({field: blob_id}, {"_id": 1}) is not None
+            for c in (snaps_wssv, snaps_healthy)
+        )
+        if not still_used:
+            store.delete(blob_id)
+    return True
 
 @app.delete("/snap/{kind}/{snap_id}")
 async def delete_snap(kind: str, snap_id: str):
-    if client is None or db is None:
+    if await require_db() is None:
         raise HTTPException(status_code=500, detail="DB not available")
 
     col = get_snap_collection(kind)
@@ -380,55 +1143,122 @@ async def delete_snap(kind: str, snap_id: str):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid snap id")
 
-    res = col.delete_one({"_id": oid})
-    if res.deleted_count == 0:
+    deleted = await db_pool.run(delete_snap_doc, col, oid)
+    if not deleted:
         raise HTTPException(status_code=404, detail="Not found")
+    image_cache.invalidate(lambda key: key[0] == snap_id)
 
     return {"status": "deleted"}
 
+def snap_image_version(doc: dict, size: str) -> str:
+    """
+    Blob the served bytes come from. Compaction (dedupe) and cold tiering
+    repoint a snapshot at another blob, so this goes into the ETag and the
+    image cache key rather than the snapshot id alone.
+    """
+    if size == "thumb" and doc.get("thumb_blob"):
+        return doc["thumb_blob"]
+    # Thumbnails generated on request derive from the full image
+    return doc.get("image_blob") or "embedded"
+
+def load_snap_bytes(col, oid, size: str, doc: dict = None):
+    """
+    Returns (found, jpeg_bytes) for the full image or its thumbnail.
+    Thumbnails missing on older snapshots are generated once and stored.
+    `doc` is the snapshot's SNAP_BLOB_PROJECTION, when already fetched.
+    """
+    if doc is None:
+        doc = col.find_one({"_id": oid}, SNAP_BLOB_PROJECTION)
+    if doc is None:
+        return False, None
+
+    if size == "thumb" and doc.get("thumb_blob"):
+        store = blob_stores.get(doc.get("thumb_store") or doc.get("image_store"))
+        if store is not None:
+            data = store.get(doc["thumb_blob"])
+            if data:
+                return True, data
+
+    if not doc.get("image_blob"):
+        doc = col.find_one({"_id": oid})
+    full = load_snap_image(doc)
+    if size == "full" or not full:
+        return True, full
+
+    thumb = thumbnail_from_jpeg(full)
+    if thumb is None:
+        return True, full
+    store = blob_stores.get(SNAPSHOT_BLOB_STORE)
+    if store is not None:
+        try:
+            col.update_one(
+                {"_id": oid},
+                {"$set": {"thumb_blob": store.put(thumb), "thumb_store": store.name}},
+            )
+        except Exception as e:
+            log.warning("Could not store thumbnail for %s: %s", oid, e)
+    return True, thumb
+
 @app.get("/snap_image/{kind}/{snap_id}")
-async def snap_image(kind: str, snap_id: str):
-    if client is None or db is None:
+async def snap_image(kind: str, snap_id: str, request: Request, size: str = "full"):
+    if await require_db() is None:
         raise HTTPException(status_code=500, detail="DB not available")
 
     col = get_snap_collection(kind)
     if col is None:
         raise HTTPException(status_code=400, detail="Invalid kind")
 
+    if size not in ("thumb", "full"):
+        raise HTTPException(status_code=400, detail="size must be 'thumb' or 'full'")
+
     try:
         oid = ObjectId(snap_id)
     except Exception as e:
-        print(f"[ERROR] Invalid ObjectId: {snap_id}, error: {e}")
+        log.error("Invalid ObjectId: %s, error: %s", snap_id, e)
         raise HTTPException(status_code=400, detail="Invalid snap id")
 
-    doc = col.find_one({"_id": oid})
-    if not doc:
-        print(f"[ERROR] Document not found for ID: {snap_id}")
+    # Small indexed lookup: which blob currently backs this snapshot
+    doc = await db_pool.run(col.find_one, {"_id": oid}, SNAP_BLOB_PROJECTION)
+    if doc is None:
+        log.error("Document not found for ID: %s", snap_id)
         raise HTTPException(status_code=404, detail="Not found")
+    version = snap_image_version(doc, size)
+
+    etag = f'"{snap_id}-{size}-{version}"'
+    headers = {"ETag": etag, "Cache-Control": IMAGE_CACHE_CONTROL}
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    cache_key = (snap_id, size, version)
+    img_bytes = image_cache.get(cache_key)
+    if img_bytes is None:
+        found, img_bytes = await db_pool.run(load_snap_bytes, col, oid, size, doc)
+        if not found:
+            log.error("Document not found for ID: %s", snap_id)
+            raise HTTPException(status_code=404, detail="Not found")
+        if not img_bytes:
+            log.error("Image data missing for snap %s.", snap_id)
+            raise HTTPException(status_code=500, detail="Image missing")
+        image_cache.put(cache_key, img_bytes)
+
+    return Response(content=img_bytes, media_type="image/jpeg", headers=headers)
+
+def reencode_image(img_bytes: bytes, pil_fmt: str) -> bytes:
+    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+    buf = io.BytesIO()
+    img.save(buf, format=pil_fmt)
+    return buf.getvalue()
 
-    # Check for different possible image field names (support both old and new format)
-    img_data = doc.get("image_bytes") or doc.get("image_base64") or doc.get("image") or doc.get("img")
-    
-    if not img_data:
-        print(f"[ERROR] Image data missing for snap {snap_id}. Document keys: {list(doc.keys())}")
-        raise HTTPException(status_code=500, detail="Image missing")
-
-    # Handle both binary and base64 encoded images
-    if isinstance(img_data, str):
-        import base64
-        try:
-            img_bytes = base64.b64decode(img_data)
-        except Exception as e:
-            print(f"[ERROR] Failed to decode base64 image: {e}")
-            raise HTTPException(status_code=500, detail="Image decoding failed")
-    else:
-        img_bytes = img_data
-
-    return Response(content=img_bytes, media_type="image/jpeg")
+def stored_image_format(img_bytes: bytes) -> str:
+    if img_bytes[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if img_bytes[:8] == b"\x89PNG\r\n\x1a\n":
+        return "png"
+    return "unknown"
 
 @app.get("/download/{kind}/{snap_id}")
 async def download_snap(kind: str, snap_id: str, fmt: str = "jpg"):
-    if client is None or db is None:
+    if await require_db() is None:
         raise HTTPException(status_code=500, detail="DB not available")
 
     col = get_snap_collection(kind)
@@ -440,31 +1270,145 @@ async def download_snap(kind: str, snap_id: str, fmt: str = "jpg"):
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid snap id")
 
-    doc = col.find_one({"_id": oid})
-    if not doc:
-        raise HTTPException(status_code=404, detail="Not found")
-
-    img_bytes = doc.get("image_bytes")
-    if not img_bytes:
-        raise HTTPException(status_code=500, detail="Image missing")
-
-    img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
-
     fmt = fmt.lower()
     if fmt not in ("jpg", "jpeg", "png"):
         fmt = "jpg"
+    out_fmt = "png" if fmt == "png" else "jpg"
 
-    buf = io.BytesIO()
-    pil_fmt = "JPEG" if fmt in ("jpg", "jpeg") else "PNG"
-    img.save(buf, format=pil_fmt)
-    buf.seek(0)
+    doc = await db_pool.run(col.find_one, {"_id": oid}, SNAP_BLOB_PROJECTION)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    version = snap_image_version(doc, "full")
+
+    # Converted images are cached separately from the stored bytes
+    data = image_cache.get((snap_id, out_fmt, version))
+    if data is None:
+        img_bytes = image_cache.get((snap_id, "full", version))
+        if img_bytes is None:
+            found, img_bytes = await db_pool.run(load_snap_bytes, col, oid, "full", doc)
+            if not found:
+                raise HTTPException(status_code=404, detail="Not found")
+            if not img_bytes:
+                raise HTTPException(status_code=500, detail="Image missing")
+            image_cache.put((snap_id, "full", version), img_bytes)
+
+        if stored_image_format(img_bytes) == out_fmt:
+            # Same format as stored: send the original bytes, no decode/re-encode
+            data = img_bytes
+        else:
+            pil_fmt = "JPEG" if out_fmt == "jpg" else "PNG"
+            data = await codec_pool.run(reencode_image, img_bytes, pil_fmt)
+            image_cache.put((snap_id, out_fmt, version), data)
 
-    media_type = "image/jpeg" if pil_fmt == "JPEG" else "image/png"
+    media_type = "image/jpeg" if out_fmt == "jpg" else "image/png"
     filename = f"snapshot_{snap_id}.{fmt}"
     headers = {
         "Content-Disposition": f'attachment; filename=\"{filename}\"'
     }
-    return Response(content=buf.read(), media_type=media_type, headers=headers)
+    return Response(content=data, media_type=media_type, headers=headers)
+
+# ─────────────────────────────────────────────
+# Bulk export
+# ─────────────────────────────────────────────
+EXPORT_PROJECTION = {
+    "label": 1,
+    "confidence": 1,
+    "camera_index": 1,
+    "created_at": 1,
+    "timestamp": 1,
+    **SNAP_BLOB_PROJECTION,
+}
+
+class ZipStreamBuffer(io.RawIOBase):
+    """
+    Non-seekable sink for zipfile; collects written bytes until drained,
+    so the archive can be streamed entry by entry.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def gen_snapshot_zip(kinds, query: dict, limit: int = 0):
+    """
+    Yields a ZIP archive of snapshot images plus a metadata.csv, one
+    entry at a time. JPEGs are stored uncompressed (already compressed).
+    """
+    sink = ZipStreamBuffer()
+    manifest = io.StringIO()
+    writer = csv.writer(manifest)
+    writer.writerow(["kind", "id", "label", "confidence", "camera_index", "created_at", "file"])
+
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as zf:
+        for kind in kinds:
+            col = get_snap_collection(kind)
+            docs = col.find(query, EXPORT_PROJECTION).sort([("created_at", 1), ("_id", 1)])
+            if limit:
+                docs = docs.limit(limit)
+            for d in docs:
+                img_bytes = load_snap_image(d) if d.get("image_blob") else load_snap_image(col.find_one({"_id": d["_id"]}))
+                if not img_bytes:
+                    continue
+                created = d.get("created_at") or d.get("timestamp") or ""
+                ext = stored_image_format(img_bytes)
+                name = f"{kind}/{created.replace(':', '-')}_{d['_id']}.{ext if ext != 'unknown' else 'bin'}"
+                zf.writestr(name, img_bytes)
+                writer.writerow([kind, str(d["_id"]), d.get("label"), d.get("confidence"),
+                                 d.get("camera_index"), created, name])
+                yield sink.drain()
+        zf.writestr("metadata.csv", manifest.getvalue())
+    yield sink.drain()
+
+@app.get("/export")
+async def export_snaps(
+    kind: str = "all",
+    limit: int = 0,
+    min_conf: float = None,
+    max_conf: float = None,
+    since: str = Query(None, alias="from"),
+    until: str = Query(None, alias="to"),
+):
+    if await require_db() is None:
+        raise HTTPException(status_code=500, detail="DB not available")
+
+    if kind == "all":
+        kinds = ["wssv", "healthy"]
+    elif get_snap_collection(kind) is not None:
+        kinds = [kind]
+    else:
+        raise HTTPException(status_code=400, detail="Invalid kind")
+
+    try:
+        since = parse_iso_utc(since) if since else None
+        until = parse_iso_utc(until) if until else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid from/to timestamp")
+
+    query = build_snap_query(None, min_conf, max_conf, since, until)
+    filename = f"crustascope_{kind}_{datetime.utcnow().strftime('%Y%m%d_%H%M%S')}.zip"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    # Sync generator: Starlette iterates it in a worker thread, off the event loop
+    return StreamingResponse(
+        gen_snapshot_zip(kinds, query, max(0, limit)),
+        media_type="application/zip",
+        headers=headers,
+    )
 
 # ─────────────────────────────────────────────
 # Upload test
@@ -473,21 +1417,132 @@ async def download_snap(kind: str, snap_id: str, fmt: str = "jpg"):
 async def upload_test(file: UploadFile = File(...)):
     contents = await file.read()
     img_array = np.frombuffer(contents, np.uint8)
-    img = cv2.imdecode(img_array, cv2.IMREAD_COLOR)
+    img = await codec_pool.run(cv2.imdecode, img_array, cv2.IMREAD_COLOR)
     if img is None:
         raise HTTPException(status_code=400, detail="Invalid image")
 
-    conf = predict_image(img)
+    conf = await inference_pool.run(predict_image, img)
     label = classify_label(conf)
 
     if label in ("WSSV DETECTED", "Healthy Shrimp"):
-        save_snapshot(label, conf, img)
+        await db_pool.run(save_snapshot, label, conf, img)
 
     return {
         "label": label,
         "confidence": conf,
     }
 
+# ─────────────────────────────────────────────
+# Offline batch scoring
+# ─────────────────────────────────────────────
+batch_jobs = JobRegistry()
+
+def score_batch(sources):
+    return score_sources(
+        sources, batch_pool, inference_pool, engine.predict_batch,
+        batch_size=INFERENCE_MAX_BATCH,
+    )
+
+async def gen_batch_ndjson(sources):
+    async for result in score_batch(sources):
+        yield json.dumps(result) + "\n"
+
+async def run_batch_job(job: BatchJob, sources):
+    job.status = "running"
+    try:
+        async for result in score_batch(sources):
+            job.add(result)
+    except asyncio.CancelledError:
+        job.finish("cancelled")
+        raise
+    except Exception as e:
+        log.error("Batch job %s failed: %s", job.id, e)
+        job.finish("failed", str(e))
+        return
+    job.finish("done")
+    log.info("Batch job %s finished: %d images.", job.id, job.done)
+
+@app.post("/batch_predict")
+async def batch_predict(files: List[UploadFile] = File(...), background: bool = False):
+    """
+    Score many images (or ZIP archives of images) without saving snapshots.
+    Streams NDJSON results, or with ?background=true returns a job id
+    to poll at /jobs/{id}.
+    """
+    uploads = [(f.filename, f.file) for f in files]
+
+    # Uploads are closed once the handler returns, before a streamed body or
+    # a background job has read them, so both work on a copy
+    workdir, staged = await batch_pool.run(stage_uploads, uploads)
+
+    if not background:
+        staged_files = [f for _, f in staged]
+        try:
+            sources = await batch_pool.run(expand_sources, staged)
+        except (ValueError, zipfile.BadZipFile) as e:
+            release_staged(workdir, staged_files)
+            raise HTTPException(status_code=400, detail=str(e))
+        # Runs after the stream ends, including when the client disconnects
+        cleanup = BackgroundTask(release_staged, workdir, staged_files)
+        return StreamingResponse(gen_batch_ndjson(sources), media_type="application/x-ndjson",
+                                 background=cleanup)
+
+    job = BatchJob(0, workdir, [f for _, f in staged])
+    try:
+        sources = await batch_pool.run(expand_sources, staged)
+    except (ValueError, zipfile.BadZipFile) as e:
+        job.finish("failed", str(e))
+        raise HTTPException(status_code=400, detail=str(e))
+    job.total = len(sources)
+    batch_jobs.add(job)
+    job.task = asyncio.create_task(run_batch_job(job, sources))
+    # A task cancelled before its first step never reaches run_batch_job's handler
+    job.task.add_done_callback(lambda _t: job.finished_at is None and job.finish("cancelled"))
+    return JSONResponse(status_code=202, content={
+        "job_id": job.id,
+        "total": job.total,
+        "status_url": f"/jobs/{job.id}",
+    })
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.summary()
+
+@app.get("/jobs/{job_id}/results")
+async def get_job_results(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    # Results so far; complete once status is "done"
+    results = list(job.results)
+    return StreamingResponse(
+        (json.dumps(r) + "\n" for r in results),
+        media_type="application/x-ndjson",
+    )
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job.task is not None and not job.task.done():
+        job.task.cancel()
+    return {"id": job.id, "status": "cancelling" if job.finished_at is None else job.status}
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run("app:app", host="0.0.0.0", port=8000)
+
+    parser = argparse.ArgumentParser(description="CrustaScope backend")
+    parser.add_argument("--simulate", action="store_true",
+                        help="synthetic cameras and video-file replay instead of real devices")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    if args.simulate:
+        # Exported so the "app:app" import below picks it up too
+        hal.enable_simulation()
+    uvicorn.run("app:app", host=args.host, port=args.port)
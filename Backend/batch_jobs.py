@@ -0,0 +1,232 @@
+import os
+import time
+import uuid
+import shutil
+import asyncio
+import zipfile
+import tempfile
+
+import cv2
+import numpy as np
+
+from executors import ExecutorBusy
+from inference import classify_label
+from log_config import get_logger
+
+log = get_logger("batch")
+
+
+# ─────────────────────────────────────────────
+# Offline batch scoring
+# ─────────────────────────────────────────────
+BATCH_JOB_DIR = os.getenv("BATCH_JOB_DIR", tempfile.gettempdir())
+BATCH_MAX_IMAGES = int(os.getenv("BATCH_MAX_IMAGES", "10000"))
+# Finished jobs kept for /jobs/{id} before the oldest are forgotten
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "50"))
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+
+
+def is_zip_name(name: str) -> bool:
+    return (name or "").lower().endswith(".zip")
+
+
+def is_image_name(name: str) -> bool:
+    return (name or "").lower().endswith(IMAGE_EXTS)
+
+
+def expand_sources(files):
+    """
+    files: [(name, fileobj)] with seekable file objects. Returns
+    [(name, read_fn)], expanding ZIP archives into their image entries.
+    Blocking; run in a worker pool.
+    """
+    sources = []
+    for name, fileobj in files:
+        if is_zip_name(name):
+            fileobj.seek(0)
+            zf = zipfile.ZipFile(fileobj)
+            for info in zf.infolist():
+                if info.is_dir() or info.filename.startswith("__MACOSX/"):
+                    continue
+                if not is_image_name(info.filename):
+                    continue
+                sources.append((f"{name}/{info.filename}", lambda zf=zf, info=info: zf.read(info)))
+        else:
+            def read(fileobj=fileobj):
+                fileobj.seek(0)
+                return fileobj.read()
+            sources.append((name, read))
+        if len(sources) > BATCH_MAX_IMAGES:
+            raise ValueError(f"At most {BATCH_MAX_IMAGES} images per batch")
+    return sources
+
+
+def stage_uploads(uploads, root: str = BATCH_JOB_DIR):
+    """
+    Copy uploads to a private directory so a background job can outlive
+    the request. uploads: [(name, fileobj)]. Returns (workdir, [(name, fileobj)]).
+    """
+    workdir = tempfile.mkdtemp(prefix="batch_", dir=root)
+    files = []
+    try:
+        for i, (name, src) in enumerate(uploads):
+            path = os.path.join(workdir, str(i))
+            src.seek(0)
+            with open(path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+            files.append((name, open(path, "rb")))
+    except Exception:
+        for _, f in files:
+            f.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+        raise
+    return workdir, files
+
+
+def release_staged(workdir: str, files):
+    """Closes the file objects from stage_uploads and deletes its directory."""
+    for f in files:
+        f.close()
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def decode_source(read_fn):
+    data = read_fn()
+    img = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    return img
+
+
+async def _run_retrying(pool, fn, *args):
+    # Offline work backs off instead of failing when a pool is saturated
+    while True:
+        try:
+            return await pool.run(fn, *args)
+        except ExecutorBusy:
+            await asyncio.sleep(0.1)
+
+
+async def _decode_chunk(pool, chunk):
+    results = await asyncio.gather(
+        *(_run_retrying(pool, decode_source, read_fn) for _, read_fn in chunk),
+        return_exceptions=True,
+    )
+    return [(name, r) for (name, _), r in zip(chunk, results)]
+
+
+async def score_sources(sources, decode_pool, infer_pool, predict_batch, batch_size: int = 8):
+    """
+    Async generator of result dicts, one per source, in input order.
+    Decoding of the next chunk overlaps inference of the current one.
+    """
+    chunks = [sources[i:i + batch_size] for i in range(0, len(sources), batch_size)]
+    if not chunks:
+        return
+
+    pending = asyncio.ensure_future(_decode_chunk(decode_pool, chunks[0]))
+    try:
+        for i in range(len(chunks)):
+            decoded = await pending
+            if i + 1 < len(chunks):
+                pending = asyncio.ensure_future(_decode_chunk(decode_pool, chunks[i + 1]))
+
+            out = [None] * len(decoded)
+            frames, slots = [], []
+            for k, (name, img) in enumerate(decoded):
+                if isinstance(img, Exception) or img is None:
+                    out[k] = {"name": name, "error": "Invalid image"}
+                else:
+                    frames.append(img)
+                    slots.append(k)
+
+            if frames:
+                try:
+                    confs = await _run_retrying(infer_pool, predict_batch, frames)
+                except Exception as e:
+                    log.error("Batch inference failed: %s", e)
+                    confs = None
+                for j, k in enumerate(slots):
+                    name = decoded[k][0]
+                    if confs is None:
+                        out[k] = {"name": name, "error": "Inference failed"}
+                    else:
+                        conf = float(confs[j])
+                        out[k] = {"name": name, "label": classify_label(conf), "confidence": conf}
+
+            for r in out:
+                yield r
+    finally:
+        if not pending.done():
+            pending.cancel()
+
+
+# ─────────────────────────────────────────────
+# Background jobs
+# ─────────────────────────────────────────────
+class BatchJob:
+    def __init__(self, total: int, workdir: str = None, files=()):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.workdir = workdir
+        self.files = list(files)
+        self.status = "queued"
+        self.done = 0
+        self.errors = 0
+        self.counts = {}
+        self.results = []
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.task = None
+
+    def add(self, result: dict):
+        self.results.append(result)
+        self.done += 1
+        if "error" in result:
+            self.errors += 1
+        else:
+            self.counts[result["label"]] = self.counts.get(result["label"], 0) + 1
+
+    def finish(self, status: str, error: str = None):
+        self.status = status
+        self.error = error
+        self.finished_at = time.time()
+        release_staged(self.workdir, self.files)
+        self.files = []
+        self.workdir = None
+
+    def summary(self) -> dict:
+        elapsed = (self.finished_at or time.time()) - self.created_at
+        return {
+            "id": self.id,
+            "status": self.status,
+            "total": self.total,
+            "done": self.done,
+            "errors": self.errors,
+            "progress": round(self.done / self.total, 4) if self.total else 1.0,
+            "counts": self.counts,
+            "elapsed_seconds": round(elapsed, 2),
+            "error": self.error,
+        }
+
+
+class JobRegistry:
+    def __init__(self, max_jobs: int = BATCH_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.jobs = {}
+
+    def add(self, job: BatchJob):
+        self.jobs[job.id] = job
+        finished = [j for j in self.jobs.values() if j.finished_at is not None]
+        finished.sort(key=lambda j: j.finished_at)
+        while len(self.jobs) > self.max_jobs and finished:
+            self.jobs.pop(finished.pop(0).id, None)
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    def cancel_all(self):
+        for job in self.jobs.values():
+            if job.task is not None and not job.task.done():
+                job.task.cancel()
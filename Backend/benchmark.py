@@ -0,0 +1,515 @@
+"""
+End-to-end performance benchmark for the inference and streaming pipeline.
+
+    python benchmark.py --output pi4.json
+    python benchmark.py --video clip.mp4 --mongo mongodb://localhost:27017
+    python benchmark.py --compare pi4.json --threshold 0.1
+
+Runs against synthetic frames (or a recorded video) and a local mongod,
+or mongomock when no URI is given. Snapshot data goes to a throwaway
+database that is dropped afterwards. Results are written as JSON; with
+--compare, latencies and throughputs are checked against a previous run
+and the exit status is 1 when any of them regressed past the threshold.
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import logging
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+# app.py must not connect to the real database or open real cameras
+os.environ["MONGODB_URI"] = ""
+os.environ.setdefault("SIMULATE", "1")
+
+import hal
+import app
+from log_config import get_logger
+from bson import ObjectId
+from camera_manager import CameraManager
+from frame_gate import make_gate
+from image_cache import ByteLRUCache
+from jpeg_codec import stream_encoder, snapshot_encoder
+from snapshot_writer import SnapshotWriter, LocalBlobStore, make_thumbnail
+from tiling import TiledPredictor
+
+
+BENCH_DB_NAME = "crustascope_bench"
+
+log = get_logger("benchmark")
+
+
+# ─────────────────────────────────────────────
+# Helpers
+# ─────────────────────────────────────────────
+def summarize(samples_s) -> dict:
+    """Latency samples (seconds) -> stats in milliseconds."""
+    x = np.asarray(samples_s, dtype=np.float64) * 1000.0
+    if x.size == 0:
+        return {"n": 0}
+    return {
+        "n": int(x.size),
+        "mean_ms": round(float(x.mean()), 3),
+        "p50_ms": round(float(np.percentile(x, 50)), 3),
+        "p90_ms": round(float(np.percentile(x, 90)), 3),
+        "p99_ms": round(float(np.percentile(x, 99)), 3),
+        "max_ms": round(float(x.max()), 3),
+    }
+
+
+def time_calls(fn, iterations: int, warmup: int = 3) -> dict:
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return summarize(samples)
+
+
+def open_source(args, unpaced: bool = True):
+    fps = 0 if unpaced else args.fps
+    if args.video:
+        return hal.VideoFileSource(args.video, fps=fps)
+    return hal.SyntheticFrameSource(width=args.width, height=args.height, fps=fps)
+
+
+def sample_frames(args, n: int = 32):
+    source = open_source(args)
+    frames = []
+    while len(frames) < n:
+        ok, frame = source.read()
+        if not ok:
+            break
+        frames.append(frame)
+    source.release()
+    if not frames:
+        raise SystemExit("[ERROR] Could not read any frames from the source.")
+    return frames
+
+
+def open_bench_db(uri: str):
+    if uri:
+        import pymongo
+        client = pymongo.MongoClient(uri, serverSelectionTimeoutMS=5000)
+        client.admin.command("ping")
+        return client, "mongod"
+    try:
+        import mongomock
+    except ImportError:
+        raise SystemExit("[ERROR] Pass --mongo URI or install mongomock.")
+    return mongomock.MongoClient(), "mongomock"
+
+
+# ─────────────────────────────────────────────
+# Stage timings
+# ─────────────────────────────────────────────
+def bench_stages(args, frames) -> dict:
+    engine = app.engine
+    frame_iter = iter(frames * (args.iterations // len(frames) + 4))
+    results = {}
+
+    with engine.reserved(1) as (backend, buf):
+        def preprocess():
+            engine.preprocess_into(next(frame_iter), buf[0])
+            buf[0] *= np.float32(1.0 / 255.0)
+
+        results["preprocess"] = time_calls(preprocess, args.iterations)
+
+        def invoke():
+            backend.set_input(buf)
+            backend.invoke()
+            backend.get_output()
+
+        results["invoke"] = time_calls(invoke, args.iterations)
+
+    results["predict"] = time_calls(lambda: engine.predict(next(frame_iter)), args.iterations)
+    # Whole frame + up to TILE_MAX tiles in one batch, whether or not the app has tiling on
+    tiler = TiledPredictor(engine.predict_batch)
+    tiled = tiler.predict_batch([frames[0]])[1][0]
+    results["predict_tiled"] = time_calls(lambda: tiler.predict_batch([next(frame_iter)]),
+                                          args.iterations)
+
+    result = {"label": "WSSV DETECTED", "confidence": 0.91}
+    stream_frames = [stream_encoder.downscale(f) for f in frames]
+    frame_iter = iter(stream_frames * (args.iterations // len(stream_frames) + 4))
+    results["overlay"] = time_calls(lambda: app.draw_overlay(next(frame_iter).copy(), result),
+                                    args.iterations)
+    # Steady state: the heatmap layer is cached per result, as in the stream
+    tiled_result = dict(result, tiles=tiled)
+    results["overlay_heatmap"] = time_calls(
+        lambda: app.draw_overlay(next(frame_iter).copy(), tiled_result), args.iterations)
+    results["imencode_stream"] = time_calls(lambda: stream_encoder.encode(next(frame_iter)),
+                                            args.iterations)
+    frame_iter = iter(frames * (args.iterations // len(frames) + 4))
+    results["imencode_snapshot"] = time_calls(lambda: snapshot_encoder.encode_frame(next(frame_iter)),
+                                              args.iterations)
+    results["thumbnail"] = time_calls(lambda: make_thumbnail(next(frame_iter)), args.iterations)
+    return results
+
+
+def bench_snapshot_persist(args, frames, db, blob_dir) -> dict:
+    col = db["bench_persist"]
+    writer = SnapshotWriter(
+        lambda kind: col,
+        LocalBlobStore(blob_dir),
+        spool_dir=os.path.join(blob_dir, "spool"),
+        encode=snapshot_encoder.encode_frame,
+    )
+    frame_iter = iter(frames * (args.snap_iterations // len(frames) + 4))
+    prepared = []
+
+    def prepare():
+        doc = {"_id": ObjectId(), "kind": "wssv", "label": "WSSV DETECTED", "confidence": 0.9,
+               "created_at": datetime.utcnow().isoformat()}
+        prepared.append(writer.prepare("wssv", doc, next(frame_iter)))
+
+    def write():
+        writer.write([prepared.pop()])
+
+    # Warm-up included, so there is one prepared snapshot per write() call
+    results = {"encode": time_calls(prepare, args.snap_iterations)}
+    # Silence the per-write "Saved 1 snapshot" line while timing
+    writer_log = get_logger("snapshots")
+    level = writer_log.level
+    writer_log.setLevel(logging.WARNING)
+    try:
+        results["write"] = time_calls(write, args.snap_iterations, warmup=3)
+    finally:
+        writer_log.setLevel(level)
+    col.drop()
+    return results
+
+
+# ─────────────────────────────────────────────
+# End-to-end pipeline
+# ─────────────────────────────────────────────
+class FrameClock:
+    """Grab timestamps of frames still in flight, keyed by array identity."""
+
+    def __init__(self, source, max_pending: int = 256):
+        self.source = source
+        self.max_pending = max_pending
+        self.pending = OrderedDict()
+        self._lock = threading.Lock()
+
+    def read(self):
+        ok, frame = self.source.read()
+        if ok:
+            with self._lock:
+                self.pending[id(frame)] = (weakref.ref(frame), time.perf_counter())
+                while len(self.pending) > self.max_pending:
+                    self.pending.popitem(last=False)
+        return ok, frame
+
+    def done(self, frame):
+        with self._lock:
+            entry = self.pending.pop(id(frame), None)
+        if entry is None or entry[0]() is not frame:
+            return None
+        return time.perf_counter() - entry[1]
+
+    def __getattr__(self, name):
+        return getattr(self.source, name)
+
+
+def bench_pipeline(args) -> dict:
+    clock = {}
+    latencies = []
+
+    def open_capture(source):
+        clock["c"] = FrameClock(open_source(args, unpaced=not args.fps))
+        return clock["c"]
+
+    def handle_result(cam_id, frame, conf, tiles=None):
+        latency = clock["c"].done(frame)
+        if latency is not None:
+            latencies.append(latency)
+        return {"label": "Benchmark", "confidence": float(conf), "tiles": tiles}
+
+    manager = CameraManager(
+        open_capture=open_capture,
+        encode_fn=app.encode_frame,
+        handle_result=handle_result,
+        predict_batch=app.predict_frames,
+        max_cameras=1,
+        make_gate=make_gate if args.gate else None,
+        prepare_fn=stream_encoder.downscale,
+        stream_quality=stream_encoder.quality,
+        stream_encode=stream_encoder.encode_frame,
+    )
+    manager.start(0, 0)
+    session = manager.get(0)
+    subscriber = session.broadcaster.subscribe()
+    time.sleep(min(2.0, args.duration / 4))  # warm-up
+    start = manager.stats()["cameras"]["0"]
+    latencies.clear()
+    t0 = time.perf_counter()
+    time.sleep(args.duration)
+    elapsed = time.perf_counter() - t0
+    end = manager.stats()["cameras"]["0"]
+    session.broadcaster.unsubscribe(subscriber)
+    manager.stop_all()
+    manager.worker.stop()
+
+    def rate(key):
+        return round((end.get(key, 0) - start.get(key, 0)) / elapsed, 2)
+
+    return {
+        "duration_s": round(elapsed, 2),
+        "source_fps": args.fps or None,
+        "gate": bool(args.gate),
+        "grabbed_fps": rate("frames_grabbed"),
+        "inferred_fps": rate("frames_inferred"),
+        "encoded_fps": rate("frames_encoded"),
+        "latency": summarize(latencies),
+    }
+
+
+# ─────────────────────────────────────────────
+# Gallery endpoints
+# ─────────────────────────────────────────────
+def seed_snaps(col, blob_store, jpeg: bytes, thumb: bytes, count: int):
+    """Top the collection up to `count` documents sharing one image."""
+    blob_id = blob_store.put(jpeg)
+    thumb_id = blob_store.put(thumb)
+    have = col.estimated_document_count()
+    base = datetime.utcnow() - timedelta(days=30)
+    batch = []
+    for i in range(have, count):
+        created = base + timedelta(seconds=i * 2)
+        batch.append({
+            "_id": ObjectId(),
+            "kind": "wssv",
+            "label": "WSSV DETECTED",
+            "confidence": round(random.uniform(0.7, 1.0), 4),
+            "camera_index": i % 2,
+            "created_at": created.isoformat(),
+            "image_format": "jpg",
+            "image_blob": blob_id,
+            "image_store": blob_store.name,
+            "image_size": len(jpeg),
+            "thumb_blob": thumb_id,
+            "thumb_store": blob_store.name,
+            "sensor_at_capture": {"temperature_c": 27.1, "ph": 7.6, "turbidity": 12.0, "tds": 310.0},
+        })
+        if len(batch) == 5000:
+            col.insert_many(batch, ordered=False)
+            batch = []
+    if batch:
+        col.insert_many(batch, ordered=False)
+
+
+def bench_snaps(args, frames, db, blob_dir) -> dict:
+    from fastapi.testclient import TestClient
+
+    col = db["wssv_snaps"]
+    store = LocalBlobStore(blob_dir)
+    app.client, app.db = db.client, db
+    app.snaps_wssv, app.snaps_healthy = col, db["healthy_snaps"]
+    app.blob_stores = {"local": store}
+    app.ensure_snap_indexes()
+    http = TestClient(app.app)
+    jpeg = snapshot_encoder.encode_frame(frames[0])
+    thumb = make_thumbnail(frames[0])
+
+    results = {}
+    cache = app.image_cache
+    for count in sorted(args.snap_counts):
+        t0 = time.perf_counter()
+        seed_snaps(col, store, jpeg, thumb, count)
+        log.info("Seeded %d snapshots in %.1fs.", count, time.perf_counter() - t0)
+        ids = [str(d["_id"]) for d in col.aggregate([{"$sample": {"size": 200}}, {"$project": {"_id": 1}}])]
+        n = args.http_iterations
+        level = {}
+
+        level["snaps_first_page"] = time_calls(
+            lambda: http.get("/snaps", params={"kind": "wssv"}).raise_for_status(), n)
+
+        # Walk a few pages deep, timing each page request
+        pages = []
+        before = None
+        for _ in range(min(n, 20)):
+            params = {"kind": "wssv", "limit": 100}
+            if before:
+                params["before"] = before
+            t = time.perf_counter()
+            body = http.get("/snaps", params=params).json()
+            pages.append(time.perf_counter() - t)
+            before = body.get("next_before")
+            if not before:
+                break
+        level["snaps_paged"] = summarize(pages)
+
+        level["snaps_filtered"] = time_calls(
+            lambda: http.get("/snaps", params={"kind": "wssv", "min_conf": 0.95}).raise_for_status(), n)
+
+        # Cold: image cache disabled, every request goes to the DB and blob store
+        app.image_cache = ByteLRUCache(0)
+        for size in ("thumb", "full"):
+            level[f"snap_image_{size}_cold"] = time_calls(
+                lambda: http.get(f"/snap_image/wssv/{random.choice(ids)}",
+                                 params={"size": size}).raise_for_status(), n)
+        app.image_cache = cache
+        level["snap_image_full_cached"] = time_calls(
+            lambda: http.get(f"/snap_image/wssv/{ids[0]}").raise_for_status(), n)
+        results[str(count)] = level
+    return results
+
+
+# ─────────────────────────────────────────────
+# Regression comparison
+# ─────────────────────────────────────────────
+# Only these leaves are compared; counts and settings are context
+LOWER_IS_BETTER = ("mean_ms", "p50_ms", "p99_ms")
+HIGHER_IS_BETTER = ("inferred_fps", "encoded_fps", "grabbed_fps")
+
+
+def flatten(tree: dict, prefix: str = "") -> dict:
+    out = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if isinstance(value, dict):
+            out.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            out[path] = value
+    return out
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_delta_ms: float = 0.0) -> dict:
+    cur = flatten(current.get("results", {}))
+    base = flatten(baseline.get("results", {}))
+    regressions, improvements = [], []
+    for path, new in sorted(cur.items()):
+        old = base.get(path)
+        leaf = path.rsplit(".", 1)[-1]
+        if old is None or old <= 0 or (leaf not in LOWER_IS_BETTER and leaf not in HIGHER_IS_BETTER):
+            continue
+        if leaf in LOWER_IS_BETTER and abs(new - old) < min_delta_ms:
+            continue  # timer noise on very fast stages
+        change = (new - old) / old
+        worse = change > threshold if leaf in LOWER_IS_BETTER else change < -threshold
+        better = change < -threshold if leaf in LOWER_IS_BETTER else change > threshold
+        entry = {"metric": path, "baseline": old, "current": new, "change": round(change, 4)}
+        if worse:
+            regressions.append(entry)
+        elif better:
+            improvements.append(entry)
+    return {
+        "baseline": baseline.get("meta", {}),
+        "threshold": threshold,
+        "regressions": regressions,
+        "improvements": improvements,
+    }
+
+
+# ─────────────────────────────────────────────
+# Main
+# ─────────────────────────────────────────────
+def run_metadata(args, db_kind) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.utcnow().isoformat(),
+        "commit": commit or None,
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "model_path": app.engine.model_path,
+        "model_load_s": app.engine.load_seconds,
+        "inference_threads": app.engine.num_threads,
+        "jpeg_backend": stream_encoder.backend,
+        "source": args.video or f"synthetic {args.width}x{args.height}",
+        "database": db_kind,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--video", help="recorded video to use instead of synthetic frames")
+    parser.add_argument("--width", type=int, default=640)
+    parser.add_argument("--height", type=int, default=480)
+    parser.add_argument("--fps", type=float, default=0,
+                        help="pace the pipeline source (default: as fast as possible)")
+    parser.add_argument("--gate", action="store_true", help="enable the frame-change gate")
+    parser.add_argument("--duration", type=float, default=10.0, help="pipeline run time (s)")
+    parser.add_argument("--iterations", type=int, default=200, help="samples per stage")
+    parser.add_argument("--snap-iterations", type=int, default=50)
+    parser.add_argument("--http-iterations", type=int, default=50)
+    parser.add_argument("--snap-counts", default="1000,10000,100000",
+                        help="gallery sizes for /snaps and /snap_image")
+    parser.add_argument("--mongo", default=os.getenv("BENCH_MONGODB_URI"),
+                        help="local mongod URI (default: mongomock)")
+    parser.add_argument("--only", default="stages,persist,pipeline,snaps",
+                        help="comma-separated subset of stages,persist,pipeline,snaps")
+    parser.add_argument("--output", default="benchmark.json", help="results JSON file")
+    parser.add_argument("--compare", help="baseline results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative change counted as a regression (default 0.10)")
+    parser.add_argument("--min-delta-ms", type=float, default=0.1,
+                        help="ignore latency changes smaller than this (default 0.1 ms)")
+    args = parser.parse_args(argv)
+    args.snap_counts = [int(n) for n in args.snap_counts.split(",") if n.strip()]
+    only = {s.strip() for s in args.only.split(",")}
+
+    client, db_kind = open_bench_db(args.mongo) if only & {"persist", "snaps"} else (None, None)
+    db = client[BENCH_DB_NAME] if client is not None else None
+    blob_dir = tempfile.mkdtemp(prefix="crustascope-bench-")
+
+    frames = sample_frames(args)
+    # app loads the model lazily; load it up front so no stage pays for it
+    app.engine.load()
+    results = {}
+    try:
+        if "stages" in only:
+            log.info("Timing pipeline stages...")
+            results["stages"] = bench_stages(args, frames)
+        if "persist" in only:
+            log.info("Timing snapshot persistence...")
+            results["snapshot_persist"] = bench_snapshot_persist(args, frames, db, blob_dir)
+        if "pipeline" in only:
+            log.info("Running the camera pipeline for %gs...", args.duration)
+            results["pipeline"] = bench_pipeline(args)
+        if "snaps" in only:
+            log.info("Timing gallery endpoints...")
+            results["snaps"] = bench_snaps(args, frames, db, blob_dir)
+    finally:
+        if client is not None:
+            client.drop_database(BENCH_DB_NAME)
+        shutil.rmtree(blob_dir, ignore_errors=True)
+
+    report = {"meta": run_metadata(args, db_kind), "results": results}
+    status = 0
+    if args.compare:
+        with open(args.compare) as f:
+            report["comparison"] = compare(report, json.load(f), args.threshold, args.min_delta_ms)
+        for r in report["comparison"]["regressions"]:
+            log.warning("Regression: %s %s -> %s (%+.1f%%)", r["metric"], r["baseline"],
+                        r["current"], r["change"] * 100)
+        status = 1 if report["comparison"]["regressions"] else 0
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+        f.write("\n")
+    log.info("Results written to %s.", args.output)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import threading
+import time
+import itertools
+
+import cv2
+
+import metrics
+from log_config import get_logger
+from pipeline import LatestQueue
+
+log = get_logger("stream")
+
+_STREAM_SECONDS = metrics.STAGE_SECONDS.labels(stage="stream")
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+# ─────────────────────────────────────────────
+# Subscriber
+# ─────────────────────────────────────────────
+class Subscriber:
+    """
+    One MJPEG viewer. Holds a single-slot mailbox, so a slow client
+    simply skips frames instead of holding back the broadcaster.
+    """
+
+    def __init__(self, sub_id: int, fps: float = None, quality: int = None):
+        self.id = sub_id
+        self.fps = fps
+        self.quality = quality
+        self.min_interval = (1.0 / fps) if fps else 0.0
+        self.last_sent = 0.0
+        self.active = True
+        self.mailbox = LatestQueue(1)
+
+    @property
+    def dropped(self):
+        return self.mailbox.dropped
+
+    def get(self, timeout: float = 1.0):
+        return self.mailbox.get(timeout)
+
+    def close(self):
+        self.active = False
+        self.mailbox.clear()
+
+
+# ─────────────────────────────────────────────
+# Broadcaster
+# ─────────────────────────────────────────────
+class MJPEGBroadcaster:
+    """
+    Fans one stream of annotated frames out to N subscribers.
+
+    Each frame is JPEG-encoded once per distinct quality level in use,
+    so the cost stays flat no matter how many viewers share a setting.
+    """
+
+    QUALITY_STEP = 5
+
+    def __init__(self, max_subscribers: int = 8, default_quality: int = 95, encode=None):
+        # encode(frame, quality) -> bytes | None, for viewers asking for another quality
+        self.max_subscribers = max_subscribers
+        self.default_quality = default_quality
+        self.encode = encode
+        self._subs = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self.frames_published = 0
+        self.extra_encodes = 0
+        # Drops of viewers that already left, so dropped_total never goes down
+        self._departed_dropped = 0
+
+    def normalize_quality(self, quality):
+        if quality is None:
+            return None
+        q = int(round(int(quality) / self.QUALITY_STEP) * self.QUALITY_STEP)
+        q = max(10, min(95, q))
+        return None if q == self.default_quality else q
+
+    def subscribe(self, fps: float = None, quality: int = None) -> Subscriber:
+        with self._lock:
+            if len(self._subs) >= self.max_subscribers:
+                raise TooManySubscribers()
+            if fps is not None and fps <= 0:
+                fps = None
+            sub = Subscriber(next(self._ids), fps, self.normalize_quality(quality))
+            self._subs[sub.id] = sub
+        log.info("Stream subscriber %s joined (%d active).", sub.id, len(self._subs))
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        sub.close()
+        with self._lock:
+            if self._subs.pop(sub.id, None) is not None:
+                self._departed_dropped += sub.dropped
+            remaining = len(self._subs)
+        log.info("Stream subscriber %s left (%d active).", sub.id, remaining)
+
+    def close_all(self):
+        with self._lock:
+            subs = list(self._subs.values())
+        for sub in subs:
+            sub.close()
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subs)
+
+    def publish(self, frame, jpeg: bytes):
+        """
+        Called once per encoded frame by the pipeline encode stage.
+        `frame` is the annotated BGR frame, `jpeg` its default-quality encoding
+        (or the camera's own MJPEG frame in pass-through mode).
+        """
+        with self._lock:
+            subs = list(self._subs.values())
+        if not subs:
+            return
+
+        self.frames_published += 1
+        started = metrics.now()
+        now = time.monotonic()
+        encoded = {None: jpeg}
+
+        for sub in subs:
+            if not sub.active:
+                continue
+            if sub.min_interval and now - sub.last_sent < sub.min_interval:
+                continue
+
+            data = encoded.get(sub.quality)
+            if data is None:
+                if self.encode is not None:
+                    data = self.encode(frame, sub.quality)
+                else:
+                    ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, sub.quality])
+                    data = buf.tobytes() if ok else None
+                if data is None:
+                    continue
+                encoded[sub.quality] = data
+                self.extra_encodes += 1
+
+            sub.last_sent = now
+            sub.mailbox.put(data)
+        _STREAM_SECONDS.observe_since(started)
+
+    @property
+    def dropped_total(self):
+        """Frames skipped by slow viewers since start, including viewers that left."""
+        with self._lock:
+            return self._departed_dropped + sum(s.dropped for s in self._subs.values())
+
+    def stats(self):
+        with self._lock:
+            subs = list(self._subs.values())
+        return {
+            "subscribers": len(subs),
+            "max_subscribers": self.max_subscribers,
+            "frames_published": self.frames_published,
+            "extra_encodes": self.extra_encodes,
+            "dropped": {str(s.id): s.dropped for s in subs},
+        }
@@ -0,0 +1,293 @@
+import os
+import time
+import threading
+
+import metrics
+from log_config import get_logger
+from pipeline import FramePipeline
+from broadcaster import MJPEGBroadcaster
+
+log = get_logger("camera")
+
+_INFERENCE_SECONDS = metrics.STAGE_SECONDS.labels(stage="inference")
+BATCH_SIZE = metrics.histogram(
+    "inference_batch_size", "Frames per batched model invocation.", buckets=(1, 2, 3, 4, 6, 8, 12, 16)
+)
+# Minimum seconds between repeated inference-failure log lines (a model
+# that cannot load fails every batch, i.e. at frame rate)
+INFERENCE_ERROR_LOG_INTERVAL = float(os.getenv("INFERENCE_ERROR_LOG_INTERVAL", "30"))
+
+
+# ─────────────────────────────────────────────
+# Shared batched inference worker
+# ─────────────────────────────────────────────
+class BatchInferenceWorker:
+    """
+    One inference thread for every camera. Keeps only the newest frame per
+    camera and runs all pending frames through the model as one batch.
+    """
+
+    def __init__(self, predict_batch, on_result, name: str = "inference"):
+        # predict_batch(frames) -> confidences, or (confidences, per-frame details)
+        # on_result(cam_id, frame, conf, detail)
+        self.predict_batch = predict_batch
+        self.on_result = on_result
+        self.name = name
+        self._slots = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.running = False
+
+        self.batches = 0
+        self.frames = 0
+        self.dropped = 0
+        self.failures = 0
+        self._failures_unlogged = 0
+        self._failure_logged_at = None
+
+    def start(self):
+        with self._cond:
+            if self.running:
+                return
+            self.running = True
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0):
+        with self._cond:
+            self.running = False
+            self._slots.clear()
+            self._cond.notify_all()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self._thread = None
+
+    def submit(self, cam_id, frame):
+        with self._cond:
+            if cam_id in self._slots:
+                self.dropped += 1
+            self._slots[cam_id] = frame
+            self._cond.notify()
+
+    def discard(self, cam_id):
+        with self._cond:
+            self._slots.pop(cam_id, None)
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while self.running and not self._slots:
+                    self._cond.wait(0.5)
+                if not self.running:
+                    return
+                pending, self._slots = self._slots, {}
+
+            cam_ids = list(pending)
+            frames = [pending[c] for c in cam_ids]
+            started = metrics.now()
+            try:
+                out = self.predict_batch(frames)
+            except Exception as e:
+                self._log_failure(e)
+                continue
+            _INFERENCE_SECONDS.observe_since(started)
+            confs, details = out if isinstance(out, tuple) else (out, [None] * len(frames))
+            BATCH_SIZE.observe(len(frames))
+            self.batches += 1
+            self.frames += len(frames)
+
+            for cam_id, frame, conf, detail in zip(cam_ids, frames, confs, details):
+                try:
+                    self.on_result(cam_id, frame, float(conf), detail)
+                except Exception as e:
+                    log.error("Result handling failed for camera %s: %s", cam_id, e)
+
+    def _log_failure(self, error):
+        self.failures += 1
+        self._failures_unlogged += 1
+        now = time.monotonic()
+        if self._failure_logged_at is not None and now - self._failure_logged_at < INFERENCE_ERROR_LOG_INTERVAL:
+            return
+        if self._failures_unlogged > 1:
+            log.error("Batched inference failed %d times in %.0fs: %s", self._failures_unlogged,
+                      now - self._failure_logged_at, error)
+        else:
+            log.error("Batched inference failed: %s", error)
+        self._failure_logged_at = now
+        self._failures_unlogged = 0
+
+    def stats(self):
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "avg_batch": round(self.frames / self.batches, 2) if self.batches else 0.0,
+            "dropped": self.dropped,
+            "failures": self.failures,
+        }
+
+
+# ─────────────────────────────────────────────
+# Per-camera sessions
+# ─────────────────────────────────────────────
+class CameraSession:
+    def __init__(self, cam_id, source, pipeline, broadcaster):
+        self.cam_id = cam_id
+        self.source = source
+        self.pipeline = pipeline
+        self.broadcaster = broadcaster
+        self.last_result = None
+
+    @property
+    def running(self):
+        return self.pipeline is not None and self.pipeline.running
+
+
+class CameraManager:
+    """
+    Runs an independent capture/encode pipeline per camera (device index,
+    RTSP URL or video file) that all feed one BatchInferenceWorker, so the
+    model is loaded once no matter how many cameras are active.
+    """
+
+    def __init__(self, open_capture, encode_fn, handle_result, predict_batch,
+                 max_cameras: int = 4, queue_size: int = 1, max_stream_clients: int = 8,
+                 make_gate=None, prepare_fn=None, keep_jpegs: int = 0,
+                 stream_quality: int = 95, stream_encode=None, handle_skipped=None):
+        # open_capture(source) -> cv2.VideoCapture-like
+        # handle_result(cam_id, frame, conf, detail) -> result dict
+        # handle_skipped(cam_id, frame, last_result) -> result dict or None, for
+        # frames the gate skipped (None keeps the current result)
+        # make_gate() -> per-camera frame-change gate, or None
+        # prepare_fn / keep_jpegs are passed to each FramePipeline,
+        # stream_quality / stream_encode to each MJPEGBroadcaster
+        self.open_capture = open_capture
+        self.encode_fn = encode_fn
+        self.handle_result = handle_result
+        self.handle_skipped = handle_skipped
+        self.max_cameras = max_cameras
+        self.queue_size = queue_size
+        self.max_stream_clients = max_stream_clients
+        self.make_gate = make_gate
+        self.prepare_fn = prepare_fn
+        self.keep_jpegs = keep_jpegs
+        self.stream_quality = stream_quality
+        self.stream_encode = stream_encode
+
+        self.sessions = {}
+        self._lock = threading.Lock()
+        self.worker = BatchInferenceWorker(predict_batch, self._on_result)
+
+    def _on_result(self, cam_id, frame, conf, detail=None):
+        session = self.sessions.get(cam_id)
+        if session is None:
+            return
+        result = self.handle_result(cam_id, frame, conf, detail)
+        session.last_result = result
+        session.pipeline.set_result(result)
+
+    def _on_skipped(self, cam_id, frame):
+        session = self.sessions.get(cam_id)
+        if session is None:
+            return
+        result = self.handle_skipped(cam_id, frame, session.last_result)
+        if result is not None:
+            session.last_result = result
+            session.pipeline.set_result(result)
+
+    def get(self, cam_id):
+        return self.sessions.get(cam_id)
+
+    def running_ids(self):
+        return sorted(cid for cid, s in self.sessions.items() if s.running)
+
+    def primary(self):
+        """The lowest-numbered running camera, used by the legacy single-camera routes."""
+        ids = self.running_ids()
+        return self.sessions[ids[0]] if ids else None
+
+    def start(self, cam_id, source) -> bool:
+        """
+        Start a pipeline for cam_id. Returns False when it is already running.
+        Blocking (opens the device); call from a worker thread.
+        """
+        with self._lock:
+            existing = self.sessions.get(cam_id)
+            if existing is not None and existing.running:
+                return False
+            if existing is None and len(self.sessions) >= self.max_cameras:
+                raise RuntimeError(f"At most {self.max_cameras} cameras can run at once")
+
+        if existing is not None:
+            # Previous pipeline died (e.g. camera unplugged); clean it up first
+            self.stop(cam_id)
+
+        cap = self.open_capture(source)
+        if cap is None or not cap.isOpened():
+            raise IOError(f"Unable to open camera source {source!r}")
+
+        broadcaster = MJPEGBroadcaster(
+            max_subscribers=self.max_stream_clients,
+            default_quality=self.stream_quality,
+            encode=self.stream_encode,
+        )
+        pipeline = FramePipeline(
+            cap,
+            lambda frame, cid=cam_id: self.worker.submit(cid, frame),
+            self.encode_fn,
+            queue_size=self.queue_size,
+            name=f"camera{cam_id}",
+            on_encoded=broadcaster.publish,
+            gate=self.make_gate() if self.make_gate is not None else None,
+            prepare_fn=self.prepare_fn,
+            keep_jpegs=self.keep_jpegs,
+            on_skip=(
+                (lambda frame, cid=cam_id: self._on_skipped(cid, frame))
+                if self.handle_skipped is not None else None
+            ),
+        )
+        with self._lock:
+            other = self.sessions.get(cam_id)
+            if other is not None and other.running:
+                # Lost a race with a concurrent start of the same camera
+                cap.release()
+                return False
+            self.sessions[cam_id] = CameraSession(cam_id, source, pipeline, broadcaster)
+        self.worker.start()
+        pipeline.start()
+        return True
+
+    def stop(self, cam_id) -> bool:
+        with self._lock:
+            session = self.sessions.pop(cam_id, None)
+        if session is None:
+            return False
+        session.broadcaster.close_all()
+        session.pipeline.stop()
+        self.worker.discard(cam_id)
+        return True
+
+    def stop_all(self):
+        for cam_id in list(self.sessions):
+            self.stop(cam_id)
+
+    def frames_skipped(self):
+        return sum(s.pipeline.frames_skipped for s in list(self.sessions.values()))
+
+    def stats(self):
+        return {
+            "inference": self.worker.stats(),
+            "cameras": {
+                str(cid): {
+                    "source": str(s.source),
+                    "running": s.running,
+                    "frames_grabbed": s.pipeline.frames_grabbed,
+                    "frames_inferred": s.pipeline.frames_inferred,
+                    "frames_skipped": s.pipeline.frames_skipped,
+                    "gate": s.pipeline.gate.stats() if s.pipeline.gate is not None else None,
+                    "frames_encoded": s.pipeline.frames_encoded,
+                    "frames_passthrough": s.pipeline.frames_passthrough,
+                    "stream": s.broadcaster.stats(),
+                }
+                for cid, s in list(self.sessions.items())
+            },
+        }
@@ -0,0 +1,173 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+from inference import classify_label
+
+
+# ─────────────────────────────────────────────
+# Streaming detector config
+# ─────────────────────────────────────────────
+# Weight of the newest frame in the confidence EMA (1.0 = no smoothing)
+DETECT_EMA_ALPHA = float(os.getenv("DETECT_EMA_ALPHA", "0.3"))
+# Hysteresis: a state is entered at ENTER and only left again past EXIT
+DETECT_WSSV_ENTER = float(os.getenv("DETECT_WSSV_ENTER", "0.7"))
+DETECT_WSSV_EXIT = float(os.getenv("DETECT_WSSV_EXIT", "0.6"))
+DETECT_HEALTHY_ENTER = float(os.getenv("DETECT_HEALTHY_ENTER", "0.3"))
+DETECT_HEALTHY_EXIT = float(os.getenv("DETECT_HEALTHY_EXIT", "0.4"))
+# Seconds of a detection collected into one event (best frame wins)
+DETECT_EVENT_WINDOW = float(os.getenv("DETECT_EVENT_WINDOW", "3.0"))
+# Windows with fewer agreeing frames than this are treated as flicker
+DETECT_MIN_FRAMES = int(os.getenv("DETECT_MIN_FRAMES", "3"))
+
+NO_SHRIMP = "No Shrimp"
+WSSV = "WSSV DETECTED"
+HEALTHY = "Healthy Shrimp"
+LABEL_KINDS = {WSSV: "wssv", HEALTHY: "healthy"}
+
+
+class DetectionEvent:
+    """Best frame of one detection window, ready to be saved as a snapshot."""
+
+    def __init__(self, label, confidence, frame, started_at, frames, mean_confidence):
+        self.label = label
+        self.kind = LABEL_KINDS[label]
+        self.confidence = confidence
+        self.frame = frame
+        self.started_at = started_at
+        self.frames = frames
+        self.mean_confidence = mean_confidence
+
+    def info(self) -> dict:
+        return {
+            "started_at": self.started_at,
+            "frames": self.frames,
+            "mean_confidence": self.mean_confidence,
+        }
+
+
+class DetectionTracker:
+    """
+    Per-camera streaming classifier. Smooths per-frame confidences with an
+    EMA, switches label only across hysteresis thresholds, and while a
+    WSSV/Healthy state holds, keeps the most confident frame of the current
+    window. update() returns a DetectionEvent when a window closes (after
+    DETECT_EVENT_WINDOW seconds or when the state ends), otherwise None.
+
+    Frames the frame-change gate skips never reach the model. They are not
+    evidence (one noisy output replayed at camera fps would defeat the
+    smoothing), but repeat() marks the window as held by an unchanged
+    scene: such a window is not discarded as flicker when its time is up,
+    it stays open until min_frames real inferences (the gate's periodic
+    refreshes) agree.
+    """
+
+    def __init__(self, alpha: float = DETECT_EMA_ALPHA, window: float = DETECT_EVENT_WINDOW,
+                 min_frames: int = DETECT_MIN_FRAMES):
+        self.alpha = alpha
+        self.window = window
+        self.min_frames = min_frames
+        self.ema = None
+        self.last_conf = None
+        self.label = NO_SHRIMP
+        self._reset_window()
+        # update() runs on the inference worker, repeat() on the camera's grab thread
+        self._lock = threading.Lock()
+
+        self.updates = 0
+        self.events = 0
+
+    def _reset_window(self):
+        self._best = None           # (score, conf, frame)
+        self._window_start = None
+        self._window_started_at = None
+        self._window_frames = 0
+        self._window_sum = 0.0
+        self._window_held = False
+
+    def _next_label(self, ema: float) -> str:
+        if self.label == WSSV and ema >= DETECT_WSSV_EXIT:
+            return WSSV
+        if self.label == HEALTHY and ema <= DETECT_HEALTHY_EXIT:
+            return HEALTHY
+        if ema >= DETECT_WSSV_ENTER:
+            return WSSV
+        if ema <= DETECT_HEALTHY_ENTER:
+            return HEALTHY
+        return NO_SHRIMP
+
+    def _close_window(self, label):
+        best = self._best
+        event = None
+        if best is not None and self._window_frames >= self.min_frames:
+            _, conf, frame = best
+            event = DetectionEvent(
+                label, conf, frame, self._window_started_at,
+                self._window_frames, self._window_sum / self._window_frames,
+            )
+            self.events += 1
+        self._reset_window()
+        return event
+
+    def update(self, conf: float, frame, now: float = None):
+        with self._lock:
+            return self._update(conf, frame, now)
+
+    def repeat(self, frame, now: float = None):
+        """
+        Notes a frame the gate judged unchanged. EMA, label and frame count
+        are left alone; returns the open window's event if it was only
+        waiting for its time to run out.
+        """
+        with self._lock:
+            if self._window_start is None:
+                return None
+            self._window_held = True
+            return self._window_due(time.monotonic() if now is None else now)
+
+    def _window_due(self, now: float):
+        if now - self._window_start < self.window:
+            return None
+        if self._window_frames < self.min_frames and self._window_held:
+            # Static scene: keep waiting for enough inferences instead of dropping it
+            return None
+        return self._close_window(self.label)
+
+    def _update(self, conf: float, frame, now: float = None):
+        now = time.monotonic() if now is None else now
+        self.updates += 1
+        self.last_conf = conf
+        self.ema = conf if self.ema is None else self.alpha * conf + (1 - self.alpha) * self.ema
+
+        prev = self.label
+        self.label = self._next_label(self.ema)
+
+        event = None
+        if prev != self.label and self._best is not None:
+            # State ended: flush what the window collected for the old label
+            event = self._close_window(prev)
+
+        if self.label in LABEL_KINDS and classify_label(conf) == self.label:
+            # "Best" means most confident for this label: high for WSSV, low for healthy
+            score = conf if self.label == WSSV else 1.0 - conf
+            if self._window_start is None:
+                self._window_start = now
+                self._window_started_at = datetime.utcnow().isoformat()
+            self._window_frames += 1
+            self._window_sum += conf
+            if self._best is None or score > self._best[0]:
+                self._best = (score, conf, frame)
+
+        if event is None and self._window_start is not None:
+            event = self._window_due(now)
+        return event
+
+    def stats(self):
+        return {
+            "label": self.label,
+            "ema": None if self.ema is None else round(self.ema, 4),
+            "updates": self.updates,
+            "events": self.events,
+            "window_frames": self._window_frames,
+        }
@@ -0,0 +1,119 @@
+import time
+import asyncio
+import threading
+
+
+# ─────────────────────────────────────────────
+# In-process pub/sub hub
+# ─────────────────────────────────────────────
+class EventHub:
+    """
+    Keeps the latest value per topic and wakes subscribers when it changes.
+
+    publish() is safe to call from any thread (e.g. the inference worker).
+    Subscribers only ever see the newest value of each topic, so bursts of
+    updates are coalesced instead of queued.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._versions = {}
+        self._subs = set()
+        self.published = 0
+
+    def publish(self, topic: str, data):
+        with self._lock:
+            self._latest[topic] = data
+            self._versions[topic] = self._versions.get(topic, 0) + 1
+            subs = list(self._subs)
+            self.published += 1
+        for sub in subs:
+            sub.notify()
+
+    def latest(self, topic: str):
+        with self._lock:
+            return self._latest.get(topic)
+
+    def changes_since(self, seen: dict, topics) -> dict:
+        """
+        Returns {topic: data} for topics newer than the versions in `seen`
+        and updates `seen` in place.
+        """
+        changes = {}
+        with self._lock:
+            for topic in topics:
+                version = self._versions.get(topic, 0)
+                if version and version != seen.get(topic):
+                    seen[topic] = version
+                    changes[topic] = self._latest[topic]
+        return changes
+
+    def subscribe(self, topics, min_interval: float = 0.25) -> "HubSubscriber":
+        sub = HubSubscriber(self, topics, min_interval)
+        with self._lock:
+            self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: "HubSubscriber"):
+        with self._lock:
+            self._subs.discard(sub)
+
+    @property
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subs)
+
+
+class HubSubscriber:
+    """
+    One streaming client (SSE or WebSocket). Must be created inside the
+    event loop that will consume it.
+    """
+
+    def __init__(self, hub: EventHub, topics, min_interval: float):
+        self.hub = hub
+        self.topics = tuple(topics)
+        self.min_interval = min_interval
+        self.closed = False
+        self._loop = asyncio.get_running_loop()
+        self._event = asyncio.Event()
+        self._seen = {}
+        self._last_sent = 0.0
+
+    def notify(self):
+        try:
+            self._loop.call_soon_threadsafe(self._event.set)
+        except RuntimeError:
+            # Event loop already closed
+            self.closed = True
+
+    def close(self):
+        self.closed = True
+        self.notify()
+
+    async def next_changes(self, timeout: float = None) -> dict:
+        """
+        Wait for changed topics, at most one batch per min_interval.
+        Returns {} on timeout or when closed.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not self.closed:
+            wait = self._last_sent + self.min_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+            self._event.clear()
+            changes = self.hub.changes_since(self._seen, self.topics)
+            if changes:
+                self._last_sent = time.monotonic()
+                return changes
+
+            remaining = None if deadline is None else deadline - time.monotonic()
+            if remaining is not None and remaining <= 0:
+                return {}
+            try:
+                await asyncio.wait_for(self._event.wait(), remaining)
+            except asyncio.TimeoutError:
+                return {}
+        return {}
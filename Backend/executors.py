@@ -0,0 +1,152 @@
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# Queue wait and run time per job; the db pool's run time is the Mongo round trip
+TASK_SECONDS = metrics.histogram("executor_task_seconds", "Executor job wait and run time.",
+                                 ["pool", "phase"])
+
+
+class ExecutorBusy(Exception):
+    pass
+
+
+# ─────────────────────────────────────────────
+# Bounded executor
+# ─────────────────────────────────────────────
+class ManagedExecutor:
+    """
+    Thread pool with a hard cap on queued work and basic metrics.
+
+    Async handlers `await pool.run(fn, ...)` so blocking calls never run on
+    the event loop. When more than max_workers + max_queue jobs are pending,
+    new work is rejected with ExecutorBusy instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.max_wait_ms = 0.0
+        self.total_wait_ms = 0.0
+        self._wait_seconds = TASK_SECONDS.labels(pool=name, phase="wait")
+        self._run_seconds = TASK_SECONDS.labels(pool=name, phase="run")
+
+    @property
+    def capacity(self):
+        return self.max_workers + self.max_queue
+
+    def _reserve(self):
+        with self._lock:
+            if self._pending >= self.capacity:
+                self.rejected += 1
+                raise ExecutorBusy(self.name)
+            self._pending += 1
+
+    def _wrap(self, fn, args, kwargs):
+        submitted = time.monotonic()
+
+        def job():
+            wait_ms = (time.monotonic() - submitted) * 1000.0
+            with self._lock:
+                self._active += 1
+                self.total_wait_ms += wait_ms
+                self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self._wait_seconds.observe(wait_ms / 1000.0)
+            started = metrics.now()
+            ok = False
+            try:
+                result = fn(*args, **kwargs)
+                ok = True
+                return result
+            finally:
+                self._run_seconds.observe_since(started)
+                with self._lock:
+                    self._active -= 1
+                    self._pending -= 1
+                    if ok:
+                        self.completed += 1
+                    else:
+                        self.failed += 1
+
+        return job
+
+    def submit(self, fn, *args, **kwargs):
+        """Submit from synchronous code; returns a concurrent.futures.Future."""
+        self._reserve()
+        try:
+            return self._pool.submit(self._wrap(fn, args, kwargs))
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+    async def run(self, fn, *args, **kwargs):
+        """Run fn in the pool and await its result."""
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            done = self.completed + self.failed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queued": self._pending - self._active,
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.total_wait_ms / done, 2) if done else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 2),
+            }
+
+    def shutdown(self, wait: bool = False):
+        self._pool.shutdown(wait=wait)
+
+
+# ─────────────────────────────────────────────
+# Shared pools
+# ─────────────────────────────────────────────
+inference_pool = ManagedExecutor(
+    "inference",
+    max_workers=int(os.getenv("INFERENCE_POOL_WORKERS", "1")),
+    max_queue=int(os.getenv("INFERENCE_POOL_QUEUE", "16")),
+)
+db_pool = ManagedExecutor(
+    "db",
+    max_workers=int(os.getenv("DB_POOL_WORKERS", "8")),
+    max_queue=int(os.getenv("DB_POOL_QUEUE", "64")),
+)
+codec_pool = ManagedExecutor(
+    "codec",
+    max_workers=int(os.getenv("CODEC_POOL_WORKERS", "2")),
+    max_queue=int(os.getenv("CODEC_POOL_QUEUE", "32")),
+)
+# Offline /batch_predict decoding, kept apart from the live codec work
+batch_pool = ManagedExecutor(
+    "batch",
+    max_workers=int(os.getenv("BATCH_POOL_WORKERS", "2")),
+    max_queue=int(os.getenv("BATCH_POOL_QUEUE", "32")),
+)
+
+ALL_POOLS = (inference_pool, db_pool, codec_pool, batch_pool)
+
+
+def executor_stats():
+    return {pool.name: pool.stats() for pool in ALL_POOLS}
+
+
+def shutdown_all():
+    for pool in ALL_POOLS:
+        pool.shutdown()
@@ -0,0 +1,79 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+
+# ─────────────────────────────────────────────
+# Frame-change gate
+# ─────────────────────────────────────────────
+FRAME_GATE_ENABLED = os.getenv("FRAME_GATE_ENABLED", "1") == "1"
+# Side of the grayscale thumbnail frames are compared on
+FRAME_GATE_SIZE = int(os.getenv("FRAME_GATE_SIZE", "32"))
+# Mean absolute pixel difference (0-255) that counts as a scene change
+FRAME_GATE_THRESHOLD = float(os.getenv("FRAME_GATE_THRESHOLD", "3.0"))
+# Re-run the model at least this often even if nothing changed
+FRAME_GATE_MAX_INTERVAL = float(os.getenv("FRAME_GATE_MAX_INTERVAL", "5.0"))
+
+
+class FrameChangeGate:
+    """
+    Cheap check run before inference. Compares a tiny grayscale copy of the
+    frame with the last frame that was sent to the model; unchanged frames
+    are skipped and the previous result stays in place.
+
+    Comparing against the last *inferred* frame (not the previous frame)
+    means slow drift still accumulates into a change eventually.
+    """
+
+    def __init__(self, size: int = FRAME_GATE_SIZE, threshold: float = FRAME_GATE_THRESHOLD,
+                 max_interval: float = FRAME_GATE_MAX_INTERVAL):
+        self.size = size
+        self.threshold = threshold
+        self.max_interval = max_interval
+        self._ref = None
+        self._ref_time = 0.0
+        self._small = np.empty((size, size, 3), np.uint8)
+        self._gray = np.empty((size, size), np.uint8)
+
+        self.passed = 0
+        self.skipped = 0
+        self.last_diff = None
+
+    def _signature(self, frame_bgr):
+        cv2.resize(frame_bgr, (self.size, self.size), dst=self._small, interpolation=cv2.INTER_AREA)
+        cv2.cvtColor(self._small, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        return self._gray
+
+    def should_infer(self, frame_bgr) -> bool:
+        sig = self._signature(frame_bgr)
+        now = time.monotonic()
+
+        if self._ref is not None and now - self._ref_time < self.max_interval:
+            self.last_diff = float(cv2.absdiff(sig, self._ref).mean())
+            if self.last_diff < self.threshold:
+                self.skipped += 1
+                return False
+
+        self._ref = sig.copy()
+        self._ref_time = now
+        self.passed += 1
+        return True
+
+    def reset(self):
+        self._ref = None
+
+    def stats(self):
+        total = self.passed + self.skipped
+        return {
+            "inferred": self.passed,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / total, 3) if total else 0.0,
+            "last_diff": None if self.last_diff is None else round(self.last_diff, 2),
+        }
+
+
+def make_gate():
+    """New per-camera gate, or None when gating is disabled."""
+    return FrameChangeGate() if FRAME_GATE_ENABLED else None
@@ -0,0 +1,360 @@
+import os
+import csv
+import glob
+import math
+import time
+import random
+import threading
+from abc import abstractmethod
+from typing import Dict, Optional, Protocol, Tuple, runtime_checkable
+
+import cv2
+import numpy as np
+
+from log_config import get_logger
+
+log = get_logger("hal")
+
+
+# ─────────────────────────────────────────────
+# Hardware abstraction
+# ─────────────────────────────────────────────
+# Drivers for the ADC, the 1-wire thermometer and the camera. Hardware
+# libraries are only imported when a real driver is opened, so with
+# SIMULATE=1 (or --simulate) both processes run on any Linux box.
+SIMULATE = os.getenv("SIMULATE", "0") == "1"
+# Recorded sensor readings to replay (CSV with tds_v, ph_v, turb_v, temperature_c)
+SIM_SENSOR_TRACE = os.getenv("SIM_SENSOR_TRACE")
+# Trace playback speed (2.0 = twice as fast as recorded)
+SIM_TRACE_SPEED = float(os.getenv("SIM_TRACE_SPEED", "1.0"))
+# Synthetic camera frames
+SIM_FRAME_WIDTH = int(os.getenv("SIM_FRAME_WIDTH", "640"))
+SIM_FRAME_HEIGHT = int(os.getenv("SIM_FRAME_HEIGHT", "480"))
+SIM_FPS = float(os.getenv("SIM_FPS", "30"))
+# Number of synthetic cameras reported by /cameras
+SIM_CAMERAS = int(os.getenv("SIM_CAMERAS", "1"))
+
+
+def enable_simulation():
+    """Switch this process (and processes it starts) to simulated drivers."""
+    global SIMULATE
+    SIMULATE = True
+    os.environ["SIMULATE"] = "1"
+
+
+# ── interfaces ──
+# Protocols, so the third-party drivers (AnalogIn, W1ThermSensor,
+# cv2.VideoCapture) satisfy them as they are; the drivers defined here
+# subclass them and must implement the abstract members.
+@runtime_checkable
+class AdcChannel(Protocol):
+    """One analog input. `voltage` performs a conversion and returns volts."""
+
+    @property
+    @abstractmethod
+    def voltage(self) -> float:
+        ...
+
+
+@runtime_checkable
+class Thermometer(Protocol):
+    """get_temperature() blocks for one conversion and returns °C."""
+
+    @abstractmethod
+    def get_temperature(self) -> float:
+        ...
+
+
+@runtime_checkable
+class FrameSource(Protocol):
+    """The subset of cv2.VideoCapture the frame pipeline uses."""
+
+    def isOpened(self) -> bool:
+        return True
+
+    @abstractmethod
+    def read(self) -> Tuple[bool, Optional[np.ndarray]]:
+        ...
+
+    def release(self):
+        pass
+
+    def set(self, prop, value) -> bool:
+        return False
+
+    def get(self, prop) -> float:
+        return 0.0
+
+
+# ─────────────────────────────────────────────
+# Real drivers (Raspberry Pi)
+# ─────────────────────────────────────────────
+def open_real_adc(data_rate: int = 860, gain: int = 1) -> Tuple[object, Dict[str, AdcChannel]]:
+    import board
+    import busio
+    from adafruit_ads1x15.ads1115 import ADS1115
+    from adafruit_ads1x15.analog_in import AnalogIn
+
+    i2c = busio.I2C(board.SCL, board.SDA)
+    ads = ADS1115(i2c)
+    ads.gain = gain
+    ads.data_rate = data_rate
+    # A0 → TDS, A1 → pH, A3 → Turbidity
+    channels = {
+        "tds_v": AnalogIn(ads, 0),
+        "ph_v": AnalogIn(ads, 1),
+        "turb_v": AnalogIn(ads, 3),
+    }
+    return ads, channels
+
+
+def open_real_thermometer() -> Thermometer:
+    from w1thermsensor import W1ThermSensor
+    return W1ThermSensor()
+
+
+class SysfsThermometer(Thermometer):
+    """DS18B20 read straight from /sys/bus/w1, without w1thermsensor."""
+
+    BASE_DIR = "/sys/bus/w1/devices/"
+
+    def __init__(self, load_modules: bool = False):
+        if load_modules:
+            # Normally automatic once 1-wire is enabled
+            os.system("modprobe w1-gpio")
+            os.system("modprobe w1-therm")
+        folders = glob.glob(self.BASE_DIR + "28-*")
+        if not folders:
+            raise IOError("no DS18B20 found under " + self.BASE_DIR)
+        self.device_file = folders[0] + "/w1_slave"
+
+    def _read_raw(self):
+        with open(self.device_file, "r") as f:
+            return f.readlines()
+
+    def get_temperature(self) -> float:
+        lines = self._read_raw()
+        # Wait until the CRC check passes
+        while lines[0].strip()[-3:] != "YES":
+            time.sleep(0.2)
+            lines = self._read_raw()
+        equals_pos = lines[1].find("t=")
+        if equals_pos == -1:
+            raise IOError("unexpected w1_slave contents")
+        return float(lines[1][equals_pos + 2:]) / 1000.0
+
+
+# ─────────────────────────────────────────────
+# Simulated sensors
+# ─────────────────────────────────────────────
+class SensorTrace:
+    """
+    Recorded readings replayed in (scaled) real time, looping at the end.
+    Without a trace file, produces slowly drifting synthetic values.
+    """
+
+    SYNTHETIC = {"tds_v": 0.4, "ph_v": 2.3, "turb_v": 3.9, "temperature_c": 27.0}
+
+    def __init__(self, path: str = None, interval: float = 2.0, speed: float = SIM_TRACE_SPEED):
+        self.rows = []
+        if path:
+            with open(path, newline="") as f:
+                for row in csv.DictReader(f):
+                    self.rows.append({
+                        k: float(v) for k, v in row.items()
+                        if k in self.SYNTHETIC and v not in ("", None)
+                    })
+            log.info("Replaying %d recorded sensor readings from %s.", len(self.rows), path)
+        self.interval = interval
+        self.speed = speed
+        self._start = time.monotonic()
+
+    def current(self) -> dict:
+        elapsed = (time.monotonic() - self._start) * self.speed
+        if self.rows:
+            return self.rows[int(elapsed / self.interval) % len(self.rows)]
+        # Slow sine drift so filters and charts have something to show
+        phase = elapsed / 600.0 * 2 * math.pi
+        return {k: v * (1 + 0.02 * math.sin(phase)) for k, v in self.SYNTHETIC.items()}
+
+
+class SimulatedAdc:
+    """Stands in for the ADS1115 object (data_rate, gain, mode)."""
+
+    simulated = True
+
+    def __init__(self, data_rate: int = 860, gain: int = 1):
+        self.data_rate = data_rate
+        self.gain = gain
+        self.mode = None
+
+
+class SimulatedAdcChannel(AdcChannel):
+    """Trace value plus Gaussian noise, taking one conversion period per read."""
+
+    def __init__(self, adc: SimulatedAdc, trace: SensorTrace, key: str, noise: float = 0.01):
+        self.adc = adc
+        self.trace = trace
+        self.key = key
+        self.noise = noise
+
+    @property
+    def voltage(self) -> float:
+        time.sleep(1.0 / self.adc.data_rate)
+        value = self.trace.current().get(self.key)
+        if value is None:
+            return float("nan")
+        return value + random.gauss(0.0, self.noise)
+
+
+class SimulatedThermometer(Thermometer):
+    CONVERSION_SECONDS = 0.75
+
+    def __init__(self, trace: SensorTrace):
+        self.trace = trace
+
+    def get_temperature(self) -> float:
+        time.sleep(self.CONVERSION_SECONDS)
+        return self.trace.current().get("temperature_c", 27.0) + random.gauss(0.0, 0.02)
+
+
+# ─────────────────────────────────────────────
+# Simulated frame sources
+# ─────────────────────────────────────────────
+class _Pacer:
+    def __init__(self, fps: float):
+        self.period = 1.0 / fps if fps and fps > 0 else 0.0
+        self._next = time.monotonic()
+
+    def wait(self):
+        if not self.period:
+            return
+        self._next += self.period
+        delay = self._next - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            # Running behind: don't try to catch up with a burst
+            self._next = time.monotonic()
+
+
+class SyntheticFrameSource(FrameSource):
+    """Moving test pattern at a fixed size and frame rate."""
+
+    def __init__(self, seed: int = 0, width: int = SIM_FRAME_WIDTH, height: int = SIM_FRAME_HEIGHT,
+                 fps: float = SIM_FPS):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self._pacer = _Pacer(fps)
+        self._n = 0
+        self._opened = True
+        rng = np.random.default_rng(seed)
+        # Smooth, high-contrast blobs so the frame gate sees real change
+        coarse = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+        self._base = cv2.resize(coarse, (width, height), interpolation=cv2.INTER_CUBIC)
+        self._lock = threading.Lock()
+
+    def isOpened(self) -> bool:
+        return self._opened
+
+    def read(self):
+        if not self._opened:
+            return False, None
+        self._pacer.wait()
+        with self._lock:
+            self._n += 1
+            n = self._n
+        frame = np.roll(self._base, n * 16, axis=1)
+        x = (n * 12) % self.width
+        cv2.circle(frame, (x, self.height // 2), 60, (40, 90, 200), -1)
+        return True, frame
+
+    def release(self):
+        self._opened = False
+
+    def get(self, prop) -> float:
+        if prop == cv2.CAP_PROP_FRAME_WIDTH:
+            return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT:
+            return float(self.height)
+        if prop == cv2.CAP_PROP_FPS:
+            return float(self.fps)
+        return 0.0
+
+
+class VideoFileSource(FrameSource):
+    """
+    Replays a video file at its own (or a given) frame rate, looping.
+    fps=0 reads as fast as the file decodes.
+    """
+
+    def __init__(self, path: str, fps: float = None, loop: bool = True):
+        self.path = path
+        self.loop = loop
+        self._cap = cv2.VideoCapture(path)
+        if fps is None:
+            fps = (self._cap.get(cv2.CAP_PROP_FPS) if self._cap.isOpened() else 0) or SIM_FPS
+        self.fps = fps
+        self._pacer = _Pacer(self.fps)
+
+    def isOpened(self) -> bool:
+        return self._cap.isOpened()
+
+    def read(self):
+        self._pacer.wait()
+        ok, frame = self._cap.read()
+        if not ok and self.loop:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self._cap.read()
+        return ok, frame
+
+    def release(self):
+        self._cap.release()
+
+    def get(self, prop) -> float:
+        return self._cap.get(prop)
+
+
+# ─────────────────────────────────────────────
+# Factories
+# ─────────────────────────────────────────────
+def open_adc(simulate: bool = None, data_rate: int = 860,
+             trace: SensorTrace = None) -> Tuple[object, Dict[str, AdcChannel]]:
+    """(ads, {"tds_v", "ph_v", "turb_v": AdcChannel})."""
+    if not (SIMULATE if simulate is None else simulate):
+        return open_real_adc(data_rate)
+    trace = trace or SensorTrace(SIM_SENSOR_TRACE)
+    adc = SimulatedAdc(data_rate)
+    channels = {key: SimulatedAdcChannel(adc, trace, key) for key in ("tds_v", "ph_v", "turb_v")}
+    return adc, channels
+
+
+def open_thermometer(simulate: bool = None, trace: SensorTrace = None) -> Optional[Thermometer]:
+    """Thermometer, or None when no sensor is present."""
+    if SIMULATE if simulate is None else simulate:
+        return SimulatedThermometer(trace or SensorTrace(SIM_SENSOR_TRACE))
+    try:
+        return open_real_thermometer()
+    except Exception as e:
+        log.warning("DS18B20 not available: %s", e)
+        return None
+
+
+def open_frame_source(source, simulate: bool = None) -> FrameSource:
+    """
+    Device index, RTSP/HTTP URL or file path -> VideoCapture-like object.
+    Simulated: indexes give synthetic frames, files are replayed at their
+    frame rate, and URLs are still opened for real.
+    """
+    if not (SIMULATE if simulate is None else simulate):
+        return cv2.VideoCapture(source)
+    if isinstance(source, int):
+        return SyntheticFrameSource(seed=source)
+    if os.path.exists(str(source)):
+        return VideoFileSource(str(source))
+    return cv2.VideoCapture(source)
+
+
+def simulated_camera_indexes():
+    return list(range(SIM_CAMERAS))
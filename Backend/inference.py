@@ -0,0 +1,174 @@
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from log_config import get_logger
+from model_backend import load_backend
+
+log = get_logger("inference")
+
+
+# Confidence bands: WSSV at or above, healthy at or below, "No Shrimp" between
+WSSV_THRESHOLD = 0.7
+HEALTHY_THRESHOLD = 0.3
+
+
+def classify_label(conf: float) -> str:
+    if conf >= WSSV_THRESHOLD:
+        return "WSSV DETECTED"
+    elif conf <= HEALTHY_THRESHOLD:
+        return "Healthy Shrimp"
+    else:
+        return "No Shrimp"
+
+
+# ─────────────────────────────────────────────
+# Batched TFLite inference engine
+# ─────────────────────────────────────────────
+class InferenceEngine:
+    """
+    Wraps a model backend for batched, allocation-free inference.
+
+    Frames are resized/converted straight into a preallocated float32 input
+    buffer and run through the model N at a time. The interpreter is guarded
+    by a lock, so one engine can be shared by every caller.
+
+    With lazy=True the runtime import and model load are deferred to the
+    first prediction (or an explicit load(), e.g. a background warm-up).
+    """
+
+    def __init__(self, model_path: str = None, num_threads: int = None, max_batch: int = 8,
+                 variant: str = None, lazy: bool = False):
+        if num_threads is None:
+            num_threads = os.cpu_count() or 1
+        self.num_threads = num_threads
+        self.max_batch = max(1, int(max_batch))
+        self.variant = variant
+        self.model_path = model_path
+        self.backend = None
+        self.load_error = None
+        self.load_seconds = None
+
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.load()
+
+    @property
+    def loaded(self) -> bool:
+        return self.backend is not None
+
+    def load(self):
+        """Load the model once; safe to call from any thread."""
+        if self.backend is not None:
+            return
+        with self._load_lock:
+            if self.backend is not None:
+                return
+            started = time.monotonic()
+            try:
+                backend = load_backend(variant=self.variant, model_path=self.model_path,
+                                       num_threads=self.num_threads)
+            except Exception as e:
+                self.load_error = str(e)
+                raise
+            self.model_path = backend.model_path
+            batch, self.height, self.width, self.channels = backend.input_shape
+            # Interpreter + input buffer: native size, plus max_batch once needed
+            self._slots = {batch: (backend, self._new_input(batch))}
+            # Scratch buffers reused for every frame (uint8 resize + RGB convert)
+            self._resized = np.empty((self.height, self.width, 3), np.uint8)
+            self._rgb = np.empty((self.height, self.width, 3), np.uint8)
+            self.load_error = None
+            self.load_seconds = round(time.monotonic() - started, 3)
+            self.backend = backend
+
+    def _new_input(self, n: int) -> np.ndarray:
+        return np.zeros((n, self.height, self.width, self.channels), np.float32)
+
+    def batch_size_for(self, n: int) -> int:
+        """Padded batch size used for n frames: the model's native size, else max_batch."""
+        native = self.backend.input_shape[0]
+        return native if n <= native else self.max_batch
+
+    def slot(self, size: int):
+        """
+        (backend, input buffer) for a batch size from batch_size_for().
+        Besides the loaded model, at most one more interpreter exists,
+        resized to max_batch once and shared by every larger batch
+        (partial batches are padded). It costs another copy of the
+        weights plus max_batch frames of activations. Call with the lock held.
+        """
+        slot = self._slots.get(size)
+        if slot is not None:
+            return slot
+        try:
+            backend = load_backend(model_path=self.model_path, num_threads=self.num_threads)
+            backend.resize_batch(size)
+        except Exception as e:
+            # Model has a fixed batch dimension; keep running at its native size
+            log.warning("Model does not support batch size %d: %s", size, e)
+            native = self._slots[self.backend.input_shape[0]]
+            self.max_batch = len(native[1])
+            self._slots[size] = native
+            return native
+        slot = self._slots[size] = (backend, self._new_input(size))
+        return slot
+
+    @contextmanager
+    def reserved(self, size: int = 1):
+        """
+        Holds the engine and yields the (backend, input buffer) slot used
+        for `size` frames, e.g. to time preprocessing and invoke separately.
+        """
+        if self.backend is None:
+            self.load()
+        with self._lock:
+            yield self.slot(self.batch_size_for(size))
+
+    def preprocess_into(self, img_bgr: np.ndarray, out: np.ndarray):
+        """Resize + BGR->RGB one frame into a row of an input buffer (uint8 values, unscaled)."""
+        cv2.resize(img_bgr, (self.width, self.height), dst=self._resized)
+        cv2.cvtColor(self._resized, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        out[...] = self._rgb
+
+    def _run(self, frames) -> np.ndarray:
+        n = len(frames)
+        backend, buf = self.slot(self.batch_size_for(n))
+        n = min(n, len(buf))
+        for i, frame in enumerate(frames[:n]):
+            self.preprocess_into(frame, buf[i])
+        # Padding rows keep earlier (already scaled) frames; their outputs are discarded
+        buf[:n] *= np.float32(1.0 / 255.0)
+
+        backend.set_input(buf)
+        backend.invoke()
+        output = backend.get_output()
+        return output.reshape(len(buf), -1)[:n, 0]
+
+    def predict_batch(self, frames) -> np.ndarray:
+        """
+        Run inference on a sequence of BGR frames.
+        Returns a float32 array of confidences, one per frame.
+        """
+        frames = list(frames)
+        if not frames:
+            return np.empty((0,), np.float32)
+        if self.backend is None:
+            self.load()
+
+        results = []
+        with self._lock:
+            start = 0
+            while start < len(frames):
+                scores = self._run(frames[start:start + self.max_batch])
+                results.append(scores)
+                start += len(scores)
+        return np.concatenate(results)
+
+    def predict(self, img_bgr: np.ndarray) -> float:
+        return float(self.predict_batch([img_bgr])[0])
@@ -0,0 +1,116 @@
+import os
+
+import cv2
+
+from log_config import get_logger
+
+log = get_logger("jpeg")
+
+# Optional libjpeg-turbo binding (pip install PyTurboJPEG); OpenCV otherwise
+try:
+    from turbojpeg import TurboJPEG, TJPF_BGR, TJSAMP_420
+    _turbo = TurboJPEG()
+except Exception:
+    _turbo = None
+
+
+# ─────────────────────────────────────────────
+# Encode settings
+# ─────────────────────────────────────────────
+# "auto" uses PyTurboJPEG when it is installed
+JPEG_BACKEND = os.getenv("JPEG_BACKEND", "auto").lower()
+
+# Live stream: favour speed
+STREAM_JPEG_QUALITY = int(os.getenv("STREAM_JPEG_QUALITY", "80"))
+STREAM_MAX_WIDTH = int(os.getenv("STREAM_MAX_WIDTH", "0"))        # 0 = camera resolution
+# Draw the label overlay on streamed frames (pass-through needs this off)
+STREAM_OVERLAY = os.getenv("STREAM_OVERLAY", "1") == "1"
+# Forward the camera's own MJPEG frames untouched when there is no overlay
+STREAM_PASSTHROUGH = os.getenv("STREAM_PASSTHROUGH", "0") == "1"
+
+# Archived snapshots: favour quality (95 matches the old cv2.imencode default)
+SNAPSHOT_JPEG_QUALITY = int(os.getenv("SNAPSHOT_JPEG_QUALITY", "95"))
+SNAPSHOT_MAX_WIDTH = int(os.getenv("SNAPSHOT_MAX_WIDTH", "0"))
+
+
+def turbo_available() -> bool:
+    return _turbo is not None
+
+
+class JpegEncoder:
+    """
+    JPEG encoder with a fixed quality and optional downscale to max_width.
+    Uses libjpeg-turbo through PyTurboJPEG when available.
+    """
+
+    def __init__(self, quality: int = 95, max_width: int = 0, backend: str = JPEG_BACKEND):
+        self.quality = quality
+        self.max_width = max_width
+        if backend == "turbo" and _turbo is None:
+            log.warning("JPEG_BACKEND=turbo but PyTurboJPEG is not available, using OpenCV.")
+        self.use_turbo = _turbo is not None and backend in ("auto", "turbo")
+
+    @property
+    def backend(self) -> str:
+        return "turbojpeg" if self.use_turbo else "opencv"
+
+    @property
+    def settings(self):
+        """What the output depends on; equal settings give interchangeable JPEGs."""
+        return (self.quality, self.max_width)
+
+    def downscale(self, frame):
+        """Frame at the encode resolution. Always a new array, safe to draw on."""
+        h, w = frame.shape[:2]
+        if not self.max_width or w <= self.max_width:
+            return frame.copy()
+        scale = self.max_width / float(w)
+        return cv2.resize(frame, (self.max_width, max(1, int(h * scale))), interpolation=cv2.INTER_AREA)
+
+    def encode(self, frame, quality: int = None):
+        """Encode an already downscaled BGR frame. Returns bytes or None."""
+        quality = self.quality if quality is None else quality
+        if self.use_turbo:
+            try:
+                return _turbo.encode(frame, quality=quality, pixel_format=TJPF_BGR, jpeg_subsample=TJSAMP_420)
+            except Exception as e:
+                log.warning("TurboJPEG encode failed, falling back to OpenCV: %s", e)
+                self.use_turbo = False
+        ok, buf = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return buf.tobytes() if ok else None
+
+    def encode_frame(self, frame, quality: int = None):
+        """Downscale (if configured) and encode."""
+        h, w = frame.shape[:2]
+        if self.max_width and w > self.max_width:
+            frame = self.downscale(frame)
+        return self.encode(frame, quality)
+
+    def stats(self):
+        return {"backend": self.backend, "quality": self.quality, "max_width": self.max_width}
+
+
+stream_encoder = JpegEncoder(STREAM_JPEG_QUALITY, STREAM_MAX_WIDTH)
+snapshot_encoder = JpegEncoder(SNAPSHOT_JPEG_QUALITY, SNAPSHOT_MAX_WIDTH)
+
+
+def is_raw_jpeg(frame) -> bool:
+    """True when a capture returned undecoded MJPEG bytes instead of an image."""
+    return frame is not None and (frame.ndim == 1 or (frame.ndim == 2 and frame.shape[0] == 1))
+
+
+def decode_raw_jpeg(frame):
+    return cv2.imdecode(frame.reshape(-1), cv2.IMREAD_COLOR)
+
+
+def enable_mjpeg_passthrough(cap) -> bool:
+    """
+    Ask a UVC camera for MJPEG and have OpenCV hand back the compressed
+    frames (V4L2 backend). Returns False when the backend refuses.
+    """
+    try:
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*"MJPG"))
+        return bool(cap.set(cv2.CAP_PROP_FORMAT, -1))
+    except Exception as e:
+        log.warning("MJPEG pass-through not supported: %s", e)
+        return False
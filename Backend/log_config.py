@@ -0,0 +1,76 @@
+import os
+import sys
+import json
+import logging
+from datetime import datetime, timezone
+
+
+# ─────────────────────────────────────────────
+# Structured logging
+# ─────────────────────────────────────────────
+# DEBUG / INFO / WARNING / ERROR, or OFF to silence everything
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" ([INFO] camera: message key=value) or "json" (one object per line)
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+ROOT = "crustascope"
+
+# Attributes every LogRecord has; anything else came in through extra=
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+_LEVEL_TAGS = {"WARNING": "WARN", "CRITICAL": "ERROR"}
+
+
+def _fields(record) -> dict:
+    return {k: v for k, v in vars(record).items() if k not in _RECORD_FIELDS and not k.startswith("_")}
+
+
+class TextFormatter(logging.Formatter):
+    """[LEVEL] logger: message key=value ..."""
+
+    def format(self, record):
+        tag = _LEVEL_TAGS.get(record.levelname, record.levelname)
+        name = record.name[len(ROOT) + 1:] if record.name.startswith(ROOT + ".") else record.name
+        line = f"[{tag}] {name}: {record.getMessage()}"
+        fields = _fields(record)
+        if fields:
+            line += " " + " ".join(f"{k}={v}" for k, v in fields.items())
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname.lower(),
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        entry.update(_fields(record))
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+def configure(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT):
+    root = logging.getLogger(ROOT)
+    root.handlers.clear()
+    root.propagate = False
+    if level == "OFF":
+        # Above every level: calls return after one isEnabledFor() check
+        root.setLevel(logging.CRITICAL + 1)
+        root.addHandler(logging.NullHandler())
+        return root
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    root.addHandler(handler)
+    root.setLevel(getattr(logging, level, logging.INFO))
+    return root
+
+
+def get_logger(name: str) -> logging.Logger:
+    return logging.getLogger(f"{ROOT}.{name}")
+
+
+configure()
@@ -0,0 +1,294 @@
+import os
+import time
+import bisect
+import threading
+
+from log_config import get_logger
+
+log = get_logger("metrics")
+
+# ─────────────────────────────────────────────
+# Prometheus-style metrics
+# ─────────────────────────────────────────────
+# Counters, gauges and histograms rendered in the Prometheus text format
+# at /metrics. With METRICS_ENABLED=0 every factory returns a shared no-op
+# object, so instrumented hot paths cost one empty method call.
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+PREFIX = "crustascope_"
+
+# Seconds; spans a ~1 ms JPEG encode to a multi-second Mongo stall
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Monotonic clock for stage timers: t0 = now(); ...; hist.observe_since(t0)
+now = time.perf_counter
+
+_registry = []
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=()) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    pairs += [f'{n}="{v}"' for n, v in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Noop:
+    """Stands in for every metric when metrics are disabled."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def inc(self, amount=1):
+        pass
+
+    def dec(self, amount=1):
+        pass
+
+    def set(self, value):
+        pass
+
+    def observe(self, value):
+        pass
+
+    def observe_since(self, started):
+        pass
+
+
+NOOP = _Noop()
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames=()):
+        self.name = PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values, **kwargs):
+        """Child for one label combination; look it up once, outside hot loops."""
+        if kwargs:
+            values = tuple(kwargs[n] for n in self.labelnames)
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _samples(self):
+        with self._lock:
+            children = list(self._children.items())
+        for key, child in children:
+            yield from child.samples(self.name, self.labelnames, key)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+
+class _Value:
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self.value -= amount
+
+    def set(self, value):
+        self.value = value
+
+    def samples(self, name, names, values):
+        yield f"{name}{_label_text(names, values)} {_number(self.value)}"
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+    def dec(self, amount=1):
+        self.labels().dec(amount)
+
+
+class _HistogramValue:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def observe_since(self, started):
+        self.observe(time.perf_counter() - started)
+
+    def samples(self, name, names, values):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        running = 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            running += count
+            yield f"{name}_bucket{_label_text(names, values, [('le', _number(bound))])} {running}"
+        yield f"{name}_sum{_label_text(names, values)} {_number(total)}"
+        yield f"{name}_count{_label_text(names, values)} {running}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+    def observe_since(self, started):
+        self.labels().observe_since(started)
+
+
+def _register(metric):
+    if not METRICS_ENABLED:
+        return NOOP
+    with _registry_lock:
+        _registry.append(metric)
+    return metric
+
+
+def counter(name: str, help: str, labelnames=()):
+    return _register(Counter(name, help, labelnames))
+
+
+def gauge(name: str, help: str, labelnames=()):
+    return _register(Gauge(name, help, labelnames))
+
+
+def histogram(name: str, help: str, labelnames=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help, labelnames, buckets))
+
+
+def register_collector(fn):
+    """
+    fn() -> [(name, kind, help, [(labels dict, value), ...]), ...], called
+    at scrape time. Used for values that are already counted elsewhere
+    (pipeline counters, queue depths), so the hot path pays nothing.
+    """
+    if METRICS_ENABLED:
+        with _registry_lock:
+            _collectors.append(fn)
+    return fn
+
+
+def render() -> str:
+    with _registry_lock:
+        metrics, collectors = list(_registry), list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    for fn in collectors:
+        try:
+            families = fn()
+        except Exception as e:
+            lines.append(f"# collector {getattr(fn, '__name__', fn)} failed: {_escape(e)}")
+            continue
+        for name, kind, help, samples in families:
+            name = PREFIX + name
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                if value is None:
+                    continue
+                text = _label_text(list(labels), list(labels.values()))
+                lines.append(f"{name}{text} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def serve(port: int, host: str = "127.0.0.1"):
+    """
+    Expose /metrics on a background HTTP server (for sensor_reader.py).
+    Returns the server, or None when disabled or the address is taken.
+    """
+    if not METRICS_ENABLED or not port:
+        return None
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        log.warning("Metrics server not started on %s:%d: %s", host, port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# ─────────────────────────────────────────────
+# Shared instruments
+# ─────────────────────────────────────────────
+STAGE_SECONDS = histogram(
+    "stage_seconds",
+    "Time spent per frame in each pipeline stage (capture, inference, encode, stream, persist).",
+    ["stage"],
+)
+MONGO_SECONDS = histogram("mongo_seconds", "MongoDB round-trip time per operation.", ["op"])
@@ -0,0 +1,157 @@
+import os
+
+import numpy as np
+
+from log_config import get_logger
+
+log = get_logger("model")
+
+_runtime = None
+
+
+def interpreter_class():
+    """
+    (Interpreter class, runtime name), imported on first use so that merely
+    importing this module (and app.py) doesn't pay for TensorFlow.
+    """
+    global _runtime
+    if _runtime is None:
+        # Prefer the small tflite_runtime wheel; fall back to full TensorFlow
+        try:
+            from tflite_runtime.interpreter import Interpreter
+            _runtime = (Interpreter, "tflite_runtime")
+        except ImportError:
+            import tensorflow as tf
+            _runtime = (tf.lite.Interpreter, "tensorflow")
+    return _runtime
+
+
+# ─────────────────────────────────────────────
+# Model variants
+# ─────────────────────────────────────────────
+MODEL_DIR = os.getenv("MODEL_DIR", ".")
+MODEL_BASENAME = "CrustaScope_model"
+
+# Known variants in order of preference (fastest first)
+MODEL_VARIANTS = ("int8", "float16", "float32")
+
+
+def variant_path(variant: str, model_dir: str = None) -> str:
+    return os.path.join(model_dir or MODEL_DIR, f"{MODEL_BASENAME}_{variant}.tflite")
+
+
+def available_variants(model_dir: str = None) -> dict:
+    """
+    Returns {variant: path} for every model file present on disk.
+    """
+    found = {}
+    for variant in MODEL_VARIANTS:
+        path = variant_path(variant, model_dir)
+        if os.path.exists(path):
+            found[variant] = path
+    return found
+
+
+def resolve_model_path(variant: str = None, model_path: str = None, model_dir: str = None) -> str:
+    """
+    Pick which model file to load.
+
+    - explicit model_path (MODEL_PATH env) always wins
+    - a named variant (MODEL_VARIANT env) is used if its file exists
+    - "auto" / None picks the first available in MODEL_VARIANTS order
+    """
+    if model_path:
+        return model_path
+
+    found = available_variants(model_dir)
+    if variant and variant != "auto":
+        if variant not in found:
+            raise FileNotFoundError(f"Model variant '{variant}' not found at {variant_path(variant, model_dir)}")
+        return found[variant]
+
+    for v in MODEL_VARIANTS:
+        if v in found:
+            return found[v]
+    raise FileNotFoundError(f"No {MODEL_BASENAME}_*.tflite model found in {model_dir or MODEL_DIR}")
+
+
+# ─────────────────────────────────────────────
+# Backend
+# ─────────────────────────────────────────────
+class TFLiteBackend:
+    """
+    Thin interpreter wrapper that hides the runtime (tflite_runtime vs
+    TensorFlow) and int8/uint8 quantization from callers.
+
+    set_input() always takes float32 in [0, 1]; get_output() always
+    returns float32 confidences, so classify_label() works unchanged.
+    """
+
+    def __init__(self, model_path: str, num_threads: int = None):
+        self.model_path = model_path
+        interpreter_cls, self.runtime = interpreter_class()
+        self.interpreter = interpreter_cls(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._refresh_details()
+
+    def _refresh_details(self):
+        self.input_details = self.interpreter.get_input_details()
+        self.output_details = self.interpreter.get_output_details()
+        inp = self.input_details[0]
+        out = self.output_details[0]
+
+        self.input_index = inp["index"]
+        self.output_index = out["index"]
+        self.input_shape = [int(d) for d in inp["shape"]]
+        self.input_dtype = np.dtype(inp["dtype"])
+        self.output_dtype = np.dtype(out["dtype"])
+        self.input_scale, self.input_zero_point = inp.get("quantization", (0.0, 0))
+        self.output_scale, self.output_zero_point = out.get("quantization", (0.0, 0))
+        self._quant_buf = None
+
+    @property
+    def quantized_input(self) -> bool:
+        return self.input_dtype in (np.int8, np.uint8) and self.input_scale != 0
+
+    @property
+    def quantized_output(self) -> bool:
+        return self.output_dtype in (np.int8, np.uint8) and self.output_scale != 0
+
+    def resize_batch(self, n: int):
+        shape = list(self.input_shape)
+        shape[0] = n
+        self.interpreter.resize_tensor_input(self.input_index, shape)
+        self.interpreter.allocate_tensors()
+        self._refresh_details()
+
+    def set_input(self, batch: np.ndarray):
+        if self.quantized_input:
+            info = np.iinfo(self.input_dtype)
+            if self._quant_buf is None or self._quant_buf.shape != batch.shape:
+                self._quant_buf = np.empty(batch.shape, np.float32)
+            q = self._quant_buf
+            np.divide(batch, self.input_scale, out=q)
+            q += self.input_zero_point
+            np.rint(q, out=q)
+            np.clip(q, info.min, info.max, out=q)
+            self.interpreter.set_tensor(self.input_index, q.astype(self.input_dtype))
+        else:
+            self.interpreter.set_tensor(self.input_index, batch.astype(self.input_dtype, copy=False))
+
+    def invoke(self):
+        self.interpreter.invoke()
+
+    def get_output(self) -> np.ndarray:
+        out = self.interpreter.get_tensor(self.output_index)
+        if self.quantized_output:
+            return (out.astype(np.float32) - self.output_zero_point) * self.output_scale
+        return out.astype(np.float32, copy=False)
+
+
+def load_backend(variant: str = None, model_path: str = None, num_threads: int = None,
+                 model_dir: str = None) -> TFLiteBackend:
+    path = resolve_model_path(variant, model_path, model_dir)
+    backend = TFLiteBackend(path, num_threads=num_threads)
+    log.info("Loaded model %s via %s (input %s, output %s).", path, backend.runtime,
+             backend.input_dtype.name, backend.output_dtype.name)
+    return backend
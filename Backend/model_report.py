@@ -0,0 +1,122 @@
+"""
+Compare every available model variant on a folder of labelled images.
+
+Usage:
+    python model_report.py <image_dir> [--model-dir .] [--threads N] [--warmup 3]
+
+Images may sit in sub-folders named after their true class
+(wssv/, healthy/, no_shrimp/); those are used to report accuracy as well.
+For each variant it prints latency percentiles and how often its label
+agrees with the float32 model's label.
+"""
+import os
+import sys
+import time
+import argparse
+
+import cv2
+import numpy as np
+
+from model_backend import available_variants
+from inference import InferenceEngine, classify_label
+from log_config import get_logger
+
+log = get_logger("model_report")
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+
+FOLDER_LABELS = {
+    "wssv": "WSSV DETECTED",
+    "healthy": "Healthy Shrimp",
+    "no_shrimp": "No Shrimp",
+    "none": "No Shrimp",
+}
+
+
+def load_images(image_dir: str):
+    items = []
+    for root, _, files in os.walk(image_dir):
+        truth = FOLDER_LABELS.get(os.path.basename(root).lower())
+        for name in sorted(files):
+            if not name.lower().endswith(IMAGE_EXTS):
+                continue
+            path = os.path.join(root, name)
+            img = cv2.imread(path, cv2.IMREAD_COLOR)
+            if img is None:
+                log.warning("Could not read %s, skipping.", path)
+                continue
+            items.append((path, truth, img))
+    return items
+
+
+def run_variant(path: str, images, threads: int, warmup: int):
+    engine = InferenceEngine(model_path=path, num_threads=threads, max_batch=1)
+    for _, _, img in images[:warmup]:
+        engine.predict(img)
+
+    latencies = []
+    labels = []
+    for _, _, img in images:
+        t0 = time.perf_counter()
+        conf = engine.predict(img)
+        latencies.append((time.perf_counter() - t0) * 1000.0)
+        labels.append(classify_label(conf))
+    return np.array(latencies), labels
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CrustaScope model variant speed/accuracy report")
+    parser.add_argument("image_dir")
+    parser.add_argument("--model-dir", default=None)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--warmup", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    variants = available_variants(args.model_dir)
+    if not variants:
+        log.error("No model variants found.")
+        return 1
+
+    images = load_images(args.image_dir)
+    if not images:
+        log.error("No images found in %s.", args.image_dir)
+        return 1
+    log.info("%d images, variants: %s", len(images), ", ".join(variants))
+
+    results = {}
+    for variant, path in variants.items():
+        results[variant] = run_variant(path, images, args.threads, args.warmup)
+
+    reference = results.get("float32", (None, None))[1]
+    truths = [truth for _, truth, _ in images]
+    has_truth = any(t is not None for t in truths)
+
+    header = f"{'variant':<10}{'p50 ms':>10}{'p90 ms':>10}{'p99 ms':>10}{'agree f32':>12}"
+    if has_truth:
+        header += f"{'accuracy':>10}"
+    print(header)
+    print("-" * len(header))
+
+    for variant, (lat, labels) in results.items():
+        p50, p90, p99 = np.percentile(lat, [50, 90, 99])
+        line = f"{variant:<10}{p50:>10.2f}{p90:>10.2f}{p99:>10.2f}"
+        if reference is not None:
+            agree = sum(a == b for a, b in zip(labels, reference)) / len(labels)
+            line += f"{agree * 100:>11.1f}%"
+        else:
+            line += f"{'n/a':>12}"
+        if has_truth:
+            scored = [(l, t) for l, t in zip(labels, truths) if t is not None]
+            acc = sum(l == t for l, t in scored) / len(scored)
+            line += f"{acc * 100:>9.1f}%"
+        print(line)
+
+        if reference is not None and variant != "float32":
+            for (path, _, _), label, ref in zip(images, labels, reference):
+                if label != ref:
+                    print(f"    differs: {path}: {label} (float32: {ref})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,256 @@
+import time
+import weakref
+import threading
+from collections import OrderedDict
+
+import metrics
+from log_config import get_logger
+from jpeg_codec import is_raw_jpeg, decode_raw_jpeg
+
+log = get_logger("pipeline")
+
+_CAPTURE_SECONDS = metrics.STAGE_SECONDS.labels(stage="capture")
+_ENCODE_SECONDS = metrics.STAGE_SECONDS.labels(stage="encode")
+
+
+# ─────────────────────────────────────────────
+# Latest-frame queue
+# ─────────────────────────────────────────────
+class LatestQueue:
+    """
+    Bounded queue that never blocks the producer.
+    When full, the oldest item is dropped so consumers always see fresh frames.
+    """
+
+    def __init__(self, maxsize: int = 1):
+        self.maxsize = max(1, int(maxsize))
+        self._items = []
+        self._cond = threading.Condition()
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.pop(0)
+                self.dropped += 1
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout: float = None):
+        with self._cond:
+            if not self._items:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            return self._items.pop(0)
+
+    def clear(self):
+        with self._cond:
+            self._items.clear()
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+# ─────────────────────────────────────────────
+# Capture → inference → encode pipeline
+# ─────────────────────────────────────────────
+class FramePipeline:
+    """
+    Runs camera capture and JPEG encoding on separate threads, handing
+    frames to inference in between.
+
+    - grab thread reads the camera at its native rate
+    - frames go to a shared inference worker via submit_fn, which
+      reports back through set_result
+    - an optional gate (see frame_gate.py) skips inference on unchanged
+      frames; the previous result is kept
+    - encode stage overlays the latest result and JPEG-encodes every grabbed frame;
+      cameras delivering raw MJPEG skip the encode and forward their own JPEG
+
+    Readers (e.g. /video_feed) only ever touch the most recent encoded frame.
+    """
+
+    def __init__(self, capture, submit_fn, encode_fn, queue_size: int = 1, name: str = "camera",
+                 on_encoded=None, gate=None, prepare_fn=None, keep_jpegs: int = 0,
+                 on_skip=None):
+        # submit_fn(frame) queues a frame for inference (must not block)
+        # encode_fn(frame, result) -> bytes | None
+        # on_encoded(annotated_frame, jpeg) is called once per encoded frame
+        # gate.should_infer(frame) -> bool decides whether a frame needs the model
+        # on_skip(frame) is called for each frame the gate skipped
+        # prepare_fn(frame) -> new frame to draw on and encode (e.g. downscaled)
+        # keep_jpegs: remember the JPEG of this many recent frames for jpeg_for()
+        self.capture = capture
+        self.submit_fn = submit_fn
+        self.encode_fn = encode_fn
+        self.on_encoded = on_encoded
+        self.gate = gate
+        self.on_skip = on_skip
+        self.prepare_fn = prepare_fn
+        self.keep_jpegs = keep_jpegs
+        self._recent_jpegs = OrderedDict()
+        self._recent_lock = threading.Lock()
+        self.name = name
+
+        self.encode_q = LatestQueue(queue_size)
+
+        self.running = False
+        self._threads = []
+
+        self._frame_cond = threading.Condition()
+        self._jpeg = None
+        self._jpeg_seq = 0
+
+        self._result_lock = threading.Lock()
+        self._result = None
+
+        self.frames_grabbed = 0
+        self.frames_inferred = 0
+        self.frames_skipped = 0
+        self.frames_encoded = 0
+        self.frames_passthrough = 0
+
+    # ── lifecycle ──
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._threads = [
+            threading.Thread(target=self._grab_loop, name=f"{self.name}-grab", daemon=True),
+            threading.Thread(target=self._encode_loop, name=f"{self.name}-encode", daemon=True),
+        ]
+        for t in self._threads:
+            t.start()
+        log.info("Pipeline '%s' started.", self.name)
+
+    def stop(self, timeout: float = 2.0):
+        self.running = False
+        self.encode_q.clear()
+        with self._frame_cond:
+            self._frame_cond.notify_all()
+        current = threading.current_thread()
+        for t in self._threads:
+            if t is not current:
+                t.join(timeout)
+        self._threads = []
+        if self.capture is not None:
+            self.capture.release()
+            log.info("Camera released by pipeline '%s'.", self.name)
+            self.capture = None
+
+    # ── stages ──
+    def _grab_loop(self):
+        while self.running:
+            started = metrics.now()
+            success, frame = self.capture.read()
+            _CAPTURE_SECONDS.observe_since(started)
+            if not success:
+                log.warning("Camera read failed.", extra={"pipeline": self.name})
+                self.running = False
+                with self._frame_cond:
+                    self._frame_cond.notify_all()
+                break
+            raw = None
+            if is_raw_jpeg(frame):
+                # Camera handed back its own MJPEG frame; decode only for inference
+                raw = frame.tobytes()
+                frame = decode_raw_jpeg(frame)
+                if frame is None:
+                    continue
+            self.frames_grabbed += 1
+            if self.gate is not None and not self.gate.should_infer(frame):
+                self.frames_skipped += 1
+                if self.on_skip is not None:
+                    try:
+                        self.on_skip(frame)
+                    except Exception as e:
+                        log.error("Skipped-frame handling failed: %s", e)
+            else:
+                self.submit_fn(frame)
+            self.encode_q.put((frame, raw))
+
+    def _encode_loop(self):
+        while self.running:
+            item = self.encode_q.get(timeout=0.5)
+            if item is None:
+                continue
+            src, raw = item
+            if raw is not None:
+                frame, jpeg, tag = src, raw, "native"
+                self.frames_passthrough += 1
+            else:
+                started = metrics.now()
+                # Overlay is drawn on a copy so the inference worker never sees it
+                frame = self.prepare_fn(src) if self.prepare_fn is not None else src.copy()
+                try:
+                    jpeg = self.encode_fn(frame, self.latest_result())
+                except Exception as e:
+                    log.error("Frame encode failed: %s", e)
+                    continue
+                _ENCODE_SECONDS.observe_since(started)
+                if jpeg is None:
+                    continue
+                tag = "stream"
+            if self.keep_jpegs:
+                self._remember_jpeg(src, tag, jpeg)
+            with self._frame_cond:
+                self._jpeg = jpeg
+                self._jpeg_seq += 1
+                self._frame_cond.notify_all()
+            self.frames_encoded += 1
+            if self.on_encoded is not None:
+                try:
+                    self.on_encoded(frame, jpeg)
+                except Exception as e:
+                    log.error("Frame publish failed: %s", e)
+
+    def _remember_jpeg(self, src, tag, jpeg):
+        # Weak reference: the entry is only usable while someone still holds the frame
+        with self._recent_lock:
+            self._recent_jpegs[id(src)] = (weakref.ref(src), tag, jpeg)
+            while len(self._recent_jpegs) > self.keep_jpegs:
+                self._recent_jpegs.popitem(last=False)
+
+    def jpeg_for(self, frame):
+        """
+        (tag, jpeg) already produced for this grabbed frame, or None.
+        tag is "stream" (encode_fn output) or "native" (camera MJPEG).
+        """
+        with self._recent_lock:
+            entry = self._recent_jpegs.get(id(frame))
+        if entry is None or entry[0]() is not frame:
+            return None
+        return entry[1], entry[2]
+
+    def set_result(self, result):
+        with self._result_lock:
+            self._result = result
+        self.frames_inferred += 1
+
+    # ── readers ──
+    def latest_result(self):
+        with self._result_lock:
+            return self._result
+
+    def latest_frame(self):
+        with self._frame_cond:
+            return self._jpeg_seq, self._jpeg
+
+    def wait_for_frame(self, last_seq: int, timeout: float = 1.0):
+        """
+        Block until an encoded frame newer than last_seq is available.
+        Returns (seq, jpeg_bytes); jpeg_bytes is None on timeout or stop.
+        """
+        deadline = time.monotonic() + timeout
+        with self._frame_cond:
+            while self.running and self._jpeg_seq <= last_seq:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return last_seq, None
+                self._frame_cond.wait(remaining)
+            if self._jpeg_seq <= last_seq:
+                return last_seq, None
+            return self._jpeg_seq, self._jpeg
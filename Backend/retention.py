@@ -0,0 +1,422 @@
+import os
+import time
+import base64
+import binascii
+import threading
+from datetime import datetime, timedelta, timezone
+
+import cv2
+import numpy as np
+from pymongo.errors import OperationFailure
+
+import metrics
+from log_config import get_logger
+from snapshot_writer import make_thumbnail, perceptual_hash, hash_distance
+
+log = get_logger("retention")
+
+
+# ─────────────────────────────────────────────
+# Snapshot retention policy
+# ─────────────────────────────────────────────
+SNAP_RETENTION_ENABLED = os.getenv("SNAP_RETENTION_ENABLED", "1") == "1"
+# Seconds between retention/compaction passes
+SNAP_RETENTION_INTERVAL = float(os.getenv("SNAP_RETENTION_INTERVAL", "3600"))
+# Per kind: maximum age in days (TTL index) and maximum documents kept;
+# 0 = unlimited. Snapshots are kept forever unless these are set.
+SNAP_RETENTION_POLICIES = {
+    "wssv": {
+        "max_age_days": float(os.getenv("SNAP_RETENTION_DAYS_WSSV", "0")),
+        "max_count": int(os.getenv("SNAP_MAX_COUNT_WSSV", "0")),
+    },
+    "healthy": {
+        "max_age_days": float(os.getenv("SNAP_RETENTION_DAYS_HEALTHY", "0")),
+        "max_count": int(os.getenv("SNAP_MAX_COUNT_HEALTHY", "0")),
+    },
+}
+# Documents examined per compaction batch
+SNAP_COMPACT_BATCH = int(os.getenv("SNAP_COMPACT_BATCH", "200"))
+# Lossy steps (deduplication, cold tier) only run when asked for
+# Point near-duplicate snapshots at one shared image (the others' blobs are then swept)
+SNAP_DEDUPE_ENABLED = os.getenv("SNAP_DEDUPE_ENABLED", "0") == "1"
+# pHash bits (of 64) two snapshots of one camera may differ by and still count as duplicates
+SNAP_DEDUPE_DISTANCE = int(os.getenv("SNAP_DEDUPE_DISTANCE", "6"))
+# Only snapshots this close in time are compared (seconds)
+SNAP_DEDUPE_WINDOW = float(os.getenv("SNAP_DEDUPE_WINDOW", "3600"))
+# Images older than this many days are downscaled into the cold tier; 0 disables
+SNAP_COLD_AFTER_DAYS = float(os.getenv("SNAP_COLD_AFTER_DAYS", "0"))
+SNAP_COLD_MAX_SIDE = int(os.getenv("SNAP_COLD_MAX_SIDE", "640"))
+SNAP_COLD_QUALITY = int(os.getenv("SNAP_COLD_QUALITY", "60"))
+# Blob store for cold images ("local" keeps them out of MongoDB and its backups)
+SNAP_COLD_STORE = os.getenv("SNAP_COLD_STORE", "")
+# Unreferenced blobs younger than this are left alone (a write may be in flight)
+SNAP_ORPHAN_GRACE = float(os.getenv("SNAP_ORPHAN_GRACE", "3600"))
+
+# Fields older documents embedded the image in (binary or base64)
+LEGACY_IMAGE_FIELDS = ("image_bytes", "image_base64", "image", "img")
+TTL_INDEX = "created_ts_ttl"
+# MongoDB's largest expireAfterSeconds; keeps the index (cold-tier scans use it) without expiring
+_TTL_NEVER = 2147483647
+_STATE_COLLECTION = "snap_retention_state"
+
+SNAPS_REMOVED = metrics.counter("snapshot_retention_removed_total",
+                                "Snapshots removed by the count policy.", ["kind"])
+SNAPS_COMPACTED = metrics.counter("snapshot_compaction_total",
+                                  "Snapshot compaction actions (migrated, deduplicated, cold, orphan_blob).",
+                                  ["action"])
+PASS_SECONDS = metrics.histogram("snapshot_retention_pass_seconds", "Duration of one retention pass.",
+                                 buckets=(0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0))
+
+
+def embedded_image(doc: dict):
+    """Image bytes embedded in a legacy document (binary or base64), or None."""
+    for field in LEGACY_IMAGE_FIELDS:
+        data = doc.get(field)
+        if not data:
+            continue
+        if isinstance(data, str):
+            return base64.b64decode(data)
+        return bytes(data)
+    return None
+
+
+def created_datetime(doc: dict) -> datetime:
+    """UTC creation time from created_ts, the ISO created_at/timestamp strings, or the ObjectId."""
+    value = doc.get("created_ts")
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    for field in ("created_at", "timestamp"):
+        try:
+            parsed = datetime.fromisoformat(str(doc[field]).replace("Z", "+00:00"))
+        except (KeyError, ValueError):
+            continue
+        return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+    return doc["_id"].generation_time
+
+
+def ensure_retention_indexes(col, kind: str, expire: bool = SNAP_RETENTION_ENABLED):
+    """
+    TTL index on created_ts for the kind's age policy, plus blob-reference
+    lookups. With expire=False (retention disabled) the index is kept but
+    never expires anything, including an index built while it was enabled.
+    """
+    days = SNAP_RETENTION_POLICIES.get(kind, {}).get("max_age_days", 0) if expire else 0
+    seconds = int(days * 86400) if days > 0 else _TTL_NEVER
+    try:
+        col.create_index("created_ts", name=TTL_INDEX, expireAfterSeconds=seconds)
+    except OperationFailure:
+        # Policy changed since the index was built
+        col.database.command("collMod", col.name, index={"name": TTL_INDEX, "expireAfterSeconds": seconds})
+    col.create_index("image_blob", name="image_blob", sparse=True)
+    col.create_index("thumb_blob", name="thumb_blob", sparse=True)
+
+
+# ─────────────────────────────────────────────
+# Background retention / compaction job
+# ─────────────────────────────────────────────
+class RetentionEngine:
+    """
+    Keeps snapshot storage bounded. Each pass, per kind:
+
+    1. count policy: drops the oldest documents past max_count
+       (age is enforced by MongoDB itself through the TTL index);
+    2. compaction: walks documents not seen yet (by _id) and moves legacy
+       embedded/base64 images into the blob store, backfills created_ts
+       and phash, and (with SNAP_DEDUPE_ENABLED) points near-duplicates
+       (same camera, close in time, similar pHash) at the image of the
+       snapshot they repeat;
+    3. cold tier (when SNAP_COLD_AFTER_DAYS is set): re-encodes older
+       images at SNAP_COLD_MAX_SIDE into the cold store.
+
+    Finally blobs that no document references any more (TTL expiry,
+    count policy, deduplication, tiering) are deleted from every store.
+    """
+
+    def __init__(self, db, get_collection, blob_stores: dict, hot_store, cold_store=None,
+                 interval: float = SNAP_RETENTION_INTERVAL, batch_size: int = SNAP_COMPACT_BATCH):
+        self.db = db
+        self.get_collection = get_collection
+        self.blob_stores = blob_stores
+        self.hot_store = hot_store
+        self.cold_store = cold_store or hot_store
+        self.interval = interval
+        self.batch_size = batch_size
+        self.state = db[_STATE_COLLECTION]
+
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        # (kind, camera) -> the last snapshot kept as an original, for dedupe
+        self._last_kept = {}
+
+        self.passes = 0
+        self.failures = 0
+        self.last_pass = None
+        self.totals = {"removed": 0, "migrated": 0, "deduplicated": 0, "cold": 0, "orphan_blobs": 0}
+
+    # ── lifecycle ──
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-retention", daemon=True)
+        self._thread.start()
+        log.info("Snapshot retention started.", extra={"interval_s": self.interval})
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def trigger(self):
+        """Run a pass now instead of waiting for the interval."""
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                self.failures += 1
+                log.warning("Retention pass failed: %s", e)
+            self._wake.wait(self.interval)
+            self._wake.clear()
+
+    def stats(self):
+        return {
+            "enabled": True,
+            "interval_s": self.interval,
+            "policies": SNAP_RETENTION_POLICIES,
+            "dedupe": SNAP_DEDUPE_ENABLED,
+            "cold_after_days": SNAP_COLD_AFTER_DAYS,
+            "cold_store": self.cold_store.name,
+            "passes": self.passes,
+            "failures": self.failures,
+            "last_pass": self.last_pass,
+            "totals": dict(self.totals),
+        }
+
+    # ── one pass ──
+    def run_once(self) -> dict:
+        started = metrics.now()
+        counts = {k: 0 for k in self.totals}
+        for kind, policy in SNAP_RETENTION_POLICIES.items():
+            col = self.get_collection(kind)
+            if col is None:
+                continue
+            counts["removed"] += self.enforce_count(kind, col, policy.get("max_count", 0))
+            for action, n in self.compact(kind, col).items():
+                counts[action] += n
+            counts["cold"] += self.tier_cold(col)
+            if self._stop.is_set():
+                break
+        if not self._stop.is_set():
+            counts["orphan_blobs"] = self.sweep_orphans()
+
+        for action, n in counts.items():
+            self.totals[action] += n
+        self.passes += 1
+        PASS_SECONDS.observe_since(started)
+        self.last_pass = {
+            "finished_at": datetime.utcnow().isoformat(),
+            "seconds": round(metrics.now() - started, 2),
+            **counts,
+        }
+        if any(counts.values()):
+            log.info("Retention pass done.", extra=counts)
+        return counts
+
+    def enforce_count(self, kind: str, col, max_count: int) -> int:
+        if max_count <= 0 or col.estimated_document_count() <= max_count:
+            return 0
+        # Newest-first on the gallery index; everything past max_count goes
+        cutoff = list(
+            col.find({}, {"created_at": 1}).sort([("created_at", -1), ("_id", -1)]).skip(max_count).limit(1)
+        )
+        if not cutoff:
+            return 0
+        created_at, oid = cutoff[0].get("created_at"), cutoff[0]["_id"]
+        if created_at is None:
+            query = {"created_at": None, "_id": {"$lte": oid}}
+        else:
+            query = {"$or": [
+                {"created_at": {"$lt": created_at}},
+                {"created_at": created_at, "_id": {"$lte": oid}},
+                {"created_at": None},
+            ]}
+        # Blobs are released by the orphan sweep
+        removed = col.delete_many(query).deleted_count
+        SNAPS_REMOVED.labels(kind).inc(removed)
+        log.info("Removed %d %s snapshot(s) over the %d limit.", removed, kind, max_count)
+        return removed
+
+    # ── compaction ──
+    def _watermark(self, kind):
+        doc = self.state.find_one({"_id": f"compact:{kind}"})
+        return doc["last_id"] if doc else None
+
+    def compact(self, kind: str, col) -> dict:
+        """
+        Processes documents with an _id past the stored watermark. Snapshots
+        replayed from the writer's spool can land below it; they are written
+        in the current format already, so only deduplication is missed.
+        """
+        counts = {"migrated": 0, "deduplicated": 0}
+        last_id = self._watermark(kind)
+        while not self._stop.is_set():
+            query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+            docs = list(col.find(query).sort("_id", 1).limit(self.batch_size))
+            if not docs:
+                break
+            for doc in docs:
+                for action in self._compact_doc(kind, col, doc):
+                    counts[action] += 1
+                    SNAPS_COMPACTED.labels(action).inc()
+            last_id = docs[-1]["_id"]
+            self.state.update_one({"_id": f"compact:{kind}"}, {"$set": {"last_id": last_id}}, upsert=True)
+        return counts
+
+    def _compact_doc(self, kind, col, doc):
+        updates, unset, actions = {}, {}, []
+        jpeg = None
+
+        if not doc.get("image_blob"):
+            try:
+                jpeg = embedded_image(doc)
+            except (binascii.Error, ValueError) as e:
+                log.warning("Unreadable legacy image in %s: %s", doc["_id"], e)
+            if jpeg:
+                updates.update(image_blob=self.hot_store.put(jpeg), image_store=self.hot_store.name,
+                               image_size=len(jpeg))
+                if not doc.get("thumb_blob"):
+                    img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                    thumb = make_thumbnail(img) if img is not None else None
+                    if thumb is not None:
+                        updates.update(thumb_blob=self.hot_store.put(thumb), thumb_store=self.hot_store.name)
+                actions.append("migrated")
+                unset = {f: "" for f in LEGACY_IMAGE_FIELDS if f in doc}
+
+        created = created_datetime(doc)
+        if not isinstance(doc.get("created_ts"), datetime):
+            updates["created_ts"] = created
+
+        phash = doc.get("phash")
+        if phash is None:
+            if jpeg is None and doc.get("image_blob"):
+                store = self.blob_stores.get(doc.get("image_store"))
+                jpeg = store.get(doc["image_blob"]) if store is not None else None
+            phash = perceptual_hash(jpeg) if jpeg else None
+            if phash is not None:
+                updates["phash"] = phash
+
+        image_blob = updates.get("image_blob", doc.get("image_blob"))
+        if SNAP_DEDUPE_ENABLED and phash is not None and image_blob:
+            key = (kind, doc.get("camera_index"))
+            kept = self._last_kept.get(key)
+            if (kept is not None and kept["image_blob"] != image_blob
+                    and abs((created - kept["created"]).total_seconds()) <= SNAP_DEDUPE_WINDOW
+                    and hash_distance(phash, kept["phash"]) <= SNAP_DEDUPE_DISTANCE):
+                # Keep the metadata (confidence, sensors); share the earlier image
+                updates.update({f: kept[f] for f in ("image_blob", "image_store", "image_size",
+                                                     "thumb_blob", "thumb_store") if kept.get(f)})
+                updates["dedup_of"] = kept["_id"]
+                actions.append("deduplicated")
+            else:
+                merged = {**doc, **updates}
+                self._last_kept[key] = {
+                    "_id": doc["_id"], "created": created, "phash": phash,
+                    **{f: merged.get(f) for f in ("image_blob", "image_store", "image_size",
+                                                  "thumb_blob", "thumb_store")},
+                }
+
+        if updates or unset:
+            change = {"$set": updates} if updates else {}
+            if unset:
+                change["$unset"] = unset
+            col.update_one({"_id": doc["_id"]}, change)
+        return actions
+
+    # ── cold tier ──
+    def tier_cold(self, col) -> int:
+        if SNAP_COLD_AFTER_DAYS <= 0:
+            return 0
+        cutoff = datetime.now(timezone.utc) - timedelta(days=SNAP_COLD_AFTER_DAYS)
+        query = {"created_ts": {"$lt": cutoff}, "tier": {"$ne": "cold"}, "image_blob": {"$exists": True}}
+        # Duplicates share a blob, and so share its cold copy
+        converted = {}
+        moved = 0
+        while not self._stop.is_set():
+            docs = list(col.find(query, {"image_blob": 1, "image_store": 1, "image_size": 1})
+                        .limit(self.batch_size))
+            if not docs:
+                break
+            for doc in docs:
+                blob_id = doc["image_blob"]
+                if blob_id not in converted:
+                    converted[blob_id] = self._cold_copy(doc)
+                new = converted[blob_id]
+                change = {"tier": "cold"}
+                if new is not None:
+                    change.update(image_blob=new[0], image_store=self.cold_store.name, image_size=new[1],
+                                  hot_image_size=doc.get("image_size"))
+                col.update_one({"_id": doc["_id"]}, {"$set": change})
+                moved += 1
+                SNAPS_COMPACTED.labels("cold").inc()
+        return moved
+
+    def _cold_copy(self, doc):
+        """(blob id, size) of the downscaled image, or None to keep the original."""
+        store = self.blob_stores.get(doc.get("image_store"))
+        jpeg = store.get(doc["image_blob"]) if store is not None else None
+        if not jpeg:
+            return None
+        img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            return None
+        h, w = img.shape[:2]
+        scale = SNAP_COLD_MAX_SIDE / float(max(h, w))
+        if scale < 1.0:
+            img = cv2.resize(img, (max(1, int(w * scale)), max(1, int(h * scale))),
+                             interpolation=cv2.INTER_AREA)
+        ok, buf = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, SNAP_COLD_QUALITY])
+        if not ok or buf.size >= len(jpeg):
+            # Already small: recompressing would only lose quality
+            if store is self.cold_store:
+                return None
+            return self.cold_store.put(jpeg), len(jpeg)
+        data = buf.tobytes()
+        return self.cold_store.put(data), len(data)
+
+    # ── orphaned blobs ──
+    def sweep_orphans(self) -> int:
+        cols = [c for c in (self.get_collection(k) for k in SNAP_RETENTION_POLICIES) if c is not None]
+        older_than = time.time() - SNAP_ORPHAN_GRACE
+        removed = 0
+        for store in {id(s): s for s in self.blob_stores.values()}.values():
+            chunk = []
+            for blob_id in store.iter_blobs(older_than):
+                chunk.append(blob_id)
+                if len(chunk) >= 500:
+                    removed += self._drop_unreferenced(store, cols, chunk)
+                    chunk = []
+                if self._stop.is_set():
+                    return removed
+            if chunk:
+                removed += self._drop_unreferenced(store, cols, chunk)
+        return removed
+
+    def _drop_unreferenced(self, store, cols, blob_ids) -> int:
+        referenced = set()
+        for col in cols:
+            for field in ("image_blob", "thumb_blob"):
+                referenced.update(col.distinct(field, {field: {"$in": blob_ids}}))
+        removed = 0
+        for blob_id in blob_ids:
+            if blob_id not in referenced:
+                store.delete(blob_id)
+                removed += 1
+        if removed:
+            SNAPS_COMPACTED.labels("orphan_blob").inc(removed)
+        return removed
@@ -0,0 +1,150 @@
+import os
+import time
+import threading
+
+import numpy as np
+
+from log_config import get_logger
+
+log = get_logger("sensors")
+
+
+# ─────────────────────────────────────────────
+# Acquisition config
+# ─────────────────────────────────────────────
+# Samples taken per channel each cycle
+ADC_SAMPLES = int(os.getenv("ADC_SAMPLES", "32"))
+# "median" or "trimmed" (trimmed mean)
+ADC_FILTER = os.getenv("ADC_FILTER", "median").lower()
+# Fraction cut from each end for the trimmed mean
+ADC_TRIM = float(os.getenv("ADC_TRIM", "0.2"))
+# How often the temperature thread reads the DS18B20
+TEMP_INTERVAL_SECONDS = float(os.getenv("TEMP_INTERVAL_SECONDS", "2"))
+
+
+def filter_samples(samples, method: str = ADC_FILTER, trim: float = ADC_TRIM):
+    """
+    Robust estimate of a burst of samples. Returns (value, stddev, n);
+    value is None when there are no samples.
+    """
+    x = np.asarray(samples, dtype=np.float64)
+    x = x[np.isfinite(x)]
+    n = int(x.size)
+    if n == 0:
+        return None, None, 0
+    if method == "trimmed":
+        x.sort()
+        k = int(n * trim)
+        core = x[k:n - k] if n - 2 * k > 0 else x
+        value = float(core.mean())
+    else:
+        value = float(np.median(x))
+    return value, float(x.std()), n
+
+
+# ─────────────────────────────────────────────
+# ADS1115 burst sampler
+# ─────────────────────────────────────────────
+class AdcSampler:
+    """
+    Reads a burst of samples per channel instead of a single conversion.
+
+    Uses continuous-conversion mode when the driver supports it: the ADC
+    keeps converting the selected channel and each read just fetches the
+    latest result, paced at the configured data rate. The first sample
+    after switching channels is discarded while the input settles.
+    """
+
+    def __init__(self, ads, channels: dict, samples: int = ADC_SAMPLES,
+                 method: str = ADC_FILTER, trim: float = ADC_TRIM):
+        # channels: {name: AnalogIn}
+        self.ads = ads
+        self.channels = channels
+        self.samples = max(1, samples)
+        self.method = method
+        self.trim = trim
+        self.continuous = self._enable_continuous()
+        rate = getattr(ads, "data_rate", None) or 860
+        self.period = 1.0 / float(rate)
+
+    def _enable_continuous(self) -> bool:
+        if getattr(self.ads, "simulated", False):
+            return False  # simulated channels already pace themselves
+        try:
+            from adafruit_ads1x15.ads1x15 import Mode
+            self.ads.mode = Mode.CONTINUOUS
+            return True
+        except Exception as e:
+            log.warning("ADC continuous mode unavailable, using single-shot reads: %s", e)
+            return False
+
+    def _burst(self, channel):
+        values = []
+        if self.continuous:
+            channel.voltage  # switch channel, discard the settling sample
+        for _ in range(self.samples):
+            try:
+                values.append(channel.voltage)
+            except Exception as e:
+                log.warning("ADC read failed: %s", e)
+                continue
+            if self.continuous:
+                # No point reading faster than the ADC converts
+                time.sleep(self.period)
+        return values
+
+    def read(self) -> dict:
+        """{name: (value, stddev, n)} for every channel."""
+        return {
+            name: filter_samples(self._burst(channel), self.method, self.trim)
+            for name, channel in self.channels.items()
+        }
+
+
+# ─────────────────────────────────────────────
+# DS18B20 reader thread
+# ─────────────────────────────────────────────
+class TemperatureReader:
+    """
+    Reads the 1-wire thermometer on its own thread. A conversion takes
+    ~750 ms; the ADC loop just picks up the latest value.
+    """
+
+    def __init__(self, sensor, interval: float = TEMP_INTERVAL_SECONDS):
+        self.sensor = sensor
+        self.interval = interval
+        self._value = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.sensor is None or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="temperature", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.monotonic()
+            try:
+                value = round(self.sensor.get_temperature(), 2)
+            except Exception as e:
+                log.warning("Temp read failed: %s", e)
+                value = None
+            with self._lock:
+                self._value = value
+                self._read_at = time.monotonic()
+            self._stop.wait(max(0.0, self.interval - (time.monotonic() - started)))
+
+    def latest(self, max_age: float = None):
+        """Last reading, or None if there is none or it is older than max_age."""
+        max_age = 3 * self.interval if max_age is None else max_age
+        with self._lock:
+            if self._value is None or time.monotonic() - self._read_at > max_age:
+                return None
+            return self._value
@@ -0,0 +1,235 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+import metrics
+from log_config import get_logger
+from sensor_history import RollupAccumulator, write_rollups
+
+log = get_logger("sensor_buffer")
+
+_INSERT_SECONDS = metrics.MONGO_SECONDS.labels(op="sensor_insert")
+_ROLLUP_SECONDS = metrics.MONGO_SECONDS.labels(op="sensor_rollup")
+
+
+# ─────────────────────────────────────────────
+# Local write-ahead buffer for sensor readings
+# ─────────────────────────────────────────────
+SENSOR_BUFFER_PATH = os.getenv("SENSOR_BUFFER_PATH", "sensor_buffer.db")
+# Oldest readings are dropped past this many rows (~11 days at 2 s)
+SENSOR_BUFFER_MAX_ROWS = int(os.getenv("SENSOR_BUFFER_MAX_ROWS", "500000"))
+SENSOR_FLUSH_INTERVAL = float(os.getenv("SENSOR_FLUSH_INTERVAL", "10"))
+SENSOR_FLUSH_BATCH = int(os.getenv("SENSOR_FLUSH_BATCH", "500"))
+SENSOR_FLUSH_MAX_BACKOFF = float(os.getenv("SENSOR_FLUSH_MAX_BACKOFF", "300"))
+
+
+def _connect(path: str):
+    conn = sqlite3.connect(path, timeout=5.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+class SensorBuffer:
+    """
+    SQLite (WAL) queue every reading is appended to at loop rate.
+    Appending is a local write, so a slow or unreachable MongoDB never
+    stalls acquisition, and buffered readings survive restarts.
+    """
+
+    def __init__(self, path: str = SENSOR_BUFFER_PATH, max_rows: int = SENSOR_BUFFER_MAX_ROWS):
+        self.path = path
+        self.max_rows = max_rows
+        self._conn = _connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS readings ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT, ts REAL NOT NULL, doc TEXT NOT NULL)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self._conn.commit()
+        self.appended = 0
+        self.dropped = 0
+
+    def append(self, doc: dict, ts: float = None):
+        ts = time.time() if ts is None else ts
+        # _id fixed now so a retried insert_many cannot duplicate the reading
+        record = dict(doc)
+        record["_id"] = str(ObjectId())
+        with self._conn:
+            self._conn.execute(
+                "INSERT INTO readings (ts, doc) VALUES (?, ?)", (ts, json.dumps(record))
+            )
+        self.appended += 1
+        if self.max_rows and self.appended % 100 == 0:
+            self._trim()
+
+    def _trim(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM readings").fetchone()
+        excess = count - self.max_rows
+        if excess > 0:
+            with self._conn:
+                self._conn.execute(
+                    "DELETE FROM readings WHERE id IN (SELECT id FROM readings ORDER BY id LIMIT ?)",
+                    (excess,),
+                )
+            self.dropped += excess
+            log.warning("Sensor buffer full, dropped %d oldest reading(s).", excess)
+
+    def close(self):
+        self._conn.close()
+
+
+class SensorFlusher:
+    """
+    Drains the buffer into MongoDB on a background thread.
+
+    Every buffered reading feeds the minute/hour rollups. Raw documents
+    are downsampled at flush time: only the first reading of each
+    `db_interval`-second window goes to sensor_results. Batches use
+    insert_many; on failure rows stay buffered and retries back off
+    exponentially. The downsampling position is stored in the buffer,
+    so a restart resumes where it left off.
+
+    Pass either a database or connect(), which is called on the flusher
+    thread (and retried with the same backoff) until it returns one.
+    """
+
+    def __init__(self, db=None, collection_name: str = "sensor_results", path: str = SENSOR_BUFFER_PATH,
+                 db_interval: float = 300.0, interval: float = SENSOR_FLUSH_INTERVAL,
+                 batch_size: int = SENSOR_FLUSH_BATCH, max_backoff: float = SENSOR_FLUSH_MAX_BACKOFF,
+                 connect=None):
+        if db is None and connect is None:
+            raise ValueError("SensorFlusher needs db or connect")
+        self.db = db
+        self.connect = connect
+        self.collection_name = collection_name
+        self.path = path
+        self.db_interval = db_interval
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_backoff = max_backoff
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._backoff = 0.0
+
+        self.flushed = 0
+        self.inserted = 0
+        self.failures = 0
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name="sensor-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Stop after a final flush attempt."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self):
+        conn = _connect(self.path)
+        try:
+            while True:
+                stopping = self._stop.is_set()
+                try:
+                    if self.db is None:
+                        self.db = self.connect()
+                    while self._flush_batch(conn) == self.batch_size:
+                        pass  # catching up after an outage
+                    self._backoff = 0.0
+                except Exception as e:
+                    self.failures += 1
+                    self._backoff = min(self.max_backoff, max(self.interval, self._backoff * 2))
+                    log.warning("Sensor flush failed (retry in %.0fs): %s", self._backoff, e)
+                if stopping:
+                    break
+                self._stop.wait(self._backoff or self.interval)
+        finally:
+            conn.close()
+
+    def _last_window(self, conn):
+        value = self._meta(conn, "last_window")
+        return int(value) if value is not None else None
+
+    def _meta(self, conn, key: str):
+        row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _flush_batch(self, conn) -> int:
+        # A batch that failed part-way is retried with exactly the same rows
+        # (even across restarts); its end id keys the rollup merges
+        pending = self._meta(conn, "batch_end")
+        if pending is not None:
+            rows = conn.execute(
+                "SELECT id, ts, doc FROM readings WHERE id <= ? ORDER BY id", (int(pending),)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, ts, doc FROM readings ORDER BY id LIMIT ?", (self.batch_size,)
+            ).fetchall()
+        if not rows:
+            with conn:
+                conn.execute("DELETE FROM meta WHERE key = 'batch_end'")
+            return 0
+        batch_id = str(rows[-1][0])
+        if pending is None:
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('batch_end', ?)", (batch_id,))
+
+        last_window = self._last_window(conn)
+        rollups = RollupAccumulator()
+        finished = []
+        docs = []
+        for _, ts, raw in rows:
+            doc = json.loads(raw)
+            when = datetime.utcfromtimestamp(ts)
+            done = rollups.add(doc, when)
+            if done is not None:
+                finished.append(done)
+
+            window = int(ts // self.db_interval) if self.db_interval > 0 else None
+            if window is None or window != last_window:
+                doc["_id"] = ObjectId(doc["_id"])
+                doc["ts"] = when
+                docs.append(doc)
+                last_window = window
+        done = rollups.flush()
+        if done is not None:
+            finished.append(done)
+
+        if docs:
+            started = metrics.now()
+            try:
+                self.db[self.collection_name].insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # Duplicate _ids mean an earlier attempt already inserted them
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+            _INSERT_SECONDS.observe_since(started)
+        # Rollups merge with $inc; the batch id makes a retried merge a no-op
+        for minute, stats in finished:
+            started = metrics.now()
+            write_rollups(self.db, minute, stats, batch_id=batch_id)
+            _ROLLUP_SECONDS.observe_since(started)
+
+        with conn:
+            conn.execute("DELETE FROM readings WHERE id <= ?", (rows[-1][0],))
+            conn.execute("DELETE FROM meta WHERE key = 'batch_end'")
+            if last_window is not None:
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('last_window', ?)",
+                    (str(last_window),),
+                )
+        self.flushed += len(rows)
+        self.inserted += len(docs)
+        return len(rows)
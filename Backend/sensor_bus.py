@@ -0,0 +1,240 @@
+import os
+import json
+import math
+import mmap
+import struct
+from datetime import datetime
+
+from log_config import get_logger
+
+log = get_logger("sensor_bus")
+
+# ─────────────────────────────────────────────
+# Shared-memory sensor record
+# ─────────────────────────────────────────────
+# Written by sensor_reader.py, read by app.py. Fixed layout, guarded by a
+# seqlock: the writer bumps `seq` to odd before writing and back to even
+# after, readers retry if seq was odd or changed while they copied.
+SENSOR_SHM_PATH = os.getenv("SENSOR_SHM_PATH", "/dev/shm/crustascope_sensor")
+LATEST_SENSOR_JSON = os.getenv("LATEST_SENSOR_JSON", "latest_sensor.json")
+
+MAGIC = b"CSB1"
+LAYOUT_VERSION = 2                     # 2: + ADC sample count and stddevs
+
+HEADER = struct.Struct("<4sIQ")        # magic, layout version, seq
+PAYLOAD = struct.Struct("<12d")        # see FIELDS
+FIELDS = (
+    "timestamp",                       # epoch seconds
+    "temperature_c",
+    "ph",
+    "turbidity",
+    "tds",
+    "tds_v",
+    "ph_v",
+    "turb_v",
+    "samples",                         # ADC samples per channel
+    "tds_v_std",
+    "ph_v_std",
+    "turb_v_std",
+)
+SEQ_OFFSET = 8
+PAYLOAD_OFFSET = HEADER.size
+RECORD_SIZE = HEADER.size + PAYLOAD.size
+
+
+def _f(value):
+    return float("nan") if value is None else float(value)
+
+
+def _none(value):
+    return None if math.isnan(value) else value
+
+
+def shm_available(path: str = SENSOR_SHM_PATH) -> bool:
+    return os.path.isdir(os.path.dirname(path) or ".")
+
+
+def write_json_atomic(doc: dict, path: str = LATEST_SENSOR_JSON):
+    """
+    Write-then-rename so readers never see a half-written file.
+    """
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(doc, f)
+    os.replace(tmp, path)
+
+
+def read_json(path: str = LATEST_SENSOR_JSON):
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except Exception as e:
+        log.warning("Could not read %s: %s", path, e)
+        return None
+
+
+# ─────────────────────────────────────────────
+# Writer (sensor_reader.py)
+# ─────────────────────────────────────────────
+class SensorBusWriter:
+    """
+    Publishes sensor readings to shared memory, or to an atomically
+    replaced JSON file when shared memory is unavailable.
+    """
+
+    def __init__(self, path: str = SENSOR_SHM_PATH, json_path: str = LATEST_SENSOR_JSON):
+        self.path = path
+        self.json_path = json_path
+        self._mm = None
+        self._seq = 0
+        if shm_available(path):
+            try:
+                self._open()
+            except OSError as e:
+                log.warning("Shared-memory sensor bus unavailable, using JSON file: %s", e)
+                self._mm = None
+        else:
+            log.warning("Shared memory not available, using JSON file for live sensor data.")
+
+    def _open(self):
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, RECORD_SIZE)
+            self._mm = mmap.mmap(fd, RECORD_SIZE)
+        finally:
+            os.close(fd)
+        # Continue from the current sequence so readers never go backwards
+        magic, version, seq = HEADER.unpack_from(self._mm, 0)
+        self._seq = seq + (seq & 1) if magic == MAGIC and version == LAYOUT_VERSION else 0
+        HEADER.pack_into(self._mm, 0, MAGIC, LAYOUT_VERSION, self._seq)
+
+    @property
+    def using_shm(self) -> bool:
+        return self._mm is not None
+
+    def publish(self, doc: dict):
+        if self._mm is None:
+            write_json_atomic(doc, self.json_path)
+            return
+
+        raw = doc.get("raw_voltages") or {}
+        sampling = doc.get("sampling") or {}
+        std = sampling.get("stddev") or {}
+        ts = doc.get("timestamp")
+        epoch = datetime.fromisoformat(ts).timestamp() if ts else None
+        values = (
+            _f(epoch),
+            _f(doc.get("temperature_c")),
+            _f(doc.get("ph")),
+            _f(doc.get("turbidity")),
+            _f(doc.get("tds")),
+            _f(raw.get("tds_v")),
+            _f(raw.get("ph_v")),
+            _f(raw.get("turb_v")),
+            _f(sampling.get("samples")),
+            _f(std.get("tds_v")),
+            _f(std.get("ph_v")),
+            _f(std.get("turb_v")),
+        )
+        mm = self._mm
+        struct.pack_into("<Q", mm, SEQ_OFFSET, self._seq + 1)   # odd: write in progress
+        PAYLOAD.pack_into(mm, PAYLOAD_OFFSET, *values)
+        self._seq += 2
+        struct.pack_into("<Q", mm, SEQ_OFFSET, self._seq)       # even: consistent
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+            self._mm = None
+
+
+# ─────────────────────────────────────────────
+# Reader (app.py)
+# ─────────────────────────────────────────────
+class SensorBusReader:
+    """
+    Lock-free reader for the shared-memory record. Returns the same dict
+    shape as latest_sensor.json; falls back to that file when no shared
+    record exists. Unchanged readings are returned from cache.
+    """
+
+    MAX_RETRIES = 16
+
+    def __init__(self, path: str = SENSOR_SHM_PATH, json_path: str = LATEST_SENSOR_JSON):
+        self.path = path
+        self.json_path = json_path
+        self._mm = None
+        self._last_seq = None
+        self._last_doc = None
+        self.torn_retries = 0
+
+    def _open(self) -> bool:
+        if self._mm is not None:
+            return True
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except OSError:
+            return False
+        try:
+            if os.fstat(fd).st_size < RECORD_SIZE:
+                return False
+            self._mm = mmap.mmap(fd, RECORD_SIZE, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        return True
+
+    def read(self):
+        if not self._open():
+            return read_json(self.json_path)
+
+        mm = self._mm
+        magic, version, _ = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC or version != LAYOUT_VERSION:
+            return read_json(self.json_path)
+
+        for _ in range(self.MAX_RETRIES):
+            seq1 = struct.unpack_from("<Q", mm, SEQ_OFFSET)[0]
+            if seq1 == 0:
+                return None  # nothing published yet
+            if seq1 & 1:
+                self.torn_retries += 1
+                continue
+            if seq1 == self._last_seq:
+                return self._last_doc
+            values = PAYLOAD.unpack_from(mm, PAYLOAD_OFFSET)
+            seq2 = struct.unpack_from("<Q", mm, SEQ_OFFSET)[0]
+            if seq1 == seq2:
+                self._last_seq = seq1
+                self._last_doc = self._to_doc(values)
+                return self._last_doc
+            self.torn_retries += 1
+        # Writer is mid-update; last consistent reading is still valid
+        return self._last_doc
+
+    @staticmethod
+    def _to_doc(values) -> dict:
+        v = dict(zip(FIELDS, values))
+        ts = _none(v["timestamp"])
+        samples = _none(v["samples"])
+        return {
+            "timestamp": datetime.fromtimestamp(ts).isoformat() if ts is not None else None,
+            "temperature_c": _none(v["temperature_c"]),
+            "ph": _none(v["ph"]),
+            "turbidity": _none(v["turbidity"]),
+            "tds": _none(v["tds"]),
+            "raw_voltages": {
+                "tds_v": _none(v["tds_v"]),
+                "ph_v": _none(v["ph_v"]),
+                "turb_v": _none(v["turb_v"]),
+            },
+            "sampling": {
+                "samples": None if samples is None else int(samples),
+                "stddev": {
+                    "tds_v": _none(v["tds_v_std"]),
+                    "ph_v": _none(v["ph_v_std"]),
+                    "turb_v": _none(v["turb_v_std"]),
+                },
+            },
+        }
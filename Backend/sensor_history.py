@@ -0,0 +1,195 @@
+import os
+from datetime import datetime, timedelta
+
+from pymongo.errors import DuplicateKeyError
+
+
+# ─────────────────────────────────────────────
+# Sensor rollups
+# ─────────────────────────────────────────────
+# sensor_reader.py folds every live reading into per-minute and per-hour
+# rollup documents ({_id: bucket start (UTC), n, <metric>: {min, max, sum,
+# count}}). /sensor_history aggregates those server-side instead of
+# scanning raw readings, so a week-long chart touches ~170 hourly docs.
+METRICS = ("temperature_c", "ph", "turbidity", "tds")
+ROLLUP_COLLECTIONS = {
+    60: "sensor_rollup_1m",
+    3600: "sensor_rollup_1h",
+}
+# Merge markers kept per rollup document (an hour takes at most 60 per flush batch)
+ROLLUP_MARKERS = 64
+
+# Upper bound on points returned when no bucket is requested
+SENSOR_HISTORY_MAX_POINTS = int(os.getenv("SENSOR_HISTORY_MAX_POINTS", "300"))
+# Candidate bucket sizes (seconds) for automatic bucketing
+AUTO_BUCKETS = (60, 300, 900, 1800, 3600, 3 * 3600, 6 * 3600, 12 * 3600, 86400)
+
+_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def floor_time(dt: datetime, seconds: int) -> datetime:
+    epoch = datetime(1970, 1, 1)
+    offset = int((dt - epoch).total_seconds()) // seconds * seconds
+    return epoch + timedelta(seconds=offset)
+
+
+def rollup_update(stats: dict) -> dict:
+    """
+    Update that merges `stats` ({metric: (min, max, sum, count)}) into a
+    rollup document. $min/$max/$inc make it safe to apply partial buckets
+    (e.g. after a sensor reader restart) more than once per bucket.
+    """
+    update = {"$inc": {"n": stats.get("_n", 0)}, "$min": {}, "$max": {}}
+    for metric in METRICS:
+        if metric not in stats:
+            continue
+        lo, hi, total, count = stats[metric]
+        update["$min"][f"{metric}.min"] = lo
+        update["$max"][f"{metric}.max"] = hi
+        update["$inc"][f"{metric}.sum"] = total
+        update["$inc"][f"{metric}.count"] = count
+    if not update["$min"]:
+        del update["$min"], update["$max"]
+    return update
+
+
+class RollupAccumulator:
+    """
+    Collects live readings for the current minute in memory. add() returns
+    the finished minute's stats once a reading from a later minute arrives.
+    """
+
+    def __init__(self):
+        self.minute = None
+        self.stats = {}
+
+    def add(self, doc: dict, when: datetime):
+        minute = floor_time(when, 60)
+        finished = None
+        if self.minute is not None and minute != self.minute:
+            finished = self.flush()
+        self.minute = minute
+
+        self.stats["_n"] = self.stats.get("_n", 0) + 1
+        for metric in METRICS:
+            value = doc.get(metric)
+            if value is None:
+                continue
+            value = float(value)
+            cur = self.stats.get(metric)
+            if cur is None:
+                self.stats[metric] = (value, value, value, 1)
+            else:
+                lo, hi, total, count = cur
+                self.stats[metric] = (min(lo, value), max(hi, value), total + value, count + 1)
+        return finished
+
+    def flush(self):
+        """(minute, stats) for what has been collected so far, or None."""
+        if self.minute is None or not self.stats:
+            return None
+        finished = (self.minute, self.stats)
+        self.minute, self.stats = None, {}
+        return finished
+
+
+def write_rollups(db, minute: datetime, stats: dict, batch_id: str = None):
+    """
+    Merge one minute of readings into the minute and hour rollups.
+
+    With batch_id, each merge is recorded in the document's `merged`
+    markers and skipped if already there, so retrying a flush batch that
+    failed part-way does not count its minutes twice.
+    """
+    for seconds, name in ROLLUP_COLLECTIONS.items():
+        update = rollup_update(stats)
+        query = {"_id": floor_time(minute, seconds)}
+        if batch_id is not None:
+            marker = f"{batch_id}@{minute:%Y%m%d%H%M}"
+            query["merged"] = {"$ne": marker}
+            update["$push"] = {"merged": {"$each": [marker], "$slice": -ROLLUP_MARKERS}}
+        try:
+            db[name].update_one(query, update, upsert=True)
+        except DuplicateKeyError:
+            # The marker matched, so the upsert collided with the existing document
+            pass
+
+
+# ─────────────────────────────────────────────
+# Queries (app.py)
+# ─────────────────────────────────────────────
+def parse_bucket(value) -> int:
+    """'300', '5m', '1h', '1d' -> seconds, rounded up to whole minutes."""
+    text = str(value).strip().lower()
+    if text[-1:] in _UNITS:
+        seconds = int(float(text[:-1]) * _UNITS[text[-1]])
+    else:
+        seconds = int(float(text))
+    if seconds <= 0:
+        raise ValueError("bucket must be positive")
+    # Minute rollups are the finest level stored
+    return -(-seconds // 60) * 60
+
+
+def choose_bucket(start: datetime, end: datetime, max_points: int = SENSOR_HISTORY_MAX_POINTS) -> int:
+    span = (end - start).total_seconds()
+    for seconds in AUTO_BUCKETS:
+        if span / seconds <= max_points:
+            return seconds
+    return AUTO_BUCKETS[-1]
+
+
+def rollup_source(bucket_seconds: int) -> int:
+    """Coarsest rollup level that divides the bucket evenly."""
+    level = 60
+    for seconds in sorted(ROLLUP_COLLECTIONS):
+        if bucket_seconds % seconds == 0:
+            level = seconds
+    return level
+
+
+def history_pipeline(start: datetime, end: datetime, bucket_seconds: int) -> list:
+    bucket_ms = bucket_seconds * 1000
+    group = {
+        "_id": {"$subtract": ["$_id", {"$mod": [{"$toLong": "$_id"}, bucket_ms]}]},
+        "n": {"$sum": "$n"},
+    }
+    project = {"_id": 0, "t": "$_id", "n": 1}
+    for metric in METRICS:
+        group[f"{metric}_min"] = {"$min": f"${metric}.min"}
+        group[f"{metric}_max"] = {"$max": f"${metric}.max"}
+        group[f"{metric}_sum"] = {"$sum": f"${metric}.sum"}
+        group[f"{metric}_count"] = {"$sum": f"${metric}.count"}
+        project[metric] = {
+            "min": f"${metric}_min",
+            "max": f"${metric}_max",
+            "mean": {
+                "$cond": [
+                    {"$gt": [f"${metric}_count", 0]},
+                    {"$round": [{"$divide": [f"${metric}_sum", f"${metric}_count"]}, 3]},
+                    None,
+                ]
+            },
+        }
+    return [
+        {"$match": {"_id": {"$gte": start, "$lt": end}}},
+        {"$group": group},
+        {"$sort": {"_id": 1}},
+        {"$project": project},
+    ]
+
+
+def query_history(db, start: datetime, end: datetime, bucket_seconds: int) -> dict:
+    level = rollup_source(bucket_seconds)
+    name = ROLLUP_COLLECTIONS[level]
+    start = floor_time(start, bucket_seconds)
+    points = list(db[name].aggregate(history_pipeline(start, end, bucket_seconds)))
+    for p in points:
+        p["t"] = p["t"].isoformat()
+    return {
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "bucket_seconds": bucket_seconds,
+        "source": name,
+        "points": points,
+    }
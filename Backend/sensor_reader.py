@@ -1,66 +1,102 @@
 import os
 import time
-import json
+import signal
+import argparse
 from datetime import datetime
 
-import board
-import busio
 import pymongo
-from w1thermsensor import W1ThermSensor
 
-from adafruit_ads1x15.ads1115 import ADS1115
-from adafruit_ads1x15.analog_in import AnalogIn
+import hal
+import metrics
+from log_config import get_logger
+from sensor_bus import SensorBusWriter
+from sensor_buffer import SensorBuffer, SensorFlusher
+from sensor_acquisition import AdcSampler, TemperatureReader
+
+parser = argparse.ArgumentParser(description="Read the water-quality sensors.")
+parser.add_argument("--simulate", action="store_true",
+                    help="use simulated sensors instead of the ADS1115/DS18B20")
+parser.add_argument("--trace", default=hal.SIM_SENSOR_TRACE,
+                    help="CSV of recorded readings to replay when simulating")
+args = parser.parse_args()
+if args.simulate:
+    hal.enable_simulation()
+
+log = get_logger("sensor_reader")
 
 # ─────────────────────────────────────────────
 # Configurable intervals
 # ─────────────────────────────────────────────
-# How often to log a sensor reading into MongoDB (seconds)
+# Downsampling for raw readings in MongoDB: one per this many seconds
+# (every reading still feeds the minute/hour rollups)
 SENSOR_DB_INTERVAL_SECONDS = float(os.getenv("SENSOR_DB_INTERVAL_SECONDS", "300"))
-# How often to update latest_sensor.json + print live to console (seconds)
+# How often to publish the live reading + print live to console (seconds)
 LOOP_INTERVAL_SECONDS = float(os.getenv("SENSOR_LOOP_INTERVAL_SECONDS", "2"))
+# Port for this process's Prometheus /metrics (0 = off)
+SENSOR_METRICS_PORT = int(os.getenv("SENSOR_METRICS_PORT", "9101"))
+# Interface it listens on; 0.0.0.0 lets a remote Prometheus scrape it
+SENSOR_METRICS_HOST = os.getenv("SENSOR_METRICS_HOST", "127.0.0.1")
 
-LATEST_JSON = "latest_sensor.json"
+# Live reading goes to shared memory (falls back to latest_sensor.json)
+sensor_bus = SensorBusWriter()
 
 # ─────────────────────────────────────────────
 # MongoDB setup
 # ─────────────────────────────────────────────
 MONGO_URI = os.getenv("MONGODB_URI")
-client = None
-db = None
-sensor_collection = None
-
-if MONGO_URI:
+# How long (ms) each connection attempt waits for a MongoDB server
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", "10000"))
+
+def connect_mongo():
+    """
+    Opens the sensor database. Called (and retried with backoff) by the
+    flusher thread, so a network that is down at boot costs nothing but
+    buffered readings. mongodb+srv:// URIs fail here while DNS is down.
+    """
+    client = pymongo.MongoClient(MONGO_URI, serverSelectionTimeoutMS=MONGO_CONNECT_TIMEOUT_MS)
     try:
-        client = pymongo.MongoClient(MONGO_URI)
-        db = client["crustascope"]
-        sensor_collection = db["sensor_results"]
-        print("[INFO] Connected to MongoDB for sensor logging.")
-    except Exception as e:
-        print("[WARN] MongoDB connection failed:", e)
+        client.admin.command("ping")
+    except Exception:
+        client.close()
+        raise
+    log.info("Connected to MongoDB for sensor logging.")
+    return client["crustascope"]
+
+# Readings are appended to a local buffer at loop rate and flushed to
+# MongoDB in batches by a background thread, so outages never stall the loop
+sensor_buffer = None
+sensor_flusher = None
+if MONGO_URI:
+    sensor_buffer = SensorBuffer()
+    sensor_flusher = SensorFlusher(connect=connect_mongo, db_interval=SENSOR_DB_INTERVAL_SECONDS)
+    sensor_flusher.start()
 else:
-    print("[WARN] MONGODB_URI not set. Sensor data will not be stored to DB.")
+    log.warning("MONGODB_URI not set. Sensor data will not be stored to DB.")
 
 # ─────────────────────────────────────────────
 # Sensor initialization
 # ─────────────────────────────────────────────
-print("[INFO] Initializing DS18B20 temperature sensor...")
-try:
-    temp_sensor = W1ThermSensor()
-    print("[INFO] DS18B20 detected.")
-except Exception as e:
-    print("[WARN] DS18B20 not available:", e)
-    temp_sensor = None
-
-print("[INFO] Initializing I2C + ADS1115...")
-i2c = busio.I2C(board.SCL, board.SDA)
-ads = ADS1115(i2c)
-ads.gain = 1
-ads.data_rate = 860
+trace = hal.SensorTrace(args.trace) if hal.SIMULATE else None
+if hal.SIMULATE:
+    log.info("Simulation mode: using simulated sensors.")
 
+log.info("Initializing DS18B20 temperature sensor...")
+temp_sensor = hal.open_thermometer(trace=trace)
+if temp_sensor is not None:
+    log.info("DS18B20 detected.")
+
+log.info("Initializing I2C + ADS1115...")
 # A0 → TDS, A1 → pH, A3 → Turbidity
-ch_tds  = AnalogIn(ads, 0)
-ch_ph   = AnalogIn(ads, 1)
-ch_turb = AnalogIn(ads, 3)
+ads, channels = hal.open_adc(data_rate=860, trace=trace)
+
+# Each cycle bursts ADC_SAMPLES conversions per channel and filters them
+adc = AdcSampler(ads, channels)
+log.info("ADC sampling %dx per channel (%s, %s mode).", adc.samples, adc.method,
+         "continuous" if adc.continuous else "single-shot")
+
+# DS18B20 conversions are slow; read them on their own thread
+temp_reader = TemperatureReader(temp_sensor)
+temp_reader.start()
 
 # ─────────────────────────────────────────────
 # Conversion formulas
@@ -92,76 +128,120 @@ def convert_tds(v, temp_c):
         tds = 0.0
     return round(tds, 2)
 
+def fmt_v(v, std):
+    if v is None:
+        return "n/a"
+    return f"{v:.4f}V ±{std:.4f}"
+
+# ─────────────────────────────────────────────
+# Metrics
+# ─────────────────────────────────────────────
+CYCLE_SECONDS = metrics.histogram("sensor_cycle_seconds", "Time to acquire and publish one reading.")
+JITTER_SECONDS = metrics.histogram(
+    "sensor_loop_jitter_seconds", "Deviation of the loop period from SENSOR_LOOP_INTERVAL_SECONDS.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5),
+)
+OVERRUNS = metrics.counter("sensor_loop_overruns_total", "Cycles that took longer than the loop interval.")
+READING = metrics.gauge("sensor_reading", "Latest converted sensor value.", ["metric"])
+VOLTAGE_STDDEV = metrics.gauge("sensor_voltage_stddev", "Spread of the last ADC burst (V).", ["channel"])
+
+if metrics.serve(SENSOR_METRICS_PORT, SENSOR_METRICS_HOST):
+    log.info("Metrics on %s:%d/metrics.", SENSOR_METRICS_HOST, SENSOR_METRICS_PORT)
+
 # ─────────────────────────────────────────────
 # Main loop
 # ─────────────────────────────────────────────
-last_db_save = 0.0
+def stop_on_sigterm(signum, frame):
+    # run.sh stops this process with SIGTERM; unwind like Ctrl+C so the
+    # buffered readings still get their final flush
+    raise KeyboardInterrupt
 
-print(f"[INFO] Sensor reader loop started (every {LOOP_INTERVAL_SECONDS}s, "
-      f"DB logging every {SENSOR_DB_INTERVAL_SECONDS}s).")
+signal.signal(signal.SIGTERM, stop_on_sigterm)
 
-while True:
-    try:
-        if temp_sensor:
-            try:
-                temp_c = round(temp_sensor.get_temperature(), 2)
-            except Exception as e:
-                print("[WARN] Temp read failed:", e)
-                temp_c = None
-        else:
-            temp_c = None
-
-        v_tds  = ch_tds.voltage
-        v_ph   = ch_ph.voltage
-        v_turb = ch_turb.voltage
-
-        ph_val   = convert_ph(v_ph)
-        turb_val = convert_turbidity(v_turb)
-        tds_val  = convert_tds(v_tds, temp_c)
-
-        now_iso = datetime.now().isoformat()
-
-        sensor_doc = {
-            "timestamp": now_iso,
-            "temperature_c": temp_c,
-            "ph": ph_val,
-            "turbidity": turb_val,
-            "tds": tds_val,
-            "raw_voltages": {
-                "tds_v": v_tds,
-                "ph_v": v_ph,
-                "turb_v": v_turb,
-            },
-        }
-
-        # Update live JSON (for /sensor_live)
+log.info("Sensor reader loop started (every %ss, DB logging every %ss).",
+         LOOP_INTERVAL_SECONDS, SENSOR_DB_INTERVAL_SECONDS)
+
+previous_start = None
+try:
+    while True:
+        cycle_started = time.monotonic()
+        if previous_start is not None:
+            JITTER_SECONDS.observe(abs(cycle_started - previous_start - LOOP_INTERVAL_SECONDS))
+        previous_start = cycle_started
         try:
-            with open(LATEST_JSON, "w") as f:
-                json.dump(sensor_doc, f, indent=2)
-        except Exception as e:
-            print("[WARN] Could not write latest_sensor.json:", e)
-
-        print(
-            "[LIVE]",
-            f"T={temp_c}°C",
-            f"pH={ph_val} (v={v_ph:.4f}V)",
-            f"NTU={turb_val} (v={v_turb:.4f}V)",
-            f"TDS={tds_val}ppm (v={v_tds:.4f}V)",
-        )
-
-        now_ts = time.time()
-        if sensor_collection is not None and (now_ts - last_db_save) >= SENSOR_DB_INTERVAL_SECONDS:
+            temp_c = temp_reader.latest()
+
+            readings = adc.read()
+            v_tds, std_tds, n_tds = readings["tds_v"]
+            v_ph, std_ph, n_ph = readings["ph_v"]
+            v_turb, std_turb, n_turb = readings["turb_v"]
+
+            ph_val   = convert_ph(v_ph)
+            turb_val = convert_turbidity(v_turb)
+            tds_val  = convert_tds(v_tds, temp_c)
+
+            now_iso = datetime.now().isoformat()
+
+            sensor_doc = {
+                "timestamp": now_iso,
+                "temperature_c": temp_c,
+                "ph": ph_val,
+                "turbidity": turb_val,
+                "tds": tds_val,
+                "raw_voltages": {
+                    "tds_v": v_tds,
+                    "ph_v": v_ph,
+                    "turb_v": v_turb,
+                },
+                "sampling": {
+                    "filter": adc.method,
+                    "samples": min(n_tds, n_ph, n_turb),
+                    "stddev": {
+                        "tds_v": std_tds,
+                        "ph_v": std_ph,
+                        "turb_v": std_turb,
+                    },
+                },
+            }
+
+            # Publish live reading (for /sensor_live and snapshots)
             try:
-                sensor_collection.insert_one(sensor_doc)
-                last_db_save = now_ts
-                print("[INFO] Sensor reading saved to MongoDB.")
+                sensor_bus.publish(sensor_doc)
             except Exception as e:
-                print("[WARN] MongoDB insert failed:", e)
+                log.warning("Could not publish live sensor reading: %s", e)
+
+            log.info(
+                "T=%s°C pH=%s (v=%s) NTU=%s (v=%s) TDS=%sppm (v=%s)",
+                temp_c, ph_val, fmt_v(v_ph, std_ph), turb_val, fmt_v(v_turb, std_turb),
+                tds_val, fmt_v(v_tds, std_tds),
+            )
+            for metric in ("temperature_c", "ph", "turbidity", "tds"):
+                if sensor_doc[metric] is not None:
+                    READING.labels(metric).set(sensor_doc[metric])
+            for channel, std in (("tds_v", std_tds), ("ph_v", std_ph), ("turb_v", std_turb)):
+                if std is not None:
+                    VOLTAGE_STDDEV.labels(channel).set(std)
+
+            if sensor_buffer is not None:
+                try:
+                    sensor_buffer.append(sensor_doc)
+                except Exception as e:
+                    log.warning("Could not buffer sensor reading: %s", e)
 
-    except KeyboardInterrupt:
-        print("[INFO] Sensor reader stopped by user.")
-        break
-    except Exception as e:
-        print("[ERROR] Unexpected sensor loop error:", e)
-
-    time.sleep(LOOP_INTERVAL_SECONDS)
+        except Exception as e:
+            log.error("Unexpected sensor loop error: %s", e)
+
+        # The ADC burst is part of the cycle, not added on top of it
+        elapsed = time.monotonic() - cycle_started
+        CYCLE_SECONDS.observe(elapsed)
+        if elapsed > LOOP_INTERVAL_SECONDS:
+            OVERRUNS.inc()
+        time.sleep(max(0.0, LOOP_INTERVAL_SECONDS - elapsed))
+except KeyboardInterrupt:
+    log.info("Sensor reader stopped.")
+finally:
+    # A second signal must not cut the final flush short
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    temp_reader.stop()
+    if sensor_flusher is not None:
+        sensor_flusher.stop()
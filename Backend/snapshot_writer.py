@@ -0,0 +1,463 @@
+import os
+import json
+import time
+import queue
+import hashlib
+import threading
+from datetime import datetime, timezone
+
+import cv2
+import numpy as np
+import gridfs
+from bson import ObjectId
+from pymongo.errors import BulkWriteError
+
+import metrics
+from log_config import get_logger
+
+log = get_logger("snapshots")
+
+_PERSIST_SECONDS = metrics.STAGE_SECONDS.labels(stage="persist")
+_INSERT_SECONDS = metrics.MONGO_SECONDS.labels(op="snapshot_insert")
+
+
+# ─────────────────────────────────────────────
+# Thumbnails and perceptual hashes
+# ─────────────────────────────────────────────
+THUMB_MAX_SIDE = int(os.getenv("THUMB_MAX_SIDE", "320"))
+THUMB_QUALITY = int(os.getenv("THUMB_QUALITY", "70"))
+
+
+def make_thumbnail(frame_bgr, max_side: int = THUMB_MAX_SIDE, quality: int = THUMB_QUALITY):
+    h, w = frame_bgr.shape[:2]
+    scale = max_side / float(max(h, w))
+    if scale < 1.0:
+        frame_bgr = cv2.resize(
+            frame_bgr, (max(1, int(w * scale)), max(1, int(h * scale))),
+            interpolation=cv2.INTER_AREA,
+        )
+    ok, buf = cv2.imencode(".jpg", frame_bgr, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+
+def thumbnail_from_jpeg(jpeg: bytes, max_side: int = THUMB_MAX_SIDE, quality: int = THUMB_QUALITY):
+    img = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return make_thumbnail(img, max_side, quality)
+
+
+def perceptual_hash(img) -> int:
+    """
+    64-bit DCT hash (pHash) of a BGR/gray image or JPEG bytes, as a signed
+    int64 so MongoDB can store it. Near-identical frames differ in a few bits.
+    """
+    if isinstance(img, (bytes, bytearray)):
+        img = cv2.imdecode(np.frombuffer(img, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_4)
+        if img is None:
+            return None
+    elif img.ndim == 3:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(img, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].ravel()
+    bits = low > np.median(low[1:])
+    value = int.from_bytes(np.packbits(bits).tobytes(), "big")
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+
+def hash_distance(a: int, b: int) -> int:
+    return bin((a ^ b) & 0xFFFFFFFFFFFFFFFF).count("1")
+
+
+# ─────────────────────────────────────────────
+# Blob stores (image bytes live outside the metadata documents)
+# ─────────────────────────────────────────────
+class LocalBlobStore:
+    """
+    Content-addressed image store on local disk: <root>/<ab>/<sha256>.
+    """
+
+    name = "local"
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, blob_id: str) -> str:
+        return os.path.join(self.root, blob_id[:2], blob_id)
+
+    def put(self, data: bytes) -> str:
+        blob_id = hashlib.sha256(data).hexdigest()
+        path = self._path(blob_id)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = path + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        else:
+            # Re-used blob: refresh its age so the orphan sweep's grace period applies
+            try:
+                os.utime(path)
+            except FileNotFoundError:
+                pass
+        return blob_id
+
+    def get(self, blob_id: str):
+        try:
+            with open(self._path(blob_id), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def delete(self, blob_id: str):
+        try:
+            os.remove(self._path(blob_id))
+        except FileNotFoundError:
+            pass
+
+    def iter_blobs(self, older_than: float):
+        """Blob ids last written before the given epoch time."""
+        try:
+            shards = [e.path for e in os.scandir(self.root) if e.is_dir()]
+        except FileNotFoundError:
+            return
+        for shard in shards:
+            for entry in os.scandir(shard):
+                if entry.name.endswith(".tmp"):
+                    continue
+                try:
+                    if entry.stat().st_mtime < older_than:
+                        yield entry.name
+                except FileNotFoundError:
+                    pass
+
+
+class GridFSBlobStore:
+    """
+    Content-addressed image store in MongoDB GridFS (filename = sha256).
+    """
+
+    name = "gridfs"
+
+    def __init__(self, db, bucket_name: str = "snap_images"):
+        self.bucket = gridfs.GridFSBucket(db, bucket_name=bucket_name)
+        self.files = db[f"{bucket_name}.files"]
+
+    def put(self, data: bytes) -> str:
+        blob_id = hashlib.sha256(data).hexdigest()
+        now = datetime.now(timezone.utc)
+        # Re-used blob: refresh its last use so the orphan sweep's grace period applies
+        touched = self.files.update_one({"filename": blob_id}, {"$set": {"metadata.touched": now}})
+        if touched.matched_count == 0:
+            self.bucket.upload_from_stream(blob_id, data, metadata={"touched": now})
+        return blob_id
+
+    def get(self, blob_id: str):
+        try:
+            return self.bucket.open_download_stream_by_name(blob_id).read()
+        except gridfs.errors.NoFile:
+            return None
+
+    def delete(self, blob_id: str):
+        for f in self.files.find({"filename": blob_id}, {"_id": 1}):
+            self.bucket.delete(f["_id"])
+
+    def iter_blobs(self, older_than: float):
+        """Blob ids uploaded and last re-used before the given epoch time."""
+        cutoff = datetime.fromtimestamp(older_than, timezone.utc)
+        query = {
+            "uploadDate": {"$lt": cutoff},
+            # Files stored before put() recorded metadata.touched only have uploadDate
+            "$or": [{"metadata.touched": {"$exists": False}}, {"metadata.touched": {"$lt": cutoff}}],
+        }
+        for f in self.files.find(query, {"filename": 1}):
+            yield f["filename"]
+
+
+# ─────────────────────────────────────────────
+# Background snapshot writer
+# ─────────────────────────────────────────────
+class SnapshotWriter:
+    """
+    Persists snapshots off the capture path.
+
+    submit() only enqueues the frame (never blocks). A worker thread
+    JPEG-encodes the image (unless an already encoded JPEG was passed) and a thumbnail, stores both in the blob store and batches the
+    metadata documents into insert_many per collection. When the DB is
+    unreachable, batches are spooled to disk and retried with backoff.
+    Until attach() provides a blob store, everything goes to the spool.
+    """
+
+    def __init__(self, get_collection, blob_store, spool_dir: str = "snapshot_spool",
+                 max_queue: int = 64, batch_size: int = 16, flush_interval: float = 1.0,
+                 max_backoff: float = 60.0, encode=None):
+        # encode(frame_bgr) -> bytes | None, the archival JPEG encoder
+        self.get_collection = get_collection
+        self.encode = encode
+        self.blob_store = blob_store
+        self.spool_dir = spool_dir
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+
+        os.makedirs(spool_dir, exist_ok=True)
+        self._q = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+
+        self._backoff = 0.0
+        self._retry_at = 0.0
+
+        self.enqueued = 0
+        self.dropped = 0
+        self.written = 0
+        self.spooled = 0
+        self.failures = 0
+
+    # ── lifecycle ──
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+        self._thread.start()
+        log.info("Snapshot writer started.")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def attach(self, blob_store):
+        """Set the blob store once the DB is up; the spool replays right away."""
+        self.blob_store = blob_store
+        self._backoff = 0.0
+        self._retry_at = 0.0
+
+    # ── producer side ──
+    def submit(self, kind: str, doc: dict, frame_bgr=None, jpeg: bytes = None,
+               jpeg_lookup=None) -> bool:
+        """
+        Queue a snapshot. Returns False (and drops it) when the queue is full.
+        jpeg_lookup() is tried on the worker thread before encoding frame_bgr,
+        e.g. to pick up a JPEG the stream produces for the frame meanwhile.
+        """
+        doc = dict(doc)
+        doc.setdefault("_id", ObjectId())
+        try:
+            self._q.put_nowait((kind, doc, frame_bgr, jpeg, jpeg_lookup))
+        except queue.Full:
+            self.dropped += 1
+            log.warning("Snapshot queue full, dropping snapshot.")
+            return False
+        self.enqueued += 1
+        return True
+
+    @property
+    def queue_depth(self):
+        return self._q.qsize()
+
+    def spool_depth(self):
+        try:
+            return sum(1 for n in os.listdir(self.spool_dir) if n.endswith(".json"))
+        except OSError:
+            return 0
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "spool_depth": self.spool_depth(),
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "written": self.written,
+            "spooled": self.spooled,
+            "failures": self.failures,
+            "backoff_seconds": self._backoff,
+        }
+
+    # ── worker ──
+    def _run(self):
+        while not self._stop.is_set():
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            if self.blob_store is not None and time.monotonic() >= self._retry_at:
+                self._replay_spool()
+
+        # Drain what is left so nothing queued is lost on shutdown
+        batch = self._collect(block=False)
+        while batch:
+            self._spool(batch)
+            batch = self._collect(block=False)
+
+    def _collect(self, block: bool = True):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            try:
+                if block and timeout > 0:
+                    item = self._q.get(timeout=timeout)
+                else:
+                    item = self._q.get_nowait()
+            except queue.Empty:
+                break
+            prepared = self.prepare(*item)
+            if prepared is not None:
+                batch.append(prepared)
+        return batch
+
+    def prepare(self, kind, doc, frame_bgr, jpeg=None, jpeg_lookup=None):
+        """
+        Encode step of the worker: JPEG, thumbnail and phash for one
+        submitted snapshot. Returns the (kind, doc, jpeg, thumb) item
+        write() takes, or None when the frame cannot be encoded.
+        """
+        if jpeg is None and jpeg_lookup is not None:
+            jpeg = jpeg_lookup()
+        if jpeg is None:
+            if self.encode is not None:
+                jpeg = self.encode(frame_bgr)
+            else:
+                ok, buf = cv2.imencode(".jpg", frame_bgr)
+                jpeg = buf.tobytes() if ok else None
+            if jpeg is None:
+                log.warning("Could not encode frame as JPEG.")
+                return None
+        if frame_bgr is not None:
+            thumb = make_thumbnail(frame_bgr)
+        else:
+            thumb = thumbnail_from_jpeg(jpeg)
+        # Lets compaction spot near-duplicates without decoding the image again
+        doc["phash"] = perceptual_hash(frame_bgr if frame_bgr is not None else jpeg)
+        return kind, doc, jpeg, thumb
+
+    def _flush(self, batch):
+        if self.blob_store is None or time.monotonic() < self._retry_at:
+            self._spool(batch)
+            return
+        try:
+            self.write(batch)
+        except Exception as e:
+            self.failures += 1
+            self._backoff = min(self.max_backoff, max(1.0, self._backoff * 2))
+            self._retry_at = time.monotonic() + self._backoff
+            log.warning("Error saving snapshots (retry in %.0fs): %s", self._backoff, e)
+            self._spool(batch)
+            return
+        self._backoff = 0.0
+        self._retry_at = 0.0
+
+    def write(self, batch):
+        """
+        Store step of the worker: puts the images in the blob store and
+        inserts the prepared documents. Raises when the DB is unreachable
+        (the worker spools the batch instead).
+        """
+        started = metrics.now()
+        by_kind = {}
+        for kind, doc, jpeg, thumb in batch:
+            blob_id = self.blob_store.put(jpeg)
+            doc = dict(doc)
+            doc.pop("image_bytes", None)
+            doc["image_blob"] = blob_id
+            doc["image_store"] = self.blob_store.name
+            doc["image_size"] = len(jpeg)
+            if thumb is not None:
+                doc["thumb_blob"] = self.blob_store.put(thumb)
+                doc["thumb_store"] = self.blob_store.name
+            doc.setdefault("image_format", "jpg")
+            # BSON date for the retention TTL index (created_at is an ISO string)
+            doc.setdefault("created_ts", doc["_id"].generation_time)
+            by_kind.setdefault(kind, []).append(doc)
+
+        for kind, docs in by_kind.items():
+            col = self.get_collection(kind)
+            if col is None:
+                raise RuntimeError(f"No collection for snapshot kind '{kind}'")
+            insert_started = metrics.now()
+            try:
+                col.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                # Duplicate _ids mean an earlier attempt already inserted them
+                errors = e.details.get("writeErrors", [])
+                if any(err.get("code") != 11000 for err in errors):
+                    raise
+            _INSERT_SECONDS.observe_since(insert_started)
+            self.written += len(docs)
+            log.info("Saved %d %s snapshot(s).", len(docs), kind)
+        _PERSIST_SECONDS.observe_since(started)
+
+    # ── disk spool ──
+    def _spool(self, batch):
+        for kind, doc, jpeg, thumb in batch:
+            name = str(doc["_id"])
+            base = os.path.join(self.spool_dir, name)
+            try:
+                with open(base + ".jpg", "wb") as f:
+                    f.write(jpeg)
+                if thumb is not None:
+                    with open(base + ".thumb.jpg", "wb") as f:
+                        f.write(thumb)
+                record = dict(doc)
+                record["_id"] = name
+                with open(base + ".json.tmp", "w") as f:
+                    json.dump({"kind": kind, "doc": record}, f, default=str)
+                os.replace(base + ".json.tmp", base + ".json")
+                self.spooled += 1
+            except Exception as e:
+                log.error("Could not spool snapshot: %s", e)
+
+    def _replay_spool(self):
+        try:
+            names = sorted(n for n in os.listdir(self.spool_dir) if n.endswith(".json"))
+        except OSError:
+            return
+        if not names:
+            return
+
+        names = names[:self.batch_size]
+        batch = []
+        for name in names:
+            base = os.path.join(self.spool_dir, name[:-len(".json")])
+            try:
+                with open(base + ".json") as f:
+                    record = json.load(f)
+                with open(base + ".jpg", "rb") as f:
+                    jpeg = f.read()
+                thumb = None
+                if os.path.exists(base + ".thumb.jpg"):
+                    with open(base + ".thumb.jpg", "rb") as f:
+                        thumb = f.read()
+            except Exception as e:
+                log.warning("Discarding unreadable spool entry %s: %s", name, e)
+                self._unspool(base)
+                continue
+            doc = record["doc"]
+            doc["_id"] = ObjectId(doc["_id"])
+            batch.append((record["kind"], doc, jpeg, thumb))
+
+        if not batch:
+            return
+        try:
+            self.write(batch)
+        except Exception as e:
+            self.failures += 1
+            self._backoff = min(self.max_backoff, max(1.0, self._backoff * 2))
+            self._retry_at = time.monotonic() + self._backoff
+            log.warning("Spool replay failed (retry in %.0fs): %s", self._backoff, e)
+            return
+
+        self._backoff = 0.0
+        for _, doc, _, _ in batch:
+            self._unspool(os.path.join(self.spool_dir, str(doc["_id"])))
+        log.info("Replayed %d spooled snapshot(s).", len(batch))
+
+    def _unspool(self, base: str):
+        for ext in (".json", ".jpg", ".thumb.jpg"):
+            try:
+                os.remove(base + ext)
+            except FileNotFoundError:
+                pass
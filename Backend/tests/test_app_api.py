@@ -0,0 +1,96 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip("mongomock")
+from fastapi.testclient import TestClient
+
+import app
+from executors import ManagedExecutor
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = mongomock.MongoClient()["crustascope"]
+    monkeypatch.setattr(app, "db", db)
+    monkeypatch.setattr(app, "snaps_wssv", db["wssv_snaps"])
+    monkeypatch.setattr(app, "snaps_healthy", db["healthy_snaps"])
+    return db
+
+
+@pytest.fixture
+def client():
+    # No lifespan: camera, warm-up and sensor tasks stay off
+    return TestClient(app.app)
+
+
+def seed_snaps(col):
+    """
+    Five current snapshots (two sharing a created_at, so _id breaks the
+    tie) and three legacy ones without created_at. Returns their ids in
+    gallery order.
+    """
+    start = datetime(2026, 1, 1, 12, 0, 0)
+    docs = []
+    for offset in (0, 10, 10, 20, 30):
+        docs.append({
+            "_id": ObjectId(),
+            "kind": "wssv",
+            "confidence": 0.9,
+            "created_at": (start + timedelta(seconds=offset)).isoformat(),
+        })
+    for _ in range(3):
+        docs.append({"_id": ObjectId(), "kind": "wssv", "confidence": 0.8})
+    col.insert_many(docs)
+
+    current = sorted((d for d in docs if "created_at" in d),
+                     key=lambda d: (d["created_at"], d["_id"]), reverse=True)
+    legacy = sorted((d for d in docs if "created_at" not in d), key=lambda d: d["_id"], reverse=True)
+    return [str(d["_id"]) for d in current + legacy]
+
+
+def test_snaps_pages_through_every_snapshot_once(db, client):
+    expected = seed_snaps(db["wssv_snaps"])
+
+    seen, cursors = [], []
+    params = {"kind": "wssv", "limit": 3}
+    while True:
+        body = client.get("/snaps", params=params).json()
+        seen += [item["id"] for item in body["items"]]
+        if body["next_before"] is None:
+            break
+        cursors.append(body["next_before"])
+        params["before"] = body["next_before"]
+
+    assert seen == expected
+    # The second page ends on a legacy document: its cursor has no created_at
+    assert cursors[-1].startswith("|")
+
+
+def test_build_snap_query_legacy_cursor_stays_among_legacy_docs():
+    oid = ObjectId()
+    query = app.build_snap_query((None, oid))
+    assert query == {"created_at": None, "_id": {"$lt": oid}}
+
+
+def test_snaps_rejects_a_bad_cursor(db, client):
+    response = client.get("/snaps", params={"kind": "wssv", "before": "not-a-cursor"})
+    assert response.status_code == 400
+
+
+def test_full_pool_maps_to_503(db, client, monkeypatch):
+    pool = ManagedExecutor("db", max_workers=1, max_queue=0)
+    monkeypatch.setattr(app, "db_pool", pool)
+    release = threading.Event()
+    pool.submit(release.wait, 5.0)
+    try:
+        response = client.get("/snaps", params={"kind": "wssv"})
+    finally:
+        release.set()
+        pool.shutdown(wait=True)
+
+    assert response.status_code == 503
+    assert "db" in response.json()["detail"]
+    assert pool.stats()["rejected"] == 1
@@ -0,0 +1,79 @@
+import numpy as np
+
+import frame_gate
+from detector import DetectionTracker, HEALTHY, WSSV
+from frame_gate import FrameChangeGate
+
+
+class Clock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_static_scene(monkeypatch, conf, seconds=12.0, fps=10.0, replay_skipped=True):
+    """
+    Feeds one unchanging frame through the gate and tracker the way the
+    camera pipeline does: gated frames go to the model (here a fixed
+    confidence), skipped frames are reported with repeat().
+    """
+    clock = Clock()
+    monkeypatch.setattr(frame_gate.time, "monotonic", clock)
+    gate = FrameChangeGate(size=16, threshold=3.0, max_interval=5.0)
+    tracker = DetectionTracker(alpha=0.3, window=3.0, min_frames=3)
+    frame = np.full((48, 64, 3), 90, np.uint8)
+
+    events = []
+    for _ in range(int(seconds * fps)):
+        if gate.should_infer(frame):
+            event = tracker.update(conf, frame, now=clock.now)
+        elif replay_skipped:
+            event = tracker.repeat(frame, now=clock.now)
+        else:
+            event = None
+        if event is not None:
+            events.append(event)
+        clock.now += 1.0 / fps
+    return gate, tracker, events
+
+
+def test_static_wssv_scene_closes_windows(monkeypatch):
+    gate, tracker, events = run_static_scene(monkeypatch, 0.92)
+    # The model ran only on the periodic gate refreshes (t = 0, 5, 10 s)...
+    assert gate.passed == 3
+    # ...and the held window stayed open until those three agreed
+    assert tracker.label == WSSV
+    assert len(events) == 1
+    assert events[0].label == WSSV
+    assert events[0].frames == 3
+    assert events[0].confidence == 0.92
+
+
+def test_static_healthy_scene_closes_windows(monkeypatch):
+    _, tracker, events = run_static_scene(monkeypatch, 0.05)
+    assert tracker.label == HEALTHY
+    assert len(events) == 1 and events[0].label == HEALTHY
+
+
+def test_repeats_are_not_evidence(monkeypatch):
+    # One high-confidence inference, then ~49 gate-skipped frames before the
+    # next refresh: replays must not fill the window or move the EMA
+    _, tracker, events = run_static_scene(monkeypatch, 0.95, seconds=4.9)
+    assert events == []
+    assert tracker.updates == 1
+    assert tracker.stats()["window_frames"] == 1
+
+
+def test_gate_alone_drops_window_as_flicker(monkeypatch):
+    # Without repeat() nothing marks the window as held, so a window with
+    # fewer than min_frames inferences is dropped when its time is up
+    _, _, events = run_static_scene(monkeypatch, 0.92, replay_skipped=False)
+    assert events == []
+
+
+def test_repeat_before_first_result_is_noop():
+    tracker = DetectionTracker()
+    assert tracker.repeat(np.zeros((4, 4, 3), np.uint8)) is None
+    assert tracker.updates == 0
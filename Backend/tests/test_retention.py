@@ -0,0 +1,102 @@
+import os
+import time
+import base64
+from datetime import datetime
+
+import cv2
+import numpy as np
+import pytest
+from bson import ObjectId
+
+mongomock = pytest.importorskip("mongomock")
+
+import retention
+from retention import RetentionEngine
+from snapshot_writer import LocalBlobStore
+
+
+def jpeg(value: int) -> bytes:
+    img = np.zeros((48, 64, 3), np.uint8)
+    img[:, : 8 + value % 48] = value
+    ok, buf = cv2.imencode(".jpg", img)
+    assert ok
+    return buf.tobytes()
+
+
+def age(store, blob_id, seconds):
+    path = store._path(blob_id)
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+@pytest.fixture
+def engine(tmp_path):
+    db = mongomock.MongoClient()["crustascope"]
+    cols = {"wssv": db["wssv_snaps"], "healthy": db["healthy_snaps"]}
+    store = LocalBlobStore(str(tmp_path / "blobs"))
+    return RetentionEngine(db, cols.get, {"local": store}, hot_store=store)
+
+
+def test_compaction_moves_legacy_images_into_the_blob_store(engine):
+    col = engine.get_collection("wssv")
+    data = jpeg(120)
+    oid = ObjectId()
+    col.insert_one({"_id": oid, "label": "WSSV DETECTED", "created_at": "2025-06-01T08:00:00",
+                    "image_base64": base64.b64encode(data).decode()})
+
+    counts = engine.compact("wssv", col)
+
+    assert counts["migrated"] == 1
+    doc = col.find_one({"_id": oid})
+    assert "image_base64" not in doc
+    assert engine.hot_store.get(doc["image_blob"]) == data
+    assert doc["image_store"] == "local"
+    assert doc["thumb_blob"]
+    assert doc["created_ts"] == datetime(2025, 6, 1, 8, 0, 0)
+    assert doc["phash"] is not None
+
+    # The watermark keeps the next pass from walking the same documents
+    assert engine.compact("wssv", col) == {"migrated": 0, "deduplicated": 0}
+
+
+def test_compaction_leaves_near_duplicates_alone_by_default(engine):
+    col = engine.get_collection("wssv")
+    first, second = jpeg(120), jpeg(121)
+    for data in (first, second):
+        col.insert_one({"camera_index": 0, "created_at": datetime.utcnow().isoformat(),
+                        "image_blob": engine.hot_store.put(data), "image_store": "local"})
+
+    assert engine.compact("wssv", col)["deduplicated"] == 0
+    blobs = {doc["image_blob"] for doc in col.find()}
+    assert len(blobs) == 2
+
+
+def test_orphan_sweep_only_removes_old_unreferenced_blobs(engine):
+    store = engine.hot_store
+    col = engine.get_collection("wssv")
+    referenced = store.put(jpeg(10))
+    col.insert_one({"image_blob": referenced, "image_store": "local"})
+    orphan = store.put(jpeg(20))
+    in_flight = store.put(jpeg(30))
+    reused = store.put(jpeg(40))
+    for blob_id in (referenced, orphan, reused):
+        age(store, blob_id, retention.SNAP_ORPHAN_GRACE + 60)
+    # A writer just stored this image again, its document is not inserted yet
+    assert store.put(jpeg(40)) == reused
+
+    assert engine.sweep_orphans() == 1
+    assert store.get(orphan) is None
+    assert store.get(referenced) is not None
+    assert store.get(in_flight) is not None
+    assert store.get(reused) is not None
+
+
+def test_count_policy_drops_the_oldest(engine):
+    col = engine.get_collection("healthy")
+    for minute in range(5):
+        col.insert_one({"created_at": f"2026-01-01T12:0{minute}:00"})
+    col.insert_one({})  # legacy, no created_at: sorts last
+
+    assert engine.enforce_count("healthy", col, 3) == 3
+    kept = sorted(doc["created_at"] for doc in col.find())
+    assert kept == ["2026-01-01T12:02:00", "2026-01-01T12:03:00", "2026-01-01T12:04:00"]
@@ -0,0 +1,132 @@
+import time
+
+import pytest
+
+mongomock = pytest.importorskip("mongomock")
+
+import sensor_buffer
+from sensor_buffer import SensorBuffer, SensorFlusher
+
+# 2026-01-01 12:00:00 UTC
+T0 = 1767268800.0
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient()["crustascope"]
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "sensor_buffer.db")
+
+
+def fill(buffer, start, seconds, every=2.0):
+    """One reading every `every` seconds; temperature counts them."""
+    n = int(seconds / every)
+    for i in range(n):
+        buffer.append({"temperature_c": 20.0 + i, "ph": 7.0}, ts=start + i * every)
+    return n
+
+
+def drain(flusher, path):
+    conn = sensor_buffer._connect(path)
+    try:
+        while flusher._flush_batch(conn):
+            pass
+    finally:
+        conn.close()
+
+
+def minute_counts(db):
+    return sum(doc["n"] for doc in db["sensor_rollup_1m"].find())
+
+
+def test_flush_downsamples_raw_docs_but_rolls_up_everything(db, path):
+    buffer = SensorBuffer(path=path)
+    n = fill(buffer, T0, 600)
+    flusher = SensorFlusher(db, path=path, db_interval=60, batch_size=50)
+    drain(flusher, path)
+
+    # One raw document per minute, every reading in the rollups
+    assert db["sensor_results"].count_documents({}) == 10
+    assert minute_counts(db) == n
+    hour = db["sensor_rollup_1h"].find_one()
+    assert hour["n"] == n
+    assert hour["temperature_c"]["count"] == n
+    assert hour["temperature_c"]["min"] == 20.0
+    assert hour["temperature_c"]["max"] == 20.0 + n - 1
+
+    # The buffer is empty once everything is in MongoDB
+    assert buffer._conn.execute("SELECT COUNT(*) FROM readings").fetchone() == (0,)
+    buffer.close()
+
+
+def test_restart_resumes_downsampling_window(db, path):
+    buffer = SensorBuffer(path=path)
+    fill(buffer, T0, 30)
+    drain(SensorFlusher(db, path=path, db_interval=60), path)
+    buffer.close()
+    assert db["sensor_results"].count_documents({}) == 1
+
+    # New process: the rest of the same minute must not add a raw document
+    buffer = SensorBuffer(path=path)
+    fill(buffer, T0 + 30, 30)
+    drain(SensorFlusher(db, path=path, db_interval=60), path)
+    assert db["sensor_results"].count_documents({}) == 1
+
+    fill(buffer, T0 + 60, 2)
+    drain(SensorFlusher(db, path=path, db_interval=60), path)
+    assert db["sensor_results"].count_documents({}) == 2
+    buffer.close()
+
+
+def test_retried_batch_is_not_counted_twice(db, path, monkeypatch):
+    buffer = SensorBuffer(path=path)
+    n = fill(buffer, T0, 300)
+    flusher = SensorFlusher(db, path=path, db_interval=60, batch_size=1000)
+
+    write_rollups = sensor_buffer.write_rollups
+    calls = []
+
+    def flaky(*args, **kwargs):
+        calls.append(1)
+        if len(calls) == 3:
+            raise ConnectionError("connection reset")
+        return write_rollups(*args, **kwargs)
+
+    monkeypatch.setattr(sensor_buffer, "write_rollups", flaky)
+    conn = sensor_buffer._connect(path)
+    with pytest.raises(ConnectionError):
+        flusher._flush_batch(conn)
+    conn.close()
+
+    # Restart: the same rows are replayed; merged minutes are skipped
+    drain(SensorFlusher(db, path=path, db_interval=60, batch_size=1000), path)
+    assert minute_counts(db) == n
+    assert db["sensor_rollup_1h"].find_one()["n"] == n
+    assert db["sensor_results"].count_documents({}) == 5
+    buffer.close()
+
+
+def test_flusher_connects_lazily_and_retries(db, path):
+    buffer = SensorBuffer(path=path)
+    fill(buffer, T0, 10)
+    attempts = []
+
+    def connect():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ConnectionError("DNS operation timed out")
+        return db
+
+    flusher = SensorFlusher(connect=connect, path=path, db_interval=60, interval=0.01, max_backoff=0.01)
+    flusher.start()
+    deadline = time.monotonic() + 5.0
+    while flusher.flushed < 5 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    flusher.stop()
+    assert len(attempts) == 2
+    assert flusher.failures == 1
+    assert db["sensor_results"].count_documents({}) == 1
+    buffer.close()
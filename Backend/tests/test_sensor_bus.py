@@ -0,0 +1,100 @@
+import struct
+import threading
+from datetime import datetime
+
+import pytest
+
+from sensor_bus import SEQ_OFFSET, SensorBusReader, SensorBusWriter
+
+
+def reading(value: float, ts: datetime = None) -> dict:
+    """Every metric carries the same value, so a torn read shows up as a mismatch."""
+    return {
+        "timestamp": (ts or datetime(2026, 1, 1, 12, 0, 0)).isoformat(),
+        "temperature_c": value,
+        "ph": value,
+        "turbidity": value,
+        "tds": value,
+        "raw_voltages": {"tds_v": value, "ph_v": value, "turb_v": value},
+        "sampling": {"samples": 8, "stddev": {"tds_v": value, "ph_v": value, "turb_v": value}},
+    }
+
+
+@pytest.fixture
+def bus(tmp_path):
+    path = str(tmp_path / "sensor.shm")
+    writer = SensorBusWriter(path=path, json_path=str(tmp_path / "latest.json"))
+    assert writer.using_shm
+    reader = SensorBusReader(path=path, json_path=str(tmp_path / "latest.json"))
+    yield writer, reader
+    writer.close()
+
+
+def test_reader_sees_the_published_reading(bus):
+    writer, reader = bus
+    assert reader.read() is None  # nothing published yet
+
+    writer.publish(reading(7.5))
+    doc = reader.read()
+    assert doc == reading(7.5)
+    # Unchanged sequence: the cached document is returned as-is
+    assert reader.read() is doc
+
+
+def test_write_in_progress_returns_last_consistent_reading(bus):
+    writer, reader = bus
+    writer.publish(reading(1.0))
+    assert reader.read()["ph"] == 1.0
+
+    # Writer stalled between marking the record odd and finishing the payload
+    struct.pack_into("<Q", writer._mm, SEQ_OFFSET, writer._seq + 1)
+    assert reader.read()["ph"] == 1.0
+    assert reader.torn_retries == reader.MAX_RETRIES
+
+    writer.publish(reading(2.0))
+    assert reader.read()["ph"] == 2.0
+
+
+def test_concurrent_reads_are_never_torn(bus):
+    writer, reader = bus
+    stop = threading.Event()
+
+    def publish():
+        value = 0.0
+        while not stop.is_set():
+            value += 1.0
+            writer.publish(reading(value))
+
+    thread = threading.Thread(target=publish)
+    thread.start()
+    try:
+        last = 0.0
+        for _ in range(20000):
+            doc = reader.read()
+            if doc is None:
+                continue
+            values = {doc["temperature_c"], doc["ph"], doc["turbidity"], doc["tds"],
+                      *doc["raw_voltages"].values(), *doc["sampling"]["stddev"].values()}
+            assert len(values) == 1
+            # Sequence only moves forward
+            assert doc["ph"] >= last
+            last = doc["ph"]
+    finally:
+        stop.set()
+        thread.join()
+    assert last > 0
+
+
+def test_restarted_writer_continues_the_sequence(tmp_path, bus):
+    writer, reader = bus
+    writer.publish(reading(3.0))
+    assert reader.read()["ph"] == 3.0
+    writer.close()
+
+    # A new sensor_reader process keeps counting, so the reader's cache is not reused
+    restarted = SensorBusWriter(path=writer.path, json_path=writer.json_path)
+    try:
+        restarted.publish(reading(4.0))
+        assert reader.read()["ph"] == 4.0
+    finally:
+        restarted.close()
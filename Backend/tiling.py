@@ -0,0 +1,225 @@
+import os
+import threading
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+from inference import WSSV_THRESHOLD, HEALTHY_THRESHOLD
+
+
+# ─────────────────────────────────────────────
+# Tiled inference
+# ─────────────────────────────────────────────
+# Squashing a 1080p frame to the model's 224x224 input leaves a shrimp a
+# few pixels wide. In tiled mode each frame is also cut into overlapping
+# full-resolution tiles, and the whole set for every pending camera goes
+# through the model as one batch.
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "0") == "1"
+# Tile side in source pixels (the engine resizes tiles to the model input)
+TILE_SIZE = int(os.getenv("TILE_SIZE", "224"))
+# Fraction of a tile shared with its neighbour
+TILE_OVERLAP = float(os.getenv("TILE_OVERLAP", "0.25"))
+# Tiles run per frame; when the grid is larger, the most textured tiles
+# (edge energy, i.e. likely foreground against open water) are kept
+TILE_MAX = int(os.getenv("TILE_MAX", "12"))
+# Also run the whole (squashed) frame, so large shrimp are still seen
+TILE_WHOLE_FRAME = os.getenv("TILE_WHOLE_FRAME", "1") == "1"
+# Blend per-tile scores onto the stream as a heatmap
+TILE_HEATMAP = os.getenv("TILE_HEATMAP", "1") == "1"
+TILE_HEATMAP_ALPHA = float(os.getenv("TILE_HEATMAP_ALPHA", "0.45"))
+
+# Downscale factor for the tile-ranking edge map
+_SALIENCY_SCALE = 8
+
+
+@lru_cache(maxsize=16)
+def tile_grid(height: int, width: int, tile: int = TILE_SIZE, overlap: float = TILE_OVERLAP):
+    """(N, 4) int array of x, y, w, h covering the frame; last row/column sits flush with the edge."""
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        stride = max(1, int(tile * (1.0 - overlap)))
+        return list(range(0, length - tile, stride)) + [length - tile]
+
+    tw, th = min(tile, width), min(tile, height)
+    boxes = np.array([(x, y, tw, th) for y in starts(height) for x in starts(width)], np.int32)
+    boxes.setflags(write=False)
+    return boxes
+
+
+def rank_tiles(frame_bgr: np.ndarray, boxes: np.ndarray, keep: int) -> np.ndarray:
+    """The `keep` boxes with the most edge energy, in grid order."""
+    if len(boxes) <= keep:
+        return boxes
+    h, w = frame_bgr.shape[:2]
+    sw, sh = max(1, w // _SALIENCY_SCALE), max(1, h // _SALIENCY_SCALE)
+    small = cv2.resize(frame_bgr, (sw, sh), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+    edges = np.abs(cv2.Laplacian(gray, cv2.CV_32F))
+    integral = cv2.integral(edges, sdepth=cv2.CV_64F)
+
+    # Box sums from the integral image, all tiles at once
+    x0 = np.clip(boxes[:, 0] * sw // w, 0, sw - 1)
+    y0 = np.clip(boxes[:, 1] * sh // h, 0, sh - 1)
+    x1 = np.clip((boxes[:, 0] + boxes[:, 2]) * sw // w, x0 + 1, sw)
+    y1 = np.clip((boxes[:, 1] + boxes[:, 3]) * sh // h, y0 + 1, sh)
+    energy = integral[y1, x1] - integral[y0, x1] - integral[y1, x0] + integral[y0, x0]
+    energy /= (x1 - x0) * (y1 - y0)
+    chosen = np.sort(np.argpartition(-energy, keep - 1)[:keep])
+    return boxes[chosen]
+
+
+def aggregate(scores) -> float:
+    """
+    Frame confidence from tile confidences. Any WSSV tile decides the frame
+    (a single sick shrimp matters), then any healthy tile; otherwise the
+    least decisive score stays in the "No Shrimp" band.
+    """
+    scores = np.asarray(scores, np.float32)
+    top, bottom = float(scores.max()), float(scores.min())
+    if top >= WSSV_THRESHOLD:
+        return top
+    if bottom <= HEALTHY_THRESHOLD:
+        return bottom
+    return float(scores[np.argmax(np.abs(scores - 0.5))])
+
+
+class TiledPredictor:
+    """
+    Drop-in for InferenceEngine.predict_batch that scores each frame as the
+    whole image plus up to max_tiles crops, in a single batched call.
+
+    predict_batch(frames) returns (confidences, details): one aggregated
+    confidence per frame and a JSON-friendly dict with the normalised tile
+    boxes and their scores (used for the heatmap and /status).
+    """
+
+    def __init__(self, predict_batch, tile: int = TILE_SIZE, overlap: float = TILE_OVERLAP,
+                 max_tiles: int = TILE_MAX, whole_frame: bool = TILE_WHOLE_FRAME):
+        self.predict = predict_batch
+        self.tile = tile
+        self.overlap = overlap
+        self.max_tiles = max(1, max_tiles)
+        self.whole_frame = whole_frame
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.tiles = 0
+
+    def plan(self, frame_bgr: np.ndarray) -> np.ndarray:
+        h, w = frame_bgr.shape[:2]
+        boxes = tile_grid(h, w, self.tile, self.overlap)
+        if len(boxes) == 1 and boxes[0, 2] == w and boxes[0, 3] == h:
+            # Frame no bigger than one tile: nothing to gain
+            return boxes[:0]
+        return rank_tiles(frame_bgr, boxes, self.max_tiles)
+
+    def predict_batch(self, frames):
+        crops, plans = [], []
+        for frame in frames:
+            boxes = self.plan(frame)
+            start = len(crops)
+            if self.whole_frame or not len(boxes):
+                crops.append(frame)
+            # Views into the frame; the engine resizes straight into its input buffer
+            crops.extend(frame[y:y + th, x:x + tw] for x, y, tw, th in boxes)
+            plans.append((start, len(crops), boxes))
+
+        scores = self.predict(crops) if crops else np.empty((0,), np.float32)
+
+        confs, details = [], []
+        for frame, (start, end, boxes) in zip(frames, plans):
+            frame_scores = scores[start:end]
+            tile_scores = frame_scores[-len(boxes):] if len(boxes) else frame_scores[:0]
+            h, w = frame.shape[:2]
+            confs.append(aggregate(frame_scores))
+            details.append({
+                "mode": "tiles",
+                "whole": float(frame_scores[0]) if end - start > len(boxes) else None,
+                "boxes": [[round(x / w, 4), round(y / h, 4), round(tw / w, 4), round(th / h, 4)]
+                          for x, y, tw, th in boxes.tolist()],
+                "scores": [round(float(s), 4) for s in tile_scores],
+            })
+
+        with self._lock:
+            self.frames += len(frames)
+            self.tiles += len(crops)
+        return np.asarray(confs, np.float32), details
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": True,
+                "tile_size": self.tile,
+                "overlap": self.overlap,
+                "max_tiles": self.max_tiles,
+                "whole_frame": self.whole_frame,
+                "frames": self.frames,
+                "model_inputs": self.tiles,
+                "avg_inputs_per_frame": round(self.tiles / self.frames, 2) if self.frames else 0.0,
+            }
+
+
+# ─────────────────────────────────────────────
+# Heatmap overlay
+# ─────────────────────────────────────────────
+_HEAT_CELL = 8
+_WSSV_BGR = np.array((0, 0, 255), np.float32)
+_HEALTHY_BGR = np.array((0, 255, 0), np.float32)
+_heat_cache = {}
+_heat_lock = threading.Lock()
+
+
+def _heat_layer(tiles: dict, height: int, width: int):
+    """(y0, y1, x0, x1, alpha, premultiplied colour) for the decisive tiles, or None."""
+    gh, gw = max(1, height // _HEAT_CELL), max(1, width // _HEAT_CELL)
+    value = np.full((gh, gw), 0.5, np.float32)
+    strength = np.zeros((gh, gw), np.float32)
+    for (bx, by, bw, bh), score in zip(tiles["boxes"], tiles["scores"]):
+        x0, y0 = int(bx * gw), int(by * gh)
+        x1, y1 = max(x0 + 1, int(round((bx + bw) * gw))), max(y0 + 1, int(round((by + bh) * gh)))
+        dev = abs(score - 0.5)
+        # Overlapping tiles: keep whichever is further from "No Shrimp"
+        region = strength[y0:y1, x0:x1]
+        mask = dev > region
+        region[mask] = dev
+        value[y0:y1, x0:x1][mask] = score
+
+    # Fade in only past the "No Shrimp" band edge
+    band = 0.5 - HEALTHY_THRESHOLD
+    alpha = np.clip((strength - band) / (0.5 - band), 0.0, 1.0) * TILE_HEATMAP_ALPHA
+    if not alpha.any():
+        return None
+    # Premultiply on the coarse grid so upscaling blends colour and alpha together
+    colour = np.where(value[..., None] > 0.5, _WSSV_BGR, _HEALTHY_BGR) * alpha[..., None]
+    alpha = cv2.resize(alpha, (width, height), interpolation=cv2.INTER_LINEAR)
+    colour = cv2.resize(colour, (width, height), interpolation=cv2.INTER_LINEAR)
+    rows, cols = np.nonzero(alpha.max(axis=1))[0], np.nonzero(alpha.max(axis=0))[0]
+    y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    return y0, y1, x0, x1, 1.0 - alpha[y0:y1, x0:x1, None], colour[y0:y1, x0:x1]
+
+
+def draw_heatmap(frame: np.ndarray, tiles: dict, key=None):
+    """
+    Blends per-tile scores onto the frame in place: red where tiles read
+    WSSV, green where they read healthy. The layer is rebuilt only when the
+    result changes (results arrive far less often than stream frames).
+    """
+    if not TILE_HEATMAP or not tiles or not tiles.get("boxes"):
+        return
+    h, w = frame.shape[:2]
+    with _heat_lock:
+        cached = _heat_cache.get(key)
+    if cached is not None and cached[0] is tiles and cached[1] == (h, w):
+        layer = cached[2]
+    else:
+        layer = _heat_layer(tiles, h, w)
+        with _heat_lock:
+            # Holding `tiles` keeps its identity unique while it is cached
+            _heat_cache[key] = (tiles, (h, w), layer)
+    if layer is None:
+        return
+    y0, y1, x0, x1, keep, colour = layer
+    roi = frame[y0:y1, x0:x1]
+    roi[...] = (roi * keep + colour).astype(np.uint8)
@@ -29,9 +29,9 @@ const CameraLiveFeed = () => {
   useEffect(() => {
     fetchCameras();
     
-    // Poll for system status
-    const statusInterval = setInterval(fetchSystemStatus, 2000);
-    return () => clearInterval(statusInterval);
+    // Live system status pushed from the backend
+    fetchSystemStatus();
+    return api.subscribeEvents({ status: applySystemStatus });
   }, []);
 
   const fetchCameras = async () => {
@@ -56,16 +56,19 @@ const CameraLiveFeed = () => {
     }
   };
 
+  const applySystemStatus = (status) => {
+    setSystemStatus(status);
+
+    // Update camera status based on monitoring
+    setCameras(prev => prev.map(camera => ({
+      ...camera,
+      status: camera.id === selectedCamera && isPlaying ? 'online' : 'offline'
+    })));
+  };
+
   const fetchSystemStatus = async () => {
     try {
-      const status = await api.getStatus();
-      setSystemStatus(status);
-      
-      // Update camera status based on monitoring
-      setCameras(prev => prev.map(camera => ({
-        ...camera,
-        status: camera.id === selectedCamera && isPlaying ? 'online' : 'offline'
-      })));
+      applySystemStatus(await api.getStatus());
     } catch (err) {
       console.error('Error fetching system status:', err);
     }
@@ -22,25 +22,30 @@ const Dashboard = () => {
   const [loading, setLoading] = useState(true);
 
   useEffect(() => {
+    const fetchSnapshots = async () => {
+      // Only the latest few feed "Recent Activity"
+      const [wssvSnaps, healthySnaps] = await Promise.all([
+        api.getSnapshots('wssv', { limit: 3 }).catch(() => ({ items: [] })),
+        api.getSnapshots('healthy', { limit: 2 }).catch(() => ({ items: [] }))
+      ]);
+      setSnapshots({
+        wssv: wssvSnaps.items || [],
+        healthy: healthySnaps.items || []
+      });
+    };
+
     const fetchDashboardData = async () => {
       try {
-        setLoading(true);
-        
         // Fetch all data in parallel
-        const [sensorResponse, statusResponse, wssvSnaps, healthySnaps, camerasResponse] = await Promise.all([
+        const [sensorResponse, statusResponse, camerasResponse] = await Promise.all([
           api.getSensorLive().catch(() => null),
           api.getStatus().catch(() => null),
-          api.getSnapshots('wssv').catch(() => ({ items: [] })),
-          api.getSnapshots('healthy').catch(() => ({ items: [] })),
-          api.listCameras().catch(() => ({ cameras: [] }))
+          api.listCameras().catch(() => ({ cameras: [] })),
+          fetchSnapshots()
         ]);
 
         setSensorData(sensorResponse);
         setSystemStatus(statusResponse);
-        setSnapshots({
-          wssv: wssvSnaps.items || [],
-          healthy: healthySnaps.items || []
-        });
         setCameras(camerasResponse.cameras || []);
       } catch (error) {
         console.error('Error fetching dashboard data:', error);
@@ -50,10 +55,41 @@ const Dashboard = () => {
     };
 
     fetchDashboardData();
-    
-    // Set up polling for real-time data
-    const interval = setInterval(fetchDashboardData, 5000);
-    return () => clearInterval(interval);
+
+    // Sensor readings and results are pushed; polling only covers the
+    // time the event stream is down
+    let interval = null;
+    const startPolling = () => {
+      if (!interval) interval = setInterval(fetchDashboardData, 5000);
+    };
+    const stopPolling = () => {
+      clearInterval(interval);
+      interval = null;
+    };
+
+    const unsubscribe = api.subscribeEvents(
+      {
+        sensor: setSensorData,
+        status: (status) => {
+          setSystemStatus(status);
+          if (status.snapshot_saved) fetchSnapshots();
+        }
+      },
+      {
+        onOpen: () => {
+          if (!interval) return;
+          // Reconnected: catch up on anything missed while disconnected
+          stopPolling();
+          fetchDashboardData();
+        },
+        onError: startPolling
+      }
+    );
+
+    return () => {
+      unsubscribe();
+      stopPolling();
+    };
   }, []);
   const stats = [
     {
@@ -11,11 +11,17 @@ import {
 } from 'lucide-react';
 import api from '../services/api';
 
+const PAGE_SIZE = 100;
+
 const Reports = () => {
   const [selectedFilter, setSelectedFilter] = useState('all');
   const [searchTerm, setSearchTerm] = useState('');
   const [snapshots, setSnapshots] = useState({ wssv: [], healthy: [] });
+  // /snaps is paginated: next_before cursor per kind (null once exhausted) and stored totals
+  const [cursors, setCursors] = useState({ wssv: null, healthy: null });
+  const [counts, setCounts] = useState({ wssv: 0, healthy: 0 });
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
   const [selectedImage, setSelectedImage] = useState(null);
 
   useEffect(() => {
@@ -25,15 +31,24 @@ const Reports = () => {
   const fetchSnapshots = async () => {
     try {
       setLoading(true);
-      const [wssvResponse, healthyResponse] = await Promise.all([
-        api.getSnapshots('wssv'),
-        api.getSnapshots('healthy')
+      const [wssvResponse, healthyResponse, countsResponse] = await Promise.all([
+        api.getSnapshots('wssv', { limit: PAGE_SIZE }),
+        api.getSnapshots('healthy', { limit: PAGE_SIZE }),
+        api.getSnapshotCounts().catch(() => null)
       ]);
       
       setSnapshots({
         wssv: wssvResponse.items || [],
         healthy: healthyResponse.items || []
       });
+      setCursors({
+        wssv: wssvResponse.next_before || null,
+        healthy: healthyResponse.next_before || null
+      });
+      setCounts(countsResponse || {
+        wssv: (wssvResponse.items || []).length,
+        healthy: (healthyResponse.items || []).length
+      });
     } catch (error) {
       console.error('Error fetching snapshots:', error);
     } finally {
@@ -41,12 +56,45 @@ const Reports = () => {
     }
   };
 
+  // Next page of every kind shown by the current filter
+  const loadMore = async () => {
+    const kinds = (selectedFilter === 'all' ? ['wssv', 'healthy'] : [selectedFilter])
+      .filter(kind => cursors[kind]);
+    if (kinds.length === 0) return;
+    try {
+      setLoadingMore(true);
+      const pages = await Promise.all(
+        kinds.map(kind => api.getSnapshots(kind, { limit: PAGE_SIZE, before: cursors[kind] }))
+      );
+      setSnapshots(prev => {
+        const next = { ...prev };
+        kinds.forEach((kind, i) => { next[kind] = [...prev[kind], ...(pages[i].items || [])]; });
+        return next;
+      });
+      setCursors(prev => {
+        const next = { ...prev };
+        kinds.forEach((kind, i) => { next[kind] = pages[i].next_before || null; });
+        return next;
+      });
+    } catch (error) {
+      console.error('Error loading more snapshots:', error);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
+
+  const hasMore = selectedFilter === 'all'
+    ? Boolean(cursors.wssv || cursors.healthy)
+    : Boolean(cursors[selectedFilter]);
+
   const handleDeleteSnapshot = async (kind, id) => {
     if (!confirm(`Are you sure you want to delete this ${kind} snapshot?`)) return;
     
     try {
       await api.deleteSnapshot(kind, id);
-      await fetchSnapshots(); // Refresh data
+      // Drop it locally so the pages already loaded stay in place
+      setSnapshots(prev => ({ ...prev, [kind]: prev[kind].filter(snap => snap.id !== id) }));
+      setCounts(prev => ({ ...prev, [kind]: Math.max(0, prev[kind] - 1) }));
     } catch (error) {
       console.error('Error deleting snapshot:', error);
       alert('Failed to delete snapshot');
@@ -124,7 +172,7 @@ const Reports = () => {
                     : 'bg-gray-100 text-gray-700 hover:bg-gray-200'
                 }`}
               >
-                All ({snapshots.wssv.length + snapshots.healthy.length})
+                All ({counts.wssv + counts.healthy})
               </button>
               <button
                 onClick={() => setSelectedFilter('wssv')}
@@ -134,7 +182,7 @@ const Reports = () => {
                     : 'bg-gray-100 text-gray-700 hover:bg-gray-200'
                 }`}
               >
-                WSSV ({snapshots.wssv.length})
+                WSSV ({counts.wssv})
               </button>
               <button
                 onClick={() => setSelectedFilter('healthy')}
@@ -144,7 +192,7 @@ const Reports = () => {
                     : 'bg-gray-100 text-gray-700 hover:bg-gray-200'
                 }`}
               >
-                Healthy ({snapshots.healthy.length})
+                Healthy ({counts.healthy})
               </button>
             </div>
           </div>
@@ -209,8 +257,9 @@ const Reports = () => {
                     </td>
                     <td className="px-6 py-4 whitespace-nowrap">
                       <img
-                        src={api.getSnapshotImageUrl(snapshot.type === 'WSSV Detection' ? 'wssv' : 'healthy', snapshot.id)}
+                        src={api.getSnapshotImageUrl(snapshot.type === 'WSSV Detection' ? 'wssv' : 'healthy', snapshot.id, 'thumb')}
                         alt={snapshot.label}
+                        loading="lazy"
                         className="h-16 w-24 object-cover rounded cursor-pointer hover:opacity-75 transition-opacity"
                         onClick={() => setSelectedImage(snapshot)}
                       />
@@ -267,6 +316,17 @@ const Reports = () => {
                 ))}
               </tbody>
             </table>
+            {hasMore && (
+              <div className="flex justify-center py-4 border-t border-gray-200">
+                <button
+                  onClick={loadMore}
+                  disabled={loadingMore}
+                  className="px-4 py-2 rounded-lg text-sm font-medium bg-gray-100 text-gray-700 hover:bg-gray-200 disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load more'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
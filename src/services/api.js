@@ -36,19 +36,41 @@ class CrustaScopeAPI {
     });
   }
 
-  async stopMonitoring() {
+  // Without a cameraIndex every running camera is stopped.
+  async stopMonitoring(cameraIndex) {
     return this.apiCall('/stop', {
       method: 'POST',
+      ...(cameraIndex !== undefined && { body: JSON.stringify({ camera_index: cameraIndex }) }),
     });
   }
 
-  async getStatus() {
-    return this.apiCall('/status');
+  async getStatus(cameraIndex) {
+    return this.apiCall(cameraIndex !== undefined ? `/status/${cameraIndex}` : '/status');
   }
 
-  // Get video feed URL
-  getVideoFeedUrl() {
-    return `${API_BASE_URL}/video_feed`;
+  // Server-push updates. handlers: { status: fn(data), sensor: fn(data) }.
+  // Returns a function that closes the stream.
+  // onOpen / onError fire as the stream connects and drops (EventSource retries by itself)
+  subscribeEvents(handlers, { interval, onOpen, onError } = {}) {
+    const params = new URLSearchParams({ topics: Object.keys(handlers).join(',') });
+    if (interval) params.set('interval', interval);
+    const source = new EventSource(`${API_BASE_URL}/events?${params.toString()}`);
+    Object.entries(handlers).forEach(([topic, handler]) => {
+      source.addEventListener(topic, (event) => handler(JSON.parse(event.data)));
+    });
+    if (onOpen) source.addEventListener('open', onOpen);
+    if (onError) source.addEventListener('error', onError);
+    return () => source.close();
+  }
+
+  // Get video feed URL (optional per-viewer fps / JPEG quality)
+  getVideoFeedUrl({ camera, fps, quality } = {}) {
+    const params = new URLSearchParams();
+    if (fps) params.set('fps', fps);
+    if (quality) params.set('quality', quality);
+    const query = params.toString();
+    const path = camera !== undefined ? `/video_feed/${camera}` : '/video_feed';
+    return `${API_BASE_URL}${path}${query ? `?${query}` : ''}`;
   }
 
   // Sensor data
@@ -56,9 +78,32 @@ class CrustaScopeAPI {
     return this.apiCall('/sensor_live');
   }
 
+  // Aggregated min/mean/max per bucket; bucket like '5m' or '1h' (auto if omitted)
+  async getSensorHistory({ from, to, bucket } = {}) {
+    const params = new URLSearchParams();
+    if (from) params.set('from', from);
+    if (to) params.set('to', to);
+    if (bucket) params.set('bucket', bucket);
+    const query = params.toString();
+    return this.apiCall(`/sensor_history${query ? `?${query}` : ''}`);
+  }
+
   // Snapshots/Gallery
-  async getSnapshots(kind = 'wssv') {
-    return this.apiCall(`/snaps?kind=${kind}`);
+  // Paginated: pass the previous response's next_before to get the next page
+  async getSnapshots(kind = 'wssv', { limit, before, minConf, maxConf, from, to } = {}) {
+    const params = new URLSearchParams({ kind });
+    if (limit) params.set('limit', limit);
+    if (before) params.set('before', before);
+    if (minConf != null) params.set('min_conf', minConf);
+    if (maxConf != null) params.set('max_conf', maxConf);
+    if (from) params.set('from', from);
+    if (to) params.set('to', to);
+    return this.apiCall(`/snaps?${params.toString()}`);
+  }
+
+  // Total snapshots per kind: { wssv, healthy }
+  async getSnapshotCounts() {
+    return this.apiCall('/snaps/count');
   }
 
   async deleteSnapshot(kind, snapId) {
@@ -67,14 +112,23 @@ class CrustaScopeAPI {
     });
   }
 
-  getSnapshotImageUrl(kind, snapId) {
-    return `${API_BASE_URL}/snap_image/${kind}/${snapId}`;
+  // size: 'thumb' for gallery grids, 'full' for the full-resolution image
+  getSnapshotImageUrl(kind, snapId, size = 'full') {
+    return `${API_BASE_URL}/snap_image/${kind}/${snapId}?size=${size}`;
   }
 
   getDownloadUrl(kind, snapId, format = 'jpg') {
     return `${API_BASE_URL}/download/${kind}/${snapId}?fmt=${format}`;
   }
 
+  // ZIP of many snapshots (kind: 'wssv' | 'healthy' | 'all'), optional ISO time range
+  getExportUrl(kind = 'all', { from, to } = {}) {
+    const params = new URLSearchParams({ kind });
+    if (from) params.set('from', from);
+    if (to) params.set('to', to);
+    return `${API_BASE_URL}/export?${params.toString()}`;
+  }
+
   // Upload test
   async uploadTest(file) {
     const formData = new FormData();